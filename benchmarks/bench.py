@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+"""
+Offline benchmarks for python-bugzilla's hot paths.
+
+Everything runs against payloads generated from the deterministic
+dataset in tests/fakebugzilla.py, and a FakeBugzillaServer running in a
+subprocess, so the memory measurements only cover the client side.
+
+Example usage from a git checkout:
+
+    # Run, print, and write the results as JSON
+    python3 -m benchmarks.bench --output results.json
+
+    # Compare against the stored baseline, exit 1 on regressions
+    python3 -m benchmarks.bench --baseline benchmarks/baseline.json
+
+    # Refresh the stored baseline
+    python3 -m benchmarks.bench --save-baseline benchmarks/baseline.json
+
+Timings are the best of --repeat runs. Memory is the peak traced by
+tracemalloc over a separate run.
+
+Absolute timings only mean something on the machine they were taken
+on. So every run also times a fixed calibration workload, and each
+result records its time relative to that as 'relative'. Baselines are
+compared on 'relative' and 'peak_bytes', which carry over between
+machines much better than 'seconds'.
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import xmlrpc.client
+
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if TOPDIR not in sys.path:
+    sys.path.insert(0, TOPDIR)
+
+# pylint: disable=wrong-import-position,protected-access
+import bugzilla
+from bugzilla import _cli
+from bugzilla.bug import Bug
+
+import tests.mockbackend
+from tests.fakebugzilla import FakeBugzillaData, FakeBugzillaServer
+
+
+DEFAULT_SIZES = [1000, 10000]
+ATTACHMENT_SIZE = 8 * 1024 * 1024
+
+
+###################
+# Result handling #
+###################
+
+def _calibration_workload():
+    # Pure python work similar to what the library does: building
+    # dicts, and JSON encoding and decoding them
+    data = [{"id": i, "summary": "Calibration bug %d" % i,
+             "cc": ["user%d@example.com" % j for j in range(3)]}
+            for i in range(2000)]
+    for dummy in range(5):
+        json.loads(json.dumps(data))
+
+
+class _Results(object):
+    def __init__(self, repeat, name_filter):
+        self.repeat = repeat
+        self.name_filter = name_filter
+        self.results = {}
+        self.calibration = self._best_time(_calibration_workload)
+
+    def _best_time(self, func, *args, **kwargs):
+        best = None
+        for dummy in range(max(self.repeat, 3)):
+            gc.collect()
+            start = time.perf_counter()
+            func(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def wanted(self, name):
+        return not self.name_filter or self.name_filter in name
+
+    def measure(self, name, func, *args, count=None, memory=True,
+                **kwargs):
+        """
+        Time func(*args, **kwargs) and optionally trace its peak memory.
+
+        :param count: Number of items func() handles, to report items
+            per second
+        """
+        if not self.wanted(name):
+            return
+
+        best = None
+        for dummy in range(self.repeat):
+            gc.collect()
+            start = time.perf_counter()
+            func(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        ret = {"seconds": round(best, 6),
+               "relative": round(best / self.calibration, 4)}
+        if count:
+            ret["per_second"] = round(count / best, 1)
+        if memory:
+            gc.collect()
+            tracemalloc.start()
+            try:
+                func(*args, **kwargs)
+                ret["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        self.results[name] = ret
+        print("%-40s %10.4fs %s" % (name, best,
+              "peak=%.1fMiB" % (ret["peak_bytes"] / 1048576.0)
+              if "peak_bytes" in ret else ""))
+        sys.stdout.flush()
+
+
+def _compare(results, baseline, tolerance, min_seconds, calibration):
+    """
+    Compare results against baseline results. Timings are compared
+    relative to the calibration workload, not as absolute seconds.
+
+    :param calibration: Seconds the calibration workload took in this
+        run, to turn relative differences back into seconds for the
+        min_seconds check
+    :returns: List of regression description strings
+    """
+    regressions = []
+    for name, new in sorted(results.items()):
+        old = baseline.get(name)
+        if not old:
+            continue
+        for metric in ["relative", "peak_bytes"]:
+            if metric not in new or not old.get(metric):
+                continue
+            ratio = new[metric] / float(old[metric])
+            if ratio <= 1 + tolerance:
+                continue
+            if (metric == "relative" and
+                (new[metric] - old[metric]) * calibration < min_seconds):
+                continue
+            regressions.append("%s %s: %s -> %s (%+.0f%%)" % (
+                name, metric, old[metric], new[metric], (ratio - 1) * 100))
+    return regressions
+
+
+##################
+# Server helpers #
+##################
+
+def _serve(queue, kwargs):
+    server = FakeBugzillaServer(**kwargs).start()
+    queue.put(server.url)
+    queue.get()
+    server.stop()
+
+
+@contextlib.contextmanager
+def _server_process(**kwargs):
+    """
+    Run a FakeBugzillaServer in a child process, yielding its base URL
+    """
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_serve, args=(queue, kwargs))
+    proc.start()
+    try:
+        url = queue.get(timeout=120)
+        yield url
+    finally:
+        queue.put(None)
+        proc.join(10)
+        if proc.is_alive():  # pragma: no cover
+            proc.terminate()
+
+
+def _make_bz(url, api):
+    if api == "rest":
+        return bugzilla.Bugzilla(url + "/rest/", use_creds=False)
+    return bugzilla.Bugzilla(url + "/xmlrpc.cgi", use_creds=False)
+
+
+##############
+# Benchmarks #
+##############
+
+def bench_fetch(res, sizes):
+    """
+    getbugs() and query() throughput against the fake server
+    """
+    for size in sizes:
+        names = ["%s.%s.%s" % (op, api, size)
+                 for op in ["getbugs", "query"] for api in ["rest", "xmlrpc"]]
+        if not [n for n in names if res.wanted(n)]:
+            continue
+
+        with _server_process(num_bugs=size, comments_per_bug=0,
+                             attachments_per_bug=0) as url:
+            for api in ["rest", "xmlrpc"]:
+                bz = _make_bz(url, api)
+                ids = list(range(1, size + 1))
+                query = bz.build_query(
+                    product=["Product1", "Product2", "Product3"])
+                res.measure("getbugs.%s.%s" % (api, size),
+                            bz.getbugs, ids, count=size)
+                res.measure("query.%s.%s" % (api, size),
+                            bz.query, query, count=size)
+
+
+def _construct_bugs(bz, rawbugs):
+    return [Bug(bz, dict=raw) for raw in rawbugs]
+
+
+def _access_bugs(bugs):
+    for bug in bugs:
+        dummy = (bug.summary, bug.status, bug.assigned_to,
+                 bug.component, bug.bug_id, bug.cc)
+
+
+def _render_bugs(plan, bugs):
+    for bug in bugs:
+        _cli._render_bug(plan, bug)
+
+
+def _render_json(bugs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        _cli._format_output_json(bugs)
+
+
+def bench_bug_objects(res, sizes):
+    """
+    Bug construction and attribute access, no network involved
+    """
+    bz = tests.mockbackend.make_bz()
+    for size in sizes:
+        data = FakeBugzillaData(num_bugs=size, comments_per_bug=0,
+                                attachments_per_bug=0)
+        rawbugs = list(data.bugs.values())
+        res.measure("bug.construct.%s" % size, _construct_bugs,
+                    bz, rawbugs, count=size)
+        res.measure("bug.attrs.%s" % size, _access_bugs,
+                    _construct_bugs(bz, rawbugs), count=size, memory=False)
+
+
+def bench_decode(res, sizes):
+    """
+    Decoding cost of the same search result in REST JSON and XMLRPC
+    """
+    for size in sizes:
+        if not [n for n in ["decode.rest.%s" % size,
+                            "decode.xmlrpc.%s" % size] if res.wanted(n)]:
+            continue
+        data = FakeBugzillaData(num_bugs=size, comments_per_bug=0,
+                                attachments_per_bug=0)
+        payload = data.bug_search({})
+        restbody = json.dumps(payload)
+        xmlbody = xmlrpc.client.dumps((payload,), methodresponse=True,
+                                      allow_none=True).encode("utf-8")
+
+        res.measure("decode.rest.%s" % size,
+                    json.loads, restbody, count=size)
+        res.measure("decode.xmlrpc.%s" % size,
+                    xmlrpc.client.loads, xmlbody, count=size)
+
+
+def bench_render(res, sizes):
+    """
+    CLI output rendering for the normal, oneline and json formats
+    """
+    bz = tests.mockbackend.make_bz()
+    for size in sizes:
+        data = FakeBugzillaData(num_bugs=size, comments_per_bug=0,
+                                attachments_per_bug=0)
+        bugs = _construct_bugs(bz, data.bugs.values())
+
+        for output in ["normal", "oneline"]:
+            plan = _cli._compile_outputformat(
+                bz, _cli._convert_to_outputformat(output),
+                cvecache={})
+            res.measure("render.%s.%s" % (output, size), _render_bugs,
+                        plan, bugs, count=size)
+        res.measure("render.json.%s" % size, _render_json, bugs, count=size)
+
+
+class _NoLogger(object):
+    """
+    Stand in for a module logger that does nothing at all, as the zero
+    overhead reference for the logging benchmarks
+    """
+    # pylint: disable=invalid-name,unused-argument
+    def isEnabledFor(self, level):
+        return False
+
+    def debug(self, *args, **kwargs):
+        pass
+
+    info = debug
+
+
+@contextlib.contextmanager
+def _log_setup(mode):
+    logger = logging.getLogger("bugzilla")
+    origlevel = logger.level
+    origpropagate = logger.propagate
+    origlogs = [(mod, mod.log) for mod in [bugzilla.base, bugzilla.bug]]
+    handler = logging.StreamHandler(io.StringIO())
+    try:
+        if mode == "nolog":
+            for mod, dummy in origlogs:
+                mod.log = _NoLogger()
+        elif mode == "debug":
+            logger.setLevel(logging.DEBUG)
+            logger.propagate = False
+            logger.addHandler(handler)
+        else:
+            logger.setLevel(logging.WARNING)
+        yield
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(origlevel)
+        logger.propagate = origpropagate
+        for mod, log in origlogs:
+            mod.log = log
+
+
+def bench_logging(res, sizes):
+    """
+    query() cost with debug logging off, compared to no logging code
+    at all, and to debug logging on. The first two should match
+    """
+    bz = tests.mockbackend.make_bz()
+    for size in sizes:
+        data = FakeBugzillaData(num_bugs=size, comments_per_bug=0,
+                                attachments_per_bug=0)
+        result = data.bug_search({})
+        # query_return_extra() consumes the dict it gets
+        bz._backend.bug_search = lambda query, _result=result: dict(_result)
+        for mode in ["off", "nolog", "debug"]:
+            with _log_setup(mode):
+                res.measure("logging.query.%s.%s" % (mode, size),
+                            bz.query, {}, count=size)
+
+
+def bench_attachments(res):
+    """
+    Attachment upload and download, mostly to watch peak memory
+    """
+    names = ["attach.%s.%s" % (op, api)
+             for op in ["download", "upload"] for api in ["rest", "xmlrpc"]]
+    if not [n for n in names if res.wanted(n)]:
+        return
+
+    tmpdir = tempfile.mkdtemp(prefix="bugzilla-bench.")
+    srcpath = os.path.join(tmpdir, "upload.bin")
+    dstpath = os.path.join(tmpdir, "download.bin")
+    with open(srcpath, "wb") as fobj:
+        fobj.write(os.urandom(ATTACHMENT_SIZE))
+
+    try:
+        with _server_process(num_bugs=1, comments_per_bug=0,
+                             attachment_size=ATTACHMENT_SIZE) as url:
+            for api in ["rest", "xmlrpc"]:
+                bz = _make_bz(url, api)
+                res.measure("attach.download.%s" % api,
+                            bz.download_attachment, 1, dstpath)
+                # Every run adds a new attachment to the fake server
+                res.measure("attach.upload.%s" % api,
+                            bz.attachfile, 1, srcpath, "bench")
+    finally:
+        for path in [srcpath, dstpath]:
+            if os.path.exists(path):
+                os.unlink(path)
+        os.rmdir(tmpdir)
+
+
+def bench_startup(res):
+    """
+    Wall time of importing the library, and of a trivial CLI run
+    """
+    cmds = {
+        "startup.import": [sys.executable, "-c", "import bugzilla"],
+        "startup.cli": [sys.executable,
+                        os.path.join(TOPDIR, "bugzilla-cli"), "--version"],
+    }
+    env = os.environ.copy()
+    env["PYTHONPATH"] = TOPDIR
+    for name, cmd in cmds.items():
+        res.measure(name, subprocess.check_call, cmd, env=env,
+                    stdout=subprocess.DEVNULL, memory=False)
+
+
+##############
+# Main entry #
+##############
+
+def _parse_args(args):
+    parser = argparse.ArgumentParser(
+        description="Run python-bugzilla benchmarks offline")
+    parser.add_argument("--sizes",
+        default=",".join(str(s) for s in DEFAULT_SIZES),
+        help="Comma separated bug counts to benchmark. Default: %(default)s."
+             " 100000 is supported but slow.")
+    parser.add_argument("--repeat", type=int, default=3,
+        help="Number of timed runs per benchmark, the best is reported")
+    parser.add_argument("--filter",
+        help="Only run benchmarks whose name contains this string")
+    parser.add_argument("--output", help="Write the JSON results here")
+    parser.add_argument("--baseline",
+        help="Compare results against this JSON file, and exit 1 "
+             "on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+        help="Allowed slowdown or memory growth over the baseline, "
+             "as a fraction. Default: %(default)s")
+    parser.add_argument("--min-seconds", type=float, default=0.005,
+        help="Ignore timing regressions smaller than this many seconds")
+    parser.add_argument("--save-baseline",
+        help="Write the results to this baseline file")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    opt = _parse_args(args)
+    sizes = [int(s) for s in opt.sizes.split(",") if s]
+    res = _Results(opt.repeat, opt.filter)
+
+    bench_startup(res)
+    bench_decode(res, sizes)
+    bench_bug_objects(res, sizes)
+    bench_render(res, sizes)
+    bench_logging(res, sizes)
+    bench_fetch(res, sizes)
+    bench_attachments(res)
+
+    output = {
+        "metadata": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "bugzilla": bugzilla.__version__,
+            "sizes": sizes,
+            "repeat": opt.repeat,
+            "calibration_seconds": round(res.calibration, 6),
+        },
+        "results": res.results,
+    }
+    for path in [opt.output, opt.save_baseline]:
+        if path:
+            with open(path, "w") as fobj:
+                json.dump(output, fobj, indent=2, sort_keys=True)
+                fobj.write("\n")
+
+    if not opt.baseline:
+        return 0
+    with open(opt.baseline) as fobj:
+        baseline = json.load(fobj)["results"]
+    regressions = _compare(res.results, baseline,
+                           opt.tolerance, opt.min_seconds, res.calibration)
+    for line in regressions:
+        print("REGRESSION: %s" % line)
+    if regressions:
+        return 1
+    print("No regressions against %s" % opt.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
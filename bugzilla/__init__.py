@@ -6,12 +6,17 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+from typing import TYPE_CHECKING
+
 from .apiversion import version, __version__
-from .base import Bugzilla
-from .exceptions import BugzillaError
-from .oldclasses import (Bugzilla3, Bugzilla32, Bugzilla34, Bugzilla36,
-        Bugzilla4, Bugzilla42, Bugzilla44,
-        NovellBugzilla, RHBugzilla, RHBugzilla3, RHBugzilla4)
+
+if TYPE_CHECKING:  # pragma: no cover
+    # Let static analysis tools see the lazily imported names
+    from .base import Bugzilla
+    from .exceptions import BugzillaError
+    from .oldclasses import (Bugzilla3, Bugzilla32, Bugzilla34, Bugzilla36,
+            Bugzilla4, Bugzilla42, Bugzilla44,
+            NovellBugzilla, RHBugzilla, RHBugzilla3, RHBugzilla4)
 
 
 # This is the public API. If you are explicitly instantiating any other
@@ -26,10 +31,37 @@ __all__ = [
     'Bugzilla', "version",
 ]
 
+# Everything except the version is imported on first access, so
+# 'import bugzilla' stays cheap. Maps public name -> submodule
+_LAZY_ATTRS = {
+    "Bugzilla": ".base",
+    "BugzillaError": ".exceptions",
+}
+for __sym in ["Bugzilla3", "Bugzilla32", "Bugzilla34", "Bugzilla36",
+              "Bugzilla4", "Bugzilla42", "Bugzilla44",
+              "NovellBugzilla", "RHBugzilla", "RHBugzilla3", "RHBugzilla4"]:
+    _LAZY_ATTRS[__sym] = ".oldclasses"
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRS:
+        raise AttributeError(
+            "module %r has no attribute %r" % (__name__, name))
+    import importlib
+    module = importlib.import_module(_LAZY_ATTRS[name], __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(list(globals()) + __all__))
+
 
 # Clear all other locals() from the public API
 for __sym in locals().copy():
-    if __sym.startswith("__") or __sym in __all__:
+    if (__sym.startswith("__") or __sym in __all__ or
+        __sym == "_LAZY_ATTRS"):
         continue
     locals().pop(__sym)
 locals().pop("__sym")
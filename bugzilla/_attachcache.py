@@ -0,0 +1,217 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import hashlib
+import io
+import json
+from logging import getLogger
+import os
+import tempfile
+import threading
+
+from ._authfiles import _default_cache_location, _parse_hostname
+
+log = getLogger(__name__)
+
+
+# Default size cap of the cache directory, in bytes
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+
+def _default_attachment_cache_path():
+    return _default_cache_location("attachments")
+
+
+class _CachedAttachmentFile(io.BufferedReader):
+    """
+    Read only file object for a cached attachment. Like the BytesIO
+    returned by openattachment_data(), .name is the attachment file name.
+    The on disk location is in .path
+    """
+    name = None
+
+    def __init__(self, path, name):
+        io.BufferedReader.__init__(self, io.FileIO(path, "rb"))
+        self.path = path
+        self.name = name
+
+
+class _HashingWriter(object):
+    """
+    Write through wrapper that hashes the content as it goes. With
+    fileobj=None the content is only hashed
+    """
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        self._hash.update(data)
+        if self._fileobj is None:
+            return len(data)
+        return self._fileobj.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+class _AttachmentCache(object):
+    """
+    On disk, content addressed attachment cache.
+
+    Content is stored once under blobs/XX/<sha256>. Per server index
+    entries at index/<host>/<attachment id>.json map an attachment to
+    its blob, along with the size and last_change_time it had when it
+    was fetched; the entry is only used while those still match.
+    Entries may also only record the hash of content that was never
+    stored, see store_hash().
+    Reading a blob bumps its mtime, and the least recently used blobs
+    are removed once the total size goes over max_size.
+    """
+    def __init__(self, path, max_size=None):
+        self._path = os.path.expanduser(path)
+        self._max_size = max_size or DEFAULT_MAX_SIZE
+        self._lock = threading.Lock()
+
+    def _blob_path(self, digest):
+        return os.path.join(self._path, "blobs", digest[:2], digest)
+
+    def _index_path(self, url, attachid):
+        hostname = _parse_hostname(url).strip("/").replace("/", "_")
+        return os.path.join(self._path, "index",
+                            hostname, "%s.json" % attachid)
+
+    @staticmethod
+    def _matches(entry, attdata):
+        return (entry.get("size") == attdata.get("size") and
+                entry.get("last_change_time") ==
+                str(attdata.get("last_change_time")))
+
+    def _write_atomic(self, path, data):
+        os.makedirs(os.path.dirname(path), 0o700, exist_ok=True)
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path),
+                                       prefix=".tmp")
+        with os.fdopen(fd, "w") as fobj:
+            fobj.write(data)
+        os.replace(tmppath, path)
+
+    def _read_entry(self, url, attdata):
+        indexpath = self._index_path(url, attdata["id"])
+        try:
+            with open(indexpath, "r") as fobj:
+                entry = json.load(fobj)
+        except (OSError, ValueError):
+            return None
+        if not self._matches(entry, attdata):
+            log.debug("Attachment cache entry %s is stale", indexpath)
+            return None
+        return entry
+
+    def _write_entry(self, url, attdata, digest):
+        entry = {
+            "sha256": digest,
+            "size": attdata.get("size"),
+            "last_change_time": str(attdata.get("last_change_time")),
+        }
+        self._write_atomic(self._index_path(url, attdata["id"]),
+                           json.dumps(entry))
+
+    def lookup_hash(self, url, attdata):
+        """
+        Return the known sha256 of the attachment described by attdata,
+        or None
+        """
+        entry = self._read_entry(url, attdata)
+        return entry and entry["sha256"] or None
+
+    def store_hash(self, url, attdata, download_cb):
+        """
+        Compute the sha256 of the attachment described by attdata by
+        passing download_cb a write-only sink, and record it in the
+        index. The content itself isn't stored.
+        """
+        writer = _HashingWriter(None)
+        download_cb(writer)
+        digest = writer.hexdigest()
+        self._write_entry(url, attdata, digest)
+        return digest
+
+    def lookup(self, url, attdata):
+        """
+        Return a _CachedAttachmentFile for the attachment metadata dict
+        attdata, or None if it isn't cached or is out of date
+        """
+        entry = self._read_entry(url, attdata)
+        if not entry:
+            return None
+
+        blobpath = self._blob_path(entry["sha256"])
+        try:
+            ret = _CachedAttachmentFile(blobpath, attdata.get("file_name"))
+            os.utime(blobpath)
+        except OSError:
+            # Evicted since the index entry was written
+            return None
+        log.debug("Attachment %s found in cache at %s",
+                  attdata["id"], blobpath)
+        return ret
+
+    def store(self, url, attdata, download_cb):
+        """
+        Fetch the attachment described by attdata into the cache.
+        download_cb(fileobj) writes the content to fileobj.
+
+        :returns: a _CachedAttachmentFile for the new entry
+        """
+        tmpdir = os.path.join(self._path, "blobs")
+        os.makedirs(tmpdir, 0o700, exist_ok=True)
+        fd, tmppath = tempfile.mkstemp(dir=tmpdir, prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fobj:
+                writer = _HashingWriter(fobj)
+                download_cb(writer)
+            digest = writer.hexdigest()
+            blobpath = self._blob_path(digest)
+            os.makedirs(os.path.dirname(blobpath), 0o700, exist_ok=True)
+            os.replace(tmppath, blobpath)
+        except BaseException:
+            if os.path.exists(tmppath):
+                os.unlink(tmppath)
+            raise
+
+        self._write_entry(url, attdata, digest)
+        ret = _CachedAttachmentFile(blobpath, attdata.get("file_name"))
+        self.prune()
+        return ret
+
+    def prune(self):
+        """
+        Remove the least recently used blobs until the cache fits in
+        max_size. Index entries pointing at removed blobs are ignored
+        by lookup()
+        """
+        with self._lock:
+            blobs = []
+            total = 0
+            for dirpath, dummy, files in os.walk(
+                    os.path.join(self._path, "blobs")):
+                for filename in files:
+                    if filename.startswith(".tmp"):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        st = os.stat(path)
+                    except OSError:  # pragma: no cover
+                        continue
+                    blobs.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+
+            blobs.sort()
+            while blobs and total > self._max_size:
+                dummy, size, path = blobs.pop(0)
+                log.debug("Evicting %s from attachment cache", path)
+                try:
+                    os.unlink(path)
+                except OSError:  # pragma: no cover
+                    continue
+                total -= size
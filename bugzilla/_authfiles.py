@@ -4,6 +4,7 @@
 import configparser
 import os
 from logging import getLogger
+import threading
 import urllib.parse
 
 from ._util import listify
@@ -129,7 +130,8 @@ class _BugzillaRCFile(object):
 
 class _BugzillaTokenCache(object):
     """
-    Class for interacting with a .bugzillatoken cache file
+    Class for interacting with a .bugzillatoken cache file.
+    This is safe to share between threads.
     """
     @staticmethod
     def get_default_path():
@@ -138,6 +140,7 @@ class _BugzillaTokenCache(object):
     def __init__(self):
         self._filename = None
         self._cfg = None
+        self._lock = threading.RLock()
 
     def _get_domain(self, url):
         domain = urllib.parse.urlparse(url)[1]
@@ -146,26 +149,28 @@ class _BugzillaTokenCache(object):
         return domain
 
     def get_value(self, url):
-        domain = self._get_domain(url)
-        if domain and self._cfg.has_option(domain, 'token'):
-            return self._cfg.get(domain, 'token')
-        return None
+        with self._lock:
+            domain = self._get_domain(url)
+            if domain and self._cfg.has_option(domain, 'token'):
+                return self._cfg.get(domain, 'token')
+            return None
 
     def set_value(self, url, value):
-        if self.get_value(url) == value:
-            return
-
-        domain = self._get_domain(url)
-        if value is None:
-            self._cfg.remove_option(domain, 'token')
-        else:
-            self._cfg.set(domain, 'token', value)
-
-        if self._filename:
-            _makedirs(self._filename)
-            with open(self._filename, 'w') as _cfg:
-                log.debug("Saving to _cfg")
-                self._cfg.write(_cfg)
+        with self._lock:
+            if self.get_value(url) == value:
+                return
+
+            domain = self._get_domain(url)
+            if value is None:
+                self._cfg.remove_option(domain, 'token')
+            else:
+                self._cfg.set(domain, 'token', value)
+
+            if self._filename:
+                _makedirs(self._filename)
+                with open(self._filename, 'w') as _cfg:
+                    log.debug("Saving to _cfg")
+                    self._cfg.write(_cfg)
 
     def get_filename(self):
         return self._filename
@@ -175,5 +180,6 @@ class _BugzillaTokenCache(object):
         cfg = configparser.ConfigParser()
         if filename:
             cfg.read(filename)
-        self._filename = filename
-        self._cfg = cfg
+        with self._lock:
+            self._filename = filename
+            self._cfg = cfg
@@ -25,7 +25,7 @@ class _BackendBase(object):
             requests.head(url, timeout=10).raise_for_status()
             return True  # pragma: no cover
         except Exception as e:
-            log.debug("Failed to probe url=%s : %s", url, str(e))
+            log.debug("Failed to probe url=%s : %s", url, e)
         return False
 
 
@@ -51,6 +51,12 @@ class _BackendBase(object):
         """
         return False
 
+    def is_hybrid(self):
+        """
+        :returns: True if this is the hybrid REST+XMLRPC backend
+        """
+        return False
+
 
     ######################
     # Bugzilla info APIs #
@@ -82,6 +88,14 @@ class _BackendBase(object):
         """
         raise NotImplementedError()
 
+    def bug_attachment_download(self, attachment_id, fileobj):
+        """
+        Fetch the content of a single attachment, decoding it into the
+        binary fileobj as the response is read. Returns the number of
+        bytes written.
+        """
+        raise NotImplementedError()
+
     def bug_attachment_create(self, bug_ids, data, paramdict):
         """
         Create a bug attachment
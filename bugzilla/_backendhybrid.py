@@ -0,0 +1,248 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+from logging import getLogger
+import time
+import urllib.parse
+
+from ._backendbase import _BackendBase
+from ._backendrest import _BackendREST
+from ._backendxmlrpc import _BackendXMLRPC
+from ._util import listify
+
+
+log = getLogger(__name__)
+
+
+def _rest_url_from_xmlrpc_url(url):
+    """
+    Turn https://example.com/xmlrpc.cgi into https://example.com/rest/
+    """
+    parsed = urllib.parse.urlparse(url)
+    path = parsed.path
+    if path.endswith("xmlrpc.cgi"):
+        path = path[:-len("xmlrpc.cgi")]
+    if not path.endswith("/"):
+        path += "/"
+    if not path.endswith("/rest/"):
+        path += "rest/"
+    return urllib.parse.urlunparse(parsed._replace(path=path))
+
+
+def _xmlrpc_url_from_rest_url(url):
+    """
+    Turn https://example.com/rest/ into https://example.com/xmlrpc.cgi
+    """
+    parsed = urllib.parse.urlparse(url)
+    path = parsed.path
+    if path.endswith("xmlrpc.cgi"):
+        return url
+    path = path.rstrip("/")
+    if path.endswith("/rest") or path == "rest":
+        path = path[:-len("rest")]
+    if not path.endswith("/"):
+        path += "/"
+    path += "xmlrpc.cgi"
+    return urllib.parse.urlunparse(parsed._replace(path=path))
+
+
+class _BackendHybrid(_BackendBase):
+    """
+    Internal interface that talks to both the REST and XMLRPC APIs over
+    a single shared _BugzillaSession, routing each call to the API that
+    is cheapest for it:
+
+    * Calls that REST can only do one ID at a time (comments, history,
+      attachments) go to XMLRPC when multiple IDs are passed, since
+      that is a single request instead of N.
+    * Calls REST doesn't support at all (update_tags, ExternalBugs)
+      always go to XMLRPC.
+    * Everything else goes to the API preferred for its operation
+      class, see _OPERATION_CLASSES. That is REST by default, since JSON
+      is cheaper to decode than XML, but calibrate() can measure both
+      APIs against the server and switch it per class.
+
+    The url can be either the XMLRPC or the REST endpoint, the other
+    one is derived from it.
+    """
+    # Operation classes that calibrate() times and routes separately.
+    # 'metadata' covers the small version/field/product/group/user/
+    # component calls where round trip latency dominates, 'bug' covers
+    # bug fetching, searching and editing where payload decode cost
+    # dominates.
+    _OPERATION_CLASSES = ["metadata", "bug"]
+
+    def __init__(self, url, bugzillasession):
+        url = _xmlrpc_url_from_rest_url(url)
+        _BackendBase.__init__(self, url, bugzillasession)
+        self._xmlrpc = _BackendXMLRPC(url, bugzillasession)
+        self._rest = _BackendREST(
+            _rest_url_from_xmlrpc_url(url), bugzillasession)
+        self._routes = dict((c, self._rest) for c in self._OPERATION_CLASSES)
+        self._calibration = {}
+
+    def _route(self, opclass):
+        return self._routes[opclass]
+
+    def _pick(self, ids=None):
+        """
+        Return the backend to use for a bug call. If the call takes a
+        list of IDs that REST would have to loop over, prefer XMLRPC
+        """
+        if ids is not None and len(listify(ids) or []) > 1:
+            return self._xmlrpc
+        return self._route("bug")
+
+
+    ###############
+    # Calibration #
+    ###############
+
+    def calibrate(self, samples=3, bug_ids=None):
+        """
+        Time representative calls for each operation class against
+        both APIs, and route each class to the API that was fastest
+        for it.
+
+        Only read calls are probed. Write calls follow the routing of
+        their class, since their cost is dominated by the same request
+        latency and response decoding.
+
+        :param samples: Number of times to run each probe call. We use
+            the median to avoid noise from a single slow request.
+        :param bug_ids: Bug IDs to fetch when probing the 'bug' class.
+            Without them there is no reliably readable bug to probe,
+            so the 'bug' class is routed like 'metadata'.
+        :returns: dict mapping each operation class to a dict mapping
+            'rest' and 'xmlrpc' to the measured median seconds
+        """
+        def _probe_metadata(backend):
+            # version is a round trip latency probe, bug_fields
+            # returns a decent sized payload to measure decode cost
+            backend.bugzilla_version()
+            backend.bug_fields({"names": ["bug_status"]})
+
+        def _probe_bug(backend):
+            backend.bug_get(bug_ids, None, {})
+
+        def _measure(backend, probe):
+            timings = []
+            for dummy in range(samples):
+                start = time.monotonic()
+                probe(backend)
+                timings.append(time.monotonic() - start)
+            timings.sort()
+            return timings[len(timings) // 2]
+
+        probes = {"metadata": _probe_metadata}
+        if bug_ids:
+            probes["bug"] = _probe_bug
+
+        calibration = {}
+        for opclass in self._OPERATION_CLASSES:
+            probe = probes.get(opclass)
+            if probe is None:
+                calibration[opclass] = calibration["metadata"].copy()
+                continue
+            calibration[opclass] = {
+                "rest": _measure(self._rest, probe),
+                "xmlrpc": _measure(self._xmlrpc, probe),
+            }
+
+        for opclass, timings in calibration.items():
+            if timings["xmlrpc"] < timings["rest"]:
+                self._routes[opclass] = self._xmlrpc
+            else:
+                self._routes[opclass] = self._rest
+        self._calibration = calibration
+        log.debug("Hybrid backend calibration=%s, routes=%s",
+                  calibration,
+                  dict((c, b.is_rest() and "REST" or "XMLRPC")
+                       for c, b in self._routes.items()))
+        return self.get_calibration()
+
+    def get_calibration(self):
+        return dict((c, t.copy()) for c, t in self._calibration.items())
+
+
+    #######################
+    # API implementations #
+    #######################
+
+    def get_xmlrpc_proxy(self):
+        return self._xmlrpc.get_xmlrpc_proxy()
+    def is_hybrid(self):
+        return True
+
+    def bugzilla_version(self):
+        return self._route("metadata").bugzilla_version()
+
+    def bug_attachment_get(self, attachment_ids, paramdict):
+        return self._pick(attachment_ids).bug_attachment_get(
+            attachment_ids, paramdict)
+    def bug_attachment_get_all(self, bug_ids, paramdict):
+        return self._pick(bug_ids).bug_attachment_get_all(
+            bug_ids, paramdict)
+    def bug_attachment_download(self, attachment_id, fileobj):
+        return self._route("bug").bug_attachment_download(
+            attachment_id, fileobj)
+    def bug_attachment_create(self, bug_ids, data, paramdict):
+        return self._pick(bug_ids).bug_attachment_create(
+            bug_ids, data, paramdict)
+    def bug_attachment_update(self, attachment_ids, paramdict):
+        return self._pick(attachment_ids).bug_attachment_update(
+            attachment_ids, paramdict)
+
+    def bug_comments(self, bug_ids, paramdict):
+        return self._pick(bug_ids).bug_comments(bug_ids, paramdict)
+    def bug_create(self, paramdict):
+        return self._route("bug").bug_create(paramdict)
+    def bug_fields(self, paramdict):
+        return self._route("metadata").bug_fields(paramdict)
+    def bug_get(self, bug_ids, aliases, paramdict):
+        return self._route("bug").bug_get(bug_ids, aliases, paramdict)
+    def bug_history(self, bug_ids, paramdict):
+        return self._pick(bug_ids).bug_history(bug_ids, paramdict)
+    def bug_search(self, paramdict):
+        return self._route("bug").bug_search(paramdict)
+    def bug_update(self, bug_ids, paramdict):
+        return self._route("bug").bug_update(bug_ids, paramdict)
+    def bug_update_tags(self, bug_ids, paramdict):
+        # No REST equivalent
+        return self._xmlrpc.bug_update_tags(bug_ids, paramdict)
+
+    def component_create(self, paramdict):
+        return self._route("metadata").component_create(paramdict)
+    def component_update(self, paramdict):
+        return self._route("metadata").component_update(paramdict)
+
+    # No REST equivalents for the ExternalBugs extension
+    def externalbugs_add(self, paramdict):
+        return self._xmlrpc.externalbugs_add(paramdict)
+    def externalbugs_update(self, paramdict):
+        return self._xmlrpc.externalbugs_update(paramdict)
+    def externalbugs_remove(self, paramdict):
+        return self._xmlrpc.externalbugs_remove(paramdict)
+
+    def group_get(self, paramdict):
+        return self._route("metadata").group_get(paramdict)
+
+    def product_get(self, paramdict):
+        return self._route("metadata").product_get(paramdict)
+    def product_get_accessible(self):
+        return self._route("metadata").product_get_accessible()
+    def product_get_enterable(self):
+        return self._route("metadata").product_get_enterable()
+    def product_get_selectable(self):
+        return self._route("metadata").product_get_selectable()
+
+    def user_create(self, paramdict):
+        return self._route("metadata").user_create(paramdict)
+    def user_get(self, paramdict):
+        return self._route("metadata").user_get(paramdict)
+    def user_login(self, paramdict):
+        return self._route("metadata").user_login(paramdict)
+    def user_logout(self):
+        return self._route("metadata").user_logout()
+    def user_update(self, paramdict):
+        return self._route("metadata").user_update(paramdict)
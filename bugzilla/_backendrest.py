@@ -5,10 +5,17 @@ import base64
 import json
 import logging
 import os
+import urllib.parse
 
+import requests
+
+from . import _profile
 from ._backendbase import _BackendBase
-from .exceptions import BugzillaError, BugzillaHTTPError
-from ._util import listify
+from .exceptions import BugzillaError
+from ._session import BugzillaHTTPError
+from ._stream import (CHUNK_SIZE, _UploadSource,
+                      _json_base64_body, _stream_json_base64)
+from ._util import listify, log_truncate
 
 
 log = logging.getLogger(__name__)
@@ -20,10 +27,29 @@ def _update_key(indict, updict, key):
     indict[key].update(updict.get(key, {}))
 
 
+def _merge_split_responses(outlist):
+    # Merge results of a GET that was split into multiple requests.
+    # List values like 'bugs' and 'faults' are concatenated in order
+    ret = outlist[0]
+    for out in outlist[1:]:
+        for key, val in out.items():
+            if isinstance(val, list) and isinstance(ret.get(key), list):
+                ret[key].extend(val)
+            else:
+                ret.setdefault(key, val)
+    return ret
+
+
 class _BackendREST(_BackendBase):
     """
     Internal interface for direct calls to bugzilla's REST API
     """
+    # GET parameters that we can split across multiple requests if
+    # the URL grows too long, mapped to the API paths that allow it
+    _SPLIT_GET_PARAMS = {
+        "/bug": ["id", "alias"],
+    }
+
     def __init__(self, url, bugzillasession):
         _BackendBase.__init__(self, url, bugzillasession)
         self._bugzillasession.set_rest_defaults()
@@ -54,32 +80,111 @@ class _BackendREST(_BackendBase):
         try:
             ret = dict(json.loads(text))
         except Exception:  # pragma: no cover
-            log.debug("Failed to parse REST response. Output is:\n%s", text)
+            log.debug("Failed to parse REST response. Output is:\n%s",
+                      log_truncate(text))
             raise
 
         if ret.get("error", False):  # pragma: no cover
             raise BugzillaError(ret["message"], code=ret["code"])
         return ret
 
+    def _split_get_params(self, apiurl, fullurl, params):
+        """
+        If the GET URL for params would exceed the session's max URL
+        length, split the list values of splittable parameters (like
+        bug IDs) into multiple param dicts that each fit.
+
+        Bugzilla's REST API has no POST equivalent for these calls, so
+        if the other parameters, or a single value, are too long to fit
+        on their own, raise an error rather than send oversized URLs.
+        """
+        def _urllen(_params):
+            return len(requests.Request(
+                "GET", fullurl, params=_params).prepare().url)
+
+        maxlen = self._bugzillasession.get_max_url_length()
+        splitkeys = [k for k in self._SPLIT_GET_PARAMS.get(apiurl, [])
+                     if isinstance(params.get(k), list)]
+        if (not splitkeys or
+            "limit" in params or "offset" in params or
+            _urllen(params) <= maxlen):
+            return [params]
+
+        def _too_long(what):
+            return BugzillaError(
+                "REST GET %s %s too long to fit max_url_length=%d, even "
+                "when split into multiple requests. Request fewer "
+                "include_fields/exclude_fields, raise max_url_length, "
+                "or use the XMLRPC API" % (apiurl, what, maxlen))
+
+        base = dict((k, v) for k, v in params.items() if k not in splitkeys)
+        baselen = _urllen(base)
+        chunks = []
+        chunk = {}
+        chunklen = baselen
+        for key in splitkeys:
+            for val in params[key]:
+                # +1 for the joining '&' or '?'
+                itemlen = len(urllib.parse.urlencode({key: val})) + 1
+                if baselen + itemlen > maxlen:
+                    if baselen > maxlen:
+                        raise _too_long("parameters other than %s are" %
+                                        "/".join(splitkeys))
+                    raise _too_long("%s value %s is" %
+                                    (key, log_truncate(val)))
+                if chunk and chunklen + itemlen > maxlen:
+                    chunks.append(chunk)
+                    chunk = {}
+                    chunklen = baselen
+                chunk.setdefault(key, []).append(val)
+                chunklen += itemlen
+        if chunk:
+            chunks.append(chunk)
+
+        ret = []
+        for chunk in chunks:
+            newparams = base.copy()
+            newparams.update(chunk)
+            ret.append(newparams)
+        return ret
+
+    def _request(self, method, fullurl, data, params):
+        try:
+            # Content-Type is passed explicitly, since the session
+            # may be shared with the XMLRPC backend in hybrid mode
+            response = self._bugzillasession.request(
+                method, fullurl, data=data, params=params,
+                headers={"Content-Type": "application/json"}
+            )
+        except BugzillaHTTPError as e:
+            self._handle_error(e)
+
+        with _profile.phase("decode"):
+            return self._handle_response(response.text)
+
     def _op(self, method, apiurl, paramdict=None):
         fullurl = os.path.join(self._url, apiurl.lstrip("/"))
-        log.debug("Bugzilla REST %s %s params=%s", method, fullurl, paramdict)
+        log.debug("Bugzilla REST %s %s params=%s",
+                  method, fullurl, log_truncate(paramdict))
 
         data = None
         authparams = self._bugzillasession.get_auth_params()
         if method == "GET":
             authparams.update(paramdict or {})
+            splitparams = self._split_get_params(apiurl, fullurl, authparams)
+            if len(splitparams) > 1:
+                log.debug("Splitting GET %s into %d requests to fit "
+                          "max URL length", fullurl, len(splitparams))
+
+                def _do_split_request(params):
+                    return self._request(method, fullurl, None, params)
+                return _merge_split_responses(
+                    self._bugzillasession.run_concurrently(
+                        _do_split_request, splitparams))
         else:
             data = json.dumps(paramdict or {})
 
-        try:
-            response = self._bugzillasession.request(
-                method, fullurl, data=data, params=authparams
-            )
-        except BugzillaHTTPError as e:
-            self._handle_error(e)
-
-        return self._handle_response(response.text)
+        return self._request(method, fullurl, data, authparams)
 
     def _get(self, *args, **kwargs):
         return self._op("GET", *args, **kwargs)
@@ -145,12 +250,44 @@ class _BackendREST(_BackendBase):
             _update_key(ret, out, "bugs")
         return ret
 
+    def bug_attachment_download(self, attachment_id, fileobj):
+        apiurl = "/bug/attachment/%s" % attachment_id
+        fullurl = os.path.join(self._url, apiurl.lstrip("/"))
+        log.debug("Bugzilla REST streaming GET %s", fullurl)
+
+        params = self._bugzillasession.get_auth_params()
+        params["include_fields"] = ["data"]
+        try:
+            response = self._bugzillasession.request(
+                "GET", fullurl, params=params, stream=True,
+                headers={"Content-Type": "application/json"})
+        except BugzillaHTTPError as e:
+            self._handle_error(e)
+
+        with response:
+            size, head = _stream_json_base64(
+                response.iter_content(CHUNK_SIZE), fileobj)
+        if size is None:
+            self._handle_response(head.decode("utf-8"))
+            raise BugzillaError(
+                "No data returned for attachment %s" % attachment_id)
+        return size
     def bug_attachment_create(self, bug_ids, data, paramdict):
+        paramdict["ids"] = listify(bug_ids)
+        apiurl = "/bug/%s/attachment" % paramdict["ids"][0]
+        if isinstance(data, _UploadSource) and "data" not in paramdict:
+            # Encode the content while sending, rather than building
+            # the whole JSON document in memory
+            fullurl = os.path.join(self._url, apiurl.lstrip("/"))
+            log.debug("Bugzilla REST streaming POST %s params=%s size=%s",
+                      fullurl, log_truncate(paramdict), data.size)
+            body = _json_base64_body(paramdict, "data", data)
+            return self._request("POST", fullurl, body,
+                                 self._bugzillasession.get_auth_params())
+
         if data is not None and "data" not in paramdict:
             paramdict["data"] = base64.b64encode(data).decode("utf-8")
-        paramdict["ids"] = listify(bug_ids)
-        return self._post("/bug/%s/attachment" % paramdict["ids"][0],
-                paramdict)
+        return self._post(apiurl, paramdict)
 
     def bug_attachment_update(self, attachment_ids, paramdict):
         paramdict["ids"] = listify(attachment_ids)
@@ -1,20 +1,27 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import base64
 from logging import getLogger
 import sys
 from xmlrpc.client import (Binary, Fault, ProtocolError,
-                           ServerProxy, Transport)
+                           ServerProxy, Transport, dumps, loads)
 
 from requests import RequestException
 
+from . import _profile
 from ._backendbase import _BackendBase
 from .exceptions import BugzillaError
-from ._util import listify
+from ._stream import (CHUNK_SIZE, _Base64Body, _UploadSource,
+                      _stream_xmlrpc_base64)
+from ._util import listify, log_truncate
 
 
 log = getLogger(__name__)
 
+# Stand in for streamed base64 content while marshalling the request
+_UPLOAD_PLACEHOLDER = b"python-bugzilla streamed upload placeholder"
+
 
 class _BugzillaXMLRPCTransport(Transport):
     def __init__(self, bugzillasession):
@@ -42,9 +49,11 @@ class _BugzillaXMLRPCTransport(Transport):
         # pylint: disable=raise-missing-from
         try:
             response = self.__bugzillasession.request(
-                "POST", url, data=request_body)
+                "POST", url, data=request_body,
+                headers={"Content-Type": "text/xml"})
 
-            return self.parse_response(response)
+            with _profile.phase("decode"):
+                return self.parse_response(response)
         except RequestException as e:
             if not response:
                 raise
@@ -76,7 +85,8 @@ class _BugzillaXMLRPCTransport(Transport):
         try:
             parser.feed(msg)
         except Exception:  # pragma: no cover
-            log.debug("Failed to parse this XMLRPC response:\n%s", msg)
+            log.debug("Failed to parse this XMLRPC response:\n%s",
+                      log_truncate(msg))
             raise
 
         self.__seen_valid_xml = True
@@ -94,11 +104,35 @@ class _BugzillaXMLRPCTransport(Transport):
         url = "%s://%s%s" % (self.__bugzillasession.get_scheme(),
                 host, handler)
 
-        # xmlrpclib fails to escape \r
-        request_body = request_body.replace(b'\r', b'&#xd;')
+        # xmlrpclib fails to escape \r. Streamed bodies are escaped
+        # when they are built
+        if isinstance(request_body, bytes):
+            request_body = request_body.replace(b'\r', b'&#xd;')
 
         return self.__request_helper(url, request_body)
 
+    def stream_request(self, host, handler, request_body, fileobj):
+        """
+        Like request(), but decode the response's base64 value into
+        fileobj as it is read, rather than unmarshalling it in memory.
+        Returns the number of bytes written.
+        """
+        url = "%s://%s%s" % (self.__bugzillasession.get_scheme(),
+                host, handler)
+        request_body = request_body.replace(b'\r', b'&#xd;')
+
+        response = self.__bugzillasession.request(
+            "POST", url, data=request_body, stream=True,
+            headers={"Content-Type": "text/xml"})
+        with response:
+            size, head = _stream_xmlrpc_base64(
+                response.iter_content(CHUNK_SIZE), fileobj)
+        if size is None:
+            # No base64 value, which is most likely a Fault
+            loads(head)
+            raise BugzillaError("No base64 data in XMLRPC response")
+        return size
+
 
 class _BugzillaXMLRPCProxy(ServerProxy, object):
     """
@@ -117,7 +151,7 @@ class _BugzillaXMLRPCProxy(ServerProxy, object):
         # params is a singleton tuple, enforced by xmlrpc.client.dumps
         newparams = params and params[0].copy() or {}
 
-        log.debug("XMLRPC call: %s(%s)", methodname, newparams)
+        log.debug("XMLRPC call: %s(%s)", methodname, log_truncate(newparams))
         authparams = self.__bugzillasession.get_auth_params()
         authparams.update(newparams)
 
@@ -128,6 +162,51 @@ class _BugzillaXMLRPCProxy(ServerProxy, object):
 
         return ret
 
+    def stream_upload_call(self, methodname, params, key, source):
+        """
+        Call methodname with params, plus key set to the content of the
+        _UploadSource source, which is base64 encoded while it is sent
+        """
+        log.debug("XMLRPC streaming call: %s(%s) size=%s",
+                  methodname, log_truncate(params), source.size)
+        authparams = self.__bugzillasession.get_auth_params()
+        authparams.update(params)
+        authparams[key] = Binary(_UPLOAD_PLACEHOLDER)
+
+        # pylint: disable=no-member
+        encoding = self._ServerProxy__encoding
+        request = dumps((authparams,), methodname, encoding=encoding,
+            allow_none=self._ServerProxy__allow_none).encode(
+                encoding, "xmlcharrefreplace")
+        request = request.replace(b'\r', b'&#xd;')
+        prefix, suffix = request.split(
+            base64.encodebytes(_UPLOAD_PLACEHOLDER))
+        body = _Base64Body(prefix, source, suffix)
+        response = self._ServerProxy__transport.request(
+            self._ServerProxy__host, self._ServerProxy__handler, body)
+        if len(response) == 1:
+            response = response[0]
+        return response
+
+    def stream_base64_call(self, methodname, params, fileobj):
+        """
+        Call methodname like a regular proxy method call, but decode
+        the base64 value in the response straight into fileobj
+        """
+        log.debug("XMLRPC streaming call: %s(%s)",
+                  methodname, log_truncate(params))
+        authparams = self.__bugzillasession.get_auth_params()
+        authparams.update(params)
+
+        # pylint: disable=no-member
+        encoding = self._ServerProxy__encoding
+        request = dumps((authparams,), methodname, encoding=encoding,
+            allow_none=self._ServerProxy__allow_none).encode(
+                encoding, "xmlcharrefreplace")
+        return self._ServerProxy__transport.stream_request(
+            self._ServerProxy__host, self._ServerProxy__handler,
+            request, fileobj)
+
 
 class _BackendXMLRPC(_BackendBase):
     """
@@ -153,9 +232,16 @@ class _BackendXMLRPC(_BackendBase):
         data = paramdict.copy()
         data["ids"] = listify(bug_ids)
         return self._xmlrpc_proxy.Bug.attachments(data)
+    def bug_attachment_download(self, attachment_id, fileobj):
+        data = {"attachment_ids": [attachment_id], "include_fields": ["data"]}
+        return self._xmlrpc_proxy.stream_base64_call(
+            "Bug.attachments", data, fileobj)
     def bug_attachment_create(self, bug_ids, data, paramdict):
         pdata = paramdict.copy()
         pdata["ids"] = listify(bug_ids)
+        if isinstance(data, _UploadSource) and "data" not in paramdict:
+            return self._xmlrpc_proxy.stream_upload_call(
+                "Bug.add_attachment", pdata, "data", data)
         if data is not None and "data" not in paramdict:
             pdata["data"] = Binary(data)
         return self._xmlrpc_proxy.Bug.add_attachment(pdata)
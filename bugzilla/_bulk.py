@@ -0,0 +1,193 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import hashlib
+import json
+from logging import getLogger
+import os
+import threading
+import time
+
+from .exceptions import BugzillaError
+from ._util import listify
+
+log = getLogger(__name__)
+
+
+def _update_key(update):
+    """
+    Stable identifier for an update payload, used to merge identical
+    updates and to match them against the journal across runs
+    """
+    data = json.dumps(update, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _group_updates(updates):
+    """
+    Merge a list of (ids, update) pairs into update calls, one per
+    distinct payload, preserving input order.
+
+    A bug that receives several different updates must get them in
+    input order, so its Nth update goes into the Nth 'wave' of calls.
+    Waves are run one after another. A bug repeating the update it
+    just got doesn't get it twice.
+
+    :returns: List of waves, each a list of (key, update, [ids]). key
+        identifies the payload and wave in the journal.
+    """
+    waves = []
+    latest = {}
+    for ids, update in updates:
+        key = _update_key(update)
+        for bugid in listify(ids):
+            wave, lastkey = latest.get(bugid, (-1, None))
+            if lastkey == key:
+                continue
+            wave += 1
+            latest[bugid] = (wave, key)
+            if wave == len(waves):
+                waves.append({})
+            waves[wave].setdefault(key, (update, {}))[1][bugid] = None
+
+    ret = []
+    for idx, groups in enumerate(waves):
+        # The first wave uses the bare payload key, so journals of
+        # inputs without repeated bugs look the same as before
+        ret.append([(idx and "%s.%d" % (key, idx) or key, update, list(ids))
+                    for key, (update, ids) in groups.items()])
+    return ret
+
+
+class _RateLimiter(object):
+    """
+    Thread safe limiter spacing calls at least 1/rate seconds apart
+    """
+    def __init__(self, rate):
+        self._interval = 1.0 / float(rate)
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self._interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class _BulkJournal(object):
+    """
+    Append-only record of completed bulk updates. Each line is a JSON
+    object like {"key": <update key>, "ids": [...]}, written and synced
+    to disk once the update call for those ids has succeeded.
+    """
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._fobj = None
+        self._done = set()
+        self._needs_newline = False
+
+        if not os.path.exists(path):
+            return
+        with open(path, "r") as fobj:
+            for line in fobj:
+                self._needs_newline = not line.endswith("\n")
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Partially written line from an interrupted run
+                    log.debug("Skipping invalid journal line: %r", line)
+                    continue
+                for bugid in entry["ids"]:
+                    self._done.add((entry["key"], str(bugid)))
+
+    def is_done(self, key, bugid):
+        return (key, str(bugid)) in self._done
+
+    def record(self, key, ids):
+        line = json.dumps({"key": key, "ids": ids}) + "\n"
+        with self._lock:
+            if not self._fobj:
+                self._fobj = open(self._path, "a")
+                if self._needs_newline:
+                    # Terminate a partial line left by a crash
+                    self._fobj.write("\n")
+            self._fobj.write(line)
+            self._fobj.flush()
+            os.fsync(self._fobj.fileno())
+            for bugid in ids:
+                self._done.add((key, str(bugid)))
+
+    def close(self):
+        with self._lock:
+            if self._fobj:
+                self._fobj.close()
+                self._fobj = None
+
+
+def _run_bulk_update(update_func, run_concurrently, updates,
+                     journal=None, max_rate=None):
+    """
+    Implementation of Bugzilla.update_bugs_bulk
+
+    :param update_func: Bugzilla.update_bugs
+    :param run_concurrently: _BugzillaSession.run_concurrently
+    """
+    waves = _group_updates(updates)
+    journalobj = journal and _BulkJournal(journal) or None
+    limiter = max_rate and _RateLimiter(max_rate) or None
+    failedids = set()
+
+    def _apply(item):
+        key, update, ids = item
+        ret = {"ids": ids, "update": update}
+        if limiter:
+            limiter.wait()
+        try:
+            ret["result"] = update_func(ids, update)
+        except Exception as e:
+            log.debug("Bulk update of %s failed", ids, exc_info=True)
+            ret["error"] = e
+            return ret
+
+        if journalobj:
+            journalobj.record(key, ids)
+        return ret
+
+    def _skipped(key, update, ids):
+        return {"ids": ids, "update": update, "error": BugzillaError(
+            "Not applying update %s, an earlier update of these bugs "
+            "failed" % key)}
+
+    ret = []
+    try:
+        for wave in waves:
+            work = []
+            for key, update, ids in wave:
+                if journalobj:
+                    ids = [bugid for bugid in ids
+                           if not journalobj.is_done(key, bugid)]
+                    if not ids:
+                        log.debug("Skipping update %s, already in journal",
+                                  key)
+                        continue
+                skipids = [bugid for bugid in ids if bugid in failedids]
+                if skipids:
+                    ret.append(_skipped(key, update, skipids))
+                    ids = [bugid for bugid in ids if bugid not in failedids]
+                if ids:
+                    work.append((key, update, ids))
+            log.debug("Bulk update: %d distinct updates to send", len(work))
+
+            results = run_concurrently(_apply, work)
+            for result in results:
+                if "error" in result:
+                    failedids.update(result["ids"])
+            ret.extend(results)
+        return ret
+    finally:
+        if journalobj:
+            journalobj.close()
@@ -0,0 +1,184 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+"""
+Record and replay of the HTTP traffic of a _BugzillaSession, so real
+world workloads can be reproduced offline.
+
+A cassette is a JSON lines file with one entry per request/response
+pair. If the filename ends with .gz, every entry is written as its own
+gzip member, which keeps the file valid even if the process dies while
+recording. Request bodies are stored only as a hash, which is all that
+replay needs to match them.
+"""
+
+import base64
+import datetime
+import gzip
+import hashlib
+import io
+import json
+from logging import getLogger
+import re
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+log = getLogger(__name__)
+
+
+SCRUBBED = "SCRUBBED"
+# Parameter and field names whose values are never written out
+_SECRET_NAMES = ["Bugzilla_api_key", "Bugzilla_password", "Bugzilla_token",
+                 "api_key", "password", "token"]
+_SECRET_NAMES_RE = "|".join(_SECRET_NAMES)
+_QUERY_RE = re.compile(r"([?&](?:%s)=)[^&]*" % _SECRET_NAMES_RE)
+_JSON_RE = re.compile(r'("(?:%s)"\s*:\s*)"[^"]*"' % _SECRET_NAMES_RE)
+_XML_RE = re.compile(r"(<name>(?:%s)</name>\s*<value>(?:<string>)?)[^<]*"
+                     % _SECRET_NAMES_RE)
+# Response headers that no longer apply to the decoded body we store
+_SKIP_HEADERS = ["content-encoding", "content-length", "set-cookie",
+                 "transfer-encoding", "connection", "keep-alive"]
+
+
+def _scrub(text, secrets):
+    for secret in secrets:
+        if secret:
+            text = text.replace(secret, SCRUBBED)
+    text = _QUERY_RE.sub(r"\1" + SCRUBBED, text)
+    text = _JSON_RE.sub(r'\1"%s"' % SCRUBBED, text)
+    return _XML_RE.sub(r"\1" + SCRUBBED, text)
+
+
+def _normalize_url(url, params, secrets):
+    """
+    Full request URL with params merged in, query sorted, and secrets
+    scrubbed, so the same request always gives the same string
+    """
+    url = requests.Request("GET", url, params=params).prepare().url
+    parsed = urllib.parse.urlparse(url)
+    query = sorted(urllib.parse.parse_qsl(parsed.query,
+                                          keep_blank_values=True))
+    url = parsed._replace(query=urllib.parse.urlencode(query)).geturl()
+    return _scrub(url, secrets)
+
+
+def _body_key(data, secrets):
+    if data is None:
+        return None
+    if hasattr(data, "read"):
+        # Streamed upload, reading it here would consume it
+        return "stream:%d" % len(data)
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", "replace")
+    return hashlib.sha256(
+        _scrub(data, secrets).encode("utf-8")).hexdigest()
+
+
+def _request_key(method, url, kwargs, secrets):
+    return (method.upper(),
+            _normalize_url(url, kwargs.get("params"), secrets),
+            _body_key(kwargs.get("data"), secrets))
+
+
+class _CassetteRecorder(object):
+    """
+    Append every request/response pair to the cassette at path
+    """
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._compress = path.endswith(".gz")
+        # Start a fresh cassette
+        open(self._path, "wb").close()
+
+    def record(self, method, url, kwargs, response, elapsed, secrets):
+        method, url, body = _request_key(method, url, kwargs, secrets)
+        content = response.content or b""
+        try:
+            text = _scrub(content.decode("utf-8"), secrets)
+            encoding = "text"
+        except UnicodeDecodeError:
+            text = base64.b64encode(content).decode("ascii")
+            encoding = "base64"
+
+        entry = {
+            "method": method,
+            "url": url,
+            "body": body,
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": dict((k, v) for k, v in response.headers.items()
+                            if k.lower() not in _SKIP_HEADERS),
+            "elapsed": round(elapsed, 4),
+            "encoding": encoding,
+            "content": text,
+        }
+        line = (json.dumps(entry, separators=(",", ":")) + "\n").encode(
+            "utf-8")
+        if self._compress:
+            line = gzip.compress(line)
+        with self._lock:
+            with open(self._path, "ab") as fobj:
+                fobj.write(line)
+
+
+class _CassettePlayer(object):
+    """
+    Serve the responses recorded in the cassette at path. Requests are
+    matched on method, URL and body. Repeats of the same request get the
+    recorded responses in order, and then the last one again.
+
+    :param timing: If True, sleep for the recorded response time before
+        returning each response
+    """
+    def __init__(self, path, timing=False):
+        self._timing = timing
+        self._lock = threading.Lock()
+        self._entries = {}
+
+        opener = path.endswith(".gz") and gzip.open or open
+        with opener(path, "rb") as fobj:
+            for line in fobj:
+                entry = json.loads(line.decode("utf-8"))
+                key = (entry["method"], entry["url"], entry["body"])
+                self._entries.setdefault(key, []).append(entry)
+        log.debug("Loaded %d recorded requests from %s",
+                  sum(len(v) for v in self._entries.values()), path)
+
+    def play(self, method, url, kwargs, secrets):
+        key = _request_key(method, url, kwargs, secrets)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise requests.exceptions.ConnectionError(
+                    "No recorded response for %s %s" % key[:2])
+            entry = entries[0]
+            if len(entries) > 1:
+                entries.pop(0)
+
+        if self._timing:
+            time.sleep(entry["elapsed"])
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry["reason"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.url = entry["url"]
+        response.request = requests.Request(
+            method, entry["url"]).prepare()
+        response.elapsed = datetime.timedelta(seconds=entry["elapsed"])
+        if entry["encoding"] == "base64":
+            content = base64.b64decode(entry["content"])
+        else:
+            content = entry["content"].encode("utf-8")
+        # Serve both .content and streamed reads via iter_content()
+        # pylint: disable=protected-access
+        response._content = content
+        response._content_consumed = True
+        response.raw = io.BytesIO(content)
+        response.encoding = "UTF-8"
+        return response
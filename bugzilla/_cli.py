@@ -11,22 +11,26 @@
 
 import argparse
 import base64
+import concurrent.futures
 import datetime
 import errno
+import io
 import json
 import locale
 from logging import getLogger, DEBUG, INFO, WARN, StreamHandler, Formatter
 import os
 import re
+import shlex
 import socket
 import sys
 import tempfile
+import textwrap
+import threading
 import urllib.parse
-import xmlrpc.client
-
-import requests.exceptions
 
 import bugzilla
+from bugzilla import _profile
+from bugzilla._util import log_truncate
 
 
 DEFAULT_BZ = 'https://bugzilla.redhat.com'
@@ -129,6 +133,21 @@ def _setup_root_parser():
     p.add_argument('--tokenfile', default=None,
             help="token file to use for bugzilla authentication")
 
+    p.add_argument('--socket', metavar="PATH",
+            help="Send the command to a 'bugzilla serve' process "
+                 "listening on this unix socket, rather than connecting "
+                 "to bugzilla directly")
+    p.add_argument('--timeout', type=float,
+            help="Give up if the command's bugzilla API calls take "
+                 "longer than TIMEOUT seconds in total")
+
+    p.add_argument('--profile', action='store_true',
+            help="Print a breakdown of where the command spent its "
+                 "time to stderr at exit")
+    p.add_argument('--profile-output', metavar="PREFIX",
+            help="Like --profile, and also write a cProfile dump to "
+                 "PREFIX.pstats and a JSON trace to PREFIX.json")
+
     p.add_argument('--verbose', action='store_true',
             help="give more info about what's going on")
     p.add_argument('--debug', action='store_true',
@@ -160,6 +179,9 @@ def _parser_add_output_options(p):
             help="one line summary of the bug (useful for scripts)")
     outg.add_argument('--json', action='store_const', dest='output',
             const='json', help="output contents in json format")
+    outg.add_argument('--ndjson', action='store_const', dest='output',
+            const='ndjson', help="output contents as newline delimited "
+            "json, one bug object per line")
     outg.add_argument("--includefield", action="append",
             help="Pass the field name to bugzilla include_fields list. "
                  "Only the fields passed to include_fields are returned "
@@ -357,6 +379,7 @@ def _setup_action_info_parser(subparsers):
 
 def _setup_action_modify_parser(subparsers):
     usage = ("bugzilla modify [options] BUGID [BUGID...]\n"
+        "       bugzilla modify --from-file FILE [--journal FILE]\n"
         "Fields that take multiple values have a special input format.\n"
         "Append:    --cc=foo@example.com\n"
         "Overwrite: --cc==foo@example.com\n"
@@ -368,7 +391,7 @@ def _setup_action_modify_parser(subparsers):
     _parser_add_bz_fields(p, "modify")
 
     g = p.add_argument_group("'modify' specific options")
-    g.add_argument("ids", nargs="+", help="Bug IDs to modify")
+    g.add_argument("ids", nargs="*", help="Bug IDs to modify")
     g.add_argument('-k', '--close', metavar="RESOLUTION",
         help='Close with the given resolution (WONTFIX, NOTABUG, etc.)')
     g.add_argument('-d', '--dupeid', metavar="ORIGINAL",
@@ -379,6 +402,21 @@ def _setup_action_modify_parser(subparsers):
         help='Reset assignee to component default')
     g.add_argument('--reset-qa-contact', action="store_true",
         help='Reset QA contact to component default')
+    g.add_argument('--skip-noop', action="store_true",
+        help="Compare the update against each bug's current values, and "
+             "don't send changes that are already in place")
+
+    g = p.add_argument_group("Bulk update options")
+    g.add_argument('--from-file', metavar="FILE",
+        help="Read many updates from FILE, one JSON object per line, "
+             "like {\"ids\": [123, 456], \"status\": \"POST\"}. "
+             "Other keys are passed to build_update(). Can't be combined "
+             "with bug IDs or other modify options.")
+    g.add_argument('--journal', metavar="FILE",
+        help="Record completed --from-file updates in FILE. Rerunning "
+             "with the same journal skips updates that already completed.")
+    g.add_argument('--max-rate', type=float, metavar="N",
+        help="Send at most N --from-file update calls per second")
 
 
 def _setup_action_attach_parser(subparsers):
@@ -403,6 +441,16 @@ bugzilla attach --type=TYPE BUGID [BUGID...]"""
             default=[], help="Download all attachments on the given bug")
     p.add_argument('--ignore-obsolete', action="store_true",
         help='Do not download attachments marked as obsolete.')
+    p.add_argument('--patches-only', action="store_true",
+        help='Only download attachments marked as patches.')
+    p.add_argument('--content-type', metavar="PATTERN",
+        help="Only download attachments with a matching content type, "
+             "like 'text/*'.")
+    p.add_argument('--file-name', metavar="PATTERN",
+        help="Only download attachments with a matching file name, "
+             "like '*.log'.")
+    p.add_argument('--max-size', type=int, metavar="BYTES",
+        help='Skip attachments larger than BYTES.')
     p.add_argument('-l', '--comment', '--long_desc',
             help="Add comment with attachment")
     p.add_argument('--private', action='store_true', default=False,
@@ -428,6 +476,37 @@ use 'bugzilla login --api-key' and we will save it for you."""
                    metavar="password")
 
 
+def _setup_action_batch_parser(subparsers):
+    usage = 'bugzilla batch [--file FILE] [--parallel N]'
+    description = """Run many bugzilla commands over a single connection.
+Commands are read one per line from stdin or --file, written the same
+way as on the command line but without the leading 'bugzilla', like:
+    query --product Fedora --component python-bugzilla --ids
+    modify 123456 --status POST
+Blank lines and lines starting with # are ignored. Output of each
+command is printed in input order. A failing command doesn't stop the
+batch, but the exit status is non-zero if any command failed."""
+    p = subparsers.add_parser("batch", description=description, usage=usage,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--file', dest='batch_file', metavar="FILE",
+            help="Read commands from FILE instead of stdin")
+    p.add_argument('--parallel', type=int, default=1, metavar="N",
+            help="Run up to N commands at the same time")
+
+
+def _setup_action_serve_parser(subparsers):
+    usage = 'bugzilla serve --socket PATH'
+    description = """Keep a connection to bugzilla open, and run commands
+sent by 'bugzilla --socket PATH COMMAND ...' invocations. This saves the
+connection setup, config parsing, and cache warmup of every command.
+Connection and login options are taken from the 'serve' command line;
+the same options passed by clients are ignored. Commands run one at a
+time, in the client's working directory."""
+    p = subparsers.add_parser("serve", description=description, usage=usage)
+    p.add_argument('--socket', dest='serve_socket', metavar="PATH",
+            required=True, help="Unix socket path to listen on")
+
+
 def setup_parser():
     rootparser = _setup_root_parser()
     subparsers = rootparser.add_subparsers(dest="command")
@@ -438,6 +517,8 @@ def setup_parser():
     _setup_action_modify_parser(subparsers)
     _setup_action_attach_parser(subparsers)
     _setup_action_login_parser(subparsers)
+    _setup_action_batch_parser(subparsers)
+    _setup_action_serve_parser(subparsers)
     return rootparser
 
 
@@ -521,8 +602,21 @@ def _do_query(bz, opt, parser):
         setattr(opt, optname, val.split(","))
 
     include_fields = None
-    if opt.output in ['raw', 'json']:
-        # 'raw' always does a getbug() call anyways, so just ask for ID back
+    exclude_fields = None
+    extra_fields = None
+    fullsearch = bz.bz_ver_major >= 4
+    if opt.output in ['raw', 'json', 'ndjson'] and fullsearch:
+        # Have the search return the same content getbugs() would,
+        # rather than searching for IDs and fetching the bugs again
+        fieldopts = _getbugs_field_kwargs(opt)
+        include_fields = fieldopts["include_fields"]
+        exclude_fields = fieldopts["exclude_fields"]
+        extra_fields = ((fieldopts["extra_fields"] or []) +
+            bz._getbug_extra_fields())  # pylint: disable=protected-access
+
+    elif opt.output in ['raw', 'json', 'ndjson']:
+        # Bugzilla before 4.0 ignores include_fields for searches, so
+        # just ask for IDs and fetch the bugs in chunks afterwards
         include_fields = ['id']
 
     elif opt.outputformat:
@@ -611,6 +705,10 @@ def _do_query(bz, opt, parser):
         kwopts["emailtype"] = opt.emailtype
     if include_fields:
         kwopts["include_fields"] = include_fields
+    if exclude_fields:
+        kwopts["exclude_fields"] = exclude_fields
+    if extra_fields:
+        kwopts["extra_fields"] = extra_fields
     if opt.quicksearch:
         kwopts["quicksearch"] = opt.quicksearch
     if opt.savedsearch:
@@ -628,7 +726,13 @@ def _do_query(bz, opt, parser):
 
     if not q:  # pragma: no cover
         parser.error("'query' command requires additional arguments")
-    return bz.query(q)
+    buglist = bz.query(q)
+
+    if opt.output in ['raw', 'json', 'ndjson'] and not fullsearch:
+        # Output is written as each chunk arrives
+        buglist = _getbugs_chunked(bz, [b.bug_id for b in buglist],
+                                   **_getbugs_field_kwargs(opt))
+    return buglist
 
 
 def _do_info(bz, opt):
@@ -732,10 +836,36 @@ def _xmlrpc_converter(obj):
         "Unexpected JSON conversion class=%s" % obj.__class__)
 
 
+def _bug_json(bug, **kwargs):
+    # pylint: disable=protected-access
+    # get_raw_data() returns a deep copy, which we don't need just
+    # for serializing
+    return json.dumps(bug._rawdata, default=_xmlrpc_converter,
+                      sort_keys=True, **kwargs)
+
+
 def _format_output_json(buglist):
-    out = {"bugs": [b.get_raw_data() for b in buglist]}
-    s = json.dumps(out, default=_xmlrpc_converter, indent=2, sort_keys=True)
-    print(s)
+    """
+    Write {"bugs": [...]} one bug at a time as they come in. The output
+    is identical to json.dumps(indent=2) of the whole dict, without
+    building the whole string in memory first.
+    """
+    write = sys.stdout.write
+    prefix = '{\n  "bugs": [\n'
+    for b in buglist:
+        write(prefix + textwrap.indent(_bug_json(b, indent=2), "    "))
+        prefix = ",\n"
+
+    if prefix != ",\n":
+        write('{\n  "bugs": []\n}\n')
+    else:
+        write("\n  ]\n}\n")
+
+
+def _format_output_ndjson(buglist):
+    write = sys.stdout.write
+    for b in buglist:
+        write(_bug_json(b, separators=(",", ":")) + "\n")
 
 
 def _format_output_raw(buglist):
@@ -751,19 +881,46 @@ def _format_output_raw(buglist):
         print("\n\n")
 
 
-def _bug_field_repl_cb(bz, b, matchobj):
+def _fetch_cve_aliases(bz, buglist):
+    """
+    %{cve} needs the aliases of every blocker of every Security bug.
+    Collect all the blocker IDs up front and fetch their aliases in
+    batched getbugs() calls, rather than one getbug() per blocker.
+
+    :returns: dict mapping blocker bug ID to its alias list
+    """
+    blockers = []
+    seen = set()
+    for b in buglist:
+        if not any("Security" in key for key in getattr(b, "keywords", [])):
+            continue
+        for bl in getattr(b, "blocks", []):
+            if bl not in seen:
+                seen.add(bl)
+                blockers.append(bl)
+
+    ret = {}
+    for cvebug in _getbugs_chunked(bz, blockers, include_fields=["alias"]):
+        ret[cvebug.bug_id] = cvebug.alias
+    return ret
+
+
+def _make_field_extractor(bz, fieldname, rest, cvecache):
+    """
+    Return a function that takes a Bug and returns the string value
+    for the outputformat placeholder %{fieldname:rest}. All the field
+    name dispatch happens here once, not for every bug.
+    """
     # whiteboard and flag allow doing
     #   %{whiteboard:devel} and %{flag:needinfo}
     # That's what 'rest' matches
-    (fieldname, rest) = matchobj.groups()
-
     if fieldname == "whiteboard" and rest:
         fieldname = rest + "_" + fieldname
 
-    if fieldname == "flag" and rest:
-        val = b.get_flag_status(rest)
+    def _flag(b):
+        return b.get_flag_status(rest)
 
-    elif fieldname in ["flags", "flags_requestee"]:
+    def _flags(b):
         tmpstr = []
         for f in getattr(b, "flags", []):
             requestee = f.get('requestee', "")
@@ -776,76 +933,147 @@ def _bug_field_repl_cb(bz, b, matchobj):
             else:
                 tmpstr.append("%s%s%s" %
                         (f['name'], f['status'], requestee))
+        return ",".join(tmpstr)
 
-        val = ",".join(tmpstr)
-
-    elif fieldname == "cve":
+    def _cve(b):
         cves = []
         for key in getattr(b, "keywords", []):
             # grab CVE from keywords and blockers
             if key.find("Security") == -1:
                 continue
             for bl in b.blocks:
-                cvebug = bz.getbug(bl)
-                for cb in cvebug.alias:
+                if cvecache is None or bl not in cvecache:
+                    cvebug = bz.getbug(bl)
+                    if cvecache is not None:
+                        cvecache[bl] = cvebug.alias
+                    aliases = cvebug.alias
+                else:
+                    aliases = cvecache[bl]
+                for cb in aliases:
                     if (cb.find("CVE") != -1 and
                         cb.strip() not in cves):
                         cves.append(cb)
-        val = ",".join(cves)
+        return ",".join(cves)
 
-    elif fieldname == "comments":
+    def _comments(b):
         val = ""
         for c in getattr(b, "comments", []):
             val += ("\n* %s - %s:\n%s\n" % (c['time'],
                      c.get("creator", c.get("author", "")), c['text']))
+        return val
 
-    elif fieldname == "external_bugs":
+    def _external_bugs(b):
         val = ""
         for e in getattr(b, "external_bugs", []):
             url = e["type"]["full_url"].replace("%id%", e["ext_bz_bug_id"])
             if not val:
                 val += "\n"
             val += "External bug: %s\n" % url
+        return val
+
+    def _unicode(b):
+        return b.__unicode__()
+
+    def _attr(b):
+        return getattr(b, fieldname, "")
 
+    if fieldname == "flag" and rest:
+        getval = _flag
+    elif fieldname in ["flags", "flags_requestee"]:
+        getval = _flags
+    elif fieldname == "cve":
+        getval = _cve
+    elif fieldname == "comments":
+        getval = _comments
+    elif fieldname == "external_bugs":
+        getval = _external_bugs
     elif fieldname == "__unicode__":
-        val = b.__unicode__()
+        getval = _unicode
     else:
-        val = getattr(b, fieldname, "")
-
-    vallist = isinstance(val, list) and val or [val]
-    val = ','.join([str(v or '') for v in vallist])
-
-    return val
-
-
-def _format_output(bz, opt, buglist):
-    if opt.output in ['raw', 'json']:
-        include_fields = None
-        exclude_fields = None
-        extra_fields = None
-
-        if opt.includefield:
-            include_fields = opt.includefield
-        if opt.excludefield:
-            exclude_fields = opt.excludefield
-        if opt.extrafield:
-            extra_fields = opt.extrafield
-
-        buglist = bz.getbugs([b.bug_id for b in buglist],
-                include_fields=include_fields,
-                exclude_fields=exclude_fields,
-                extra_fields=extra_fields)
-        if opt.output == 'json':
-            _format_output_json(buglist)
-        if opt.output == 'raw':
-            _format_output_raw(buglist)
+        getval = _attr
+
+    def _extract(b):
+        val = getval(b)
+        if isinstance(val, list):
+            return ','.join([str(v or '') for v in val])
+        return str(val or '')
+    return _extract
+
+
+def _compile_outputformat(bz, outputformat, cvecache=None):
+    """
+    Compile an --outputformat string into a render plan: a list of
+    literal strings and field extractor functions, in output order.
+    The plan is built once and reused for every bug.
+    """
+    plan = []
+    pos = 0
+    for match in format_field_re.finditer(outputformat):
+        if match.start() > pos:
+            plan.append(outputformat[pos:match.start()])
+        fieldname, rest = match.groups()
+        plan.append(_make_field_extractor(bz, fieldname, rest, cvecache))
+        pos = match.end()
+    if pos < len(outputformat):
+        plan.append(outputformat[pos:])
+    return plan
+
+
+def _render_bug(plan, b):
+    return "".join([isinstance(piece, str) and piece or piece(b)
+                    for piece in plan])
+
+
+def _getbugs_field_kwargs(opt):
+    """
+    Turn --includefield etc. into getbugs() keyword arguments
+    """
+    return {
+        "include_fields": opt.includefield and opt.includefield[:] or None,
+        "exclude_fields": opt.excludefield and opt.excludefield[:] or None,
+        "extra_fields": opt.extrafield and opt.extrafield[:] or None,
+    }
+
+
+def _getbugs_chunked(bz, idlist, chunksize=1000, **kwargs):
+    """
+    Generator fetching full bugs for idlist with one getbugs() call
+    per chunk, so a huge ID list doesn't turn into one huge request
+    """
+    for start in range(0, len(idlist), chunksize):
+        yield from bz.getbugs(idlist[start:start + chunksize], **kwargs)
+
+
+def _format_output(bz, opt, buglist, refetch=True):
+    """
+    :param refetch: If True, buglist only has partial bug content, and
+        for raw/json output we need to fetch the full bugs.
+    """
+    if opt.output in ['raw', 'json', 'ndjson']:
+        if refetch:
+            buglist = _getbugs_chunked(bz,
+                [b.bug_id for b in buglist], **_getbugs_field_kwargs(opt))
+        # Rendering pulls the refetched bugs in, so this includes
+        # their requests
+        with _profile.phase("render"):
+            if opt.output == 'json':
+                _format_output_json(buglist)
+            if opt.output == 'ndjson':
+                _format_output_ndjson(buglist)
+            if opt.output == 'raw':
+                _format_output_raw(buglist)
         return
 
-    for b in buglist:
-        # pylint: disable=cell-var-from-loop
-        def cb(matchobj):
-            return _bug_field_repl_cb(bz, b, matchobj)
-        print(format_field_re.sub(cb, opt.outputformat))
+    cvecache = None
+    if "cve" in [f[0] for f in format_field_re.findall(opt.outputformat)]:
+        buglist = list(buglist)
+        cvecache = _fetch_cve_aliases(bz, buglist)
+
+    plan = _compile_outputformat(bz, opt.outputformat, cvecache)
+    write = sys.stdout.write
+    with _profile.phase("render"):
+        for b in buglist:
+            write(_render_bug(plan, b) + "\n")
 
 
 def _parse_triset(vallist, checkplus=True, checkminus=True, checkequal=True,
@@ -935,6 +1163,49 @@ def _do_new(bz, opt, parser):
     return [b]
 
 
+def _print_skipped_updates(ret):
+    for bugid, fields in (ret or {}).get("skipped", {}).items():
+        print("Bug %s: skipped unchanged %s" % (bugid, ",".join(fields)))
+
+
+def _read_bulk_updates(bz, parser, filename):
+    """
+    Parse the --from-file JSON lines into (ids, update) pairs
+    """
+    ret = []
+    with open(filename, "r") as fobj:
+        for lineno, line in enumerate(fobj, 1):
+            if not line.strip():
+                continue
+            try:
+                kwargs = json.loads(line)
+                ids = kwargs.pop("ids")
+                ret.append((ids, bz.build_update(**kwargs)))
+            except Exception as e:
+                parser.error("Invalid --from-file line %d: %s" %
+                             (lineno, e))
+    return ret
+
+
+def _do_modify_from_file(bz, parser, opt):
+    updates = _read_bulk_updates(bz, parser, opt.from_file)
+    results = bz.update_bugs_bulk(updates,
+        journal=opt.journal, max_rate=opt.max_rate,
+        skip_noop=opt.skip_noop)
+    for r in results:
+        _print_skipped_updates(r.get("result"))
+
+    failed = [r for r in results if "error" in r]
+    log.debug("Bulk update sent %d calls, %d failed",
+              len(results), len(failed))
+    for r in failed:
+        print("Failed to update bugs %s: %s" %
+              (",".join(str(i) for i in r["ids"]), r["error"]),
+              file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
 def _do_modify(bz, parser, opt):
     bugid_list = [bugid for a in opt.ids for bugid in a.split(',')]
 
@@ -1074,16 +1345,28 @@ def _do_modify(bz, parser, opt):
     log.debug("update bug dict=%s", update)
     log.debug("update whiteboard dict=%s", wbmap)
 
+    if opt.from_file:
+        if any([bugid_list, update, wbmap, add_tags, rm_tags]):
+            parser.error("--from-file can't be combined with bug IDs "
+                         "or other modify options")
+        _do_modify_from_file(bz, parser, opt)
+        return
+    if opt.journal or opt.max_rate:
+        parser.error("--journal and --max-rate require --from-file")
+
+    if not bugid_list:
+        parser.error("'modify' command requires bug IDs or --from-file")
     if not any([update, wbmap, add_tags, rm_tags]):
         parser.error("'modify' command requires additional arguments")
 
     if add_tags or rm_tags:
         ret = bz.update_tags(bugid_list,
             tags_add=add_tags, tags_remove=rm_tags)
-        log.debug("bz.update_tags returned=%s", ret)
+        log.debug("bz.update_tags returned=%s", log_truncate(ret))
     if update:
-        ret = bz.update_bugs(bugid_list, update)
-        log.debug("bz.update_bugs returned=%s", ret)
+        ret = bz.update_bugs(bugid_list, update, skip_noop=opt.skip_noop)
+        log.debug("bz.update_bugs returned=%s", log_truncate(ret))
+        _print_skipped_updates(ret)
 
     if not wbmap:
         return
@@ -1115,31 +1398,34 @@ def _do_modify(bz, parser, opt):
 
 
 def _do_get_attach(bz, opt):
-    data = {}
-
-    def _process_attachment_data(_attlist):
-        for _att in _attlist:
-            data[_att["id"]] = _att
-
-    if opt.getall:
-        for attlist in bz.get_attachments(opt.getall, None)["bugs"].values():
-            _process_attachment_data(attlist)
-    if opt.get:
-        _process_attachment_data(
-            bz.get_attachments(None, opt.get)["attachments"].values())
-
-    for attdata in data.values():
-        is_obsolete = attdata.get("is_obsolete", None) == 1
-        if opt.ignore_obsolete and is_obsolete:
-            continue
+    # Select attachments by their metadata, so only the content of the
+    # ones we keep is transferred
+    attachments = bz.find_attachments(opt.getall, opt.get,
+        obsolete=False if opt.ignore_obsolete else None,
+        is_patch=opt.patches_only or None,
+        content_type=opt.content_type,
+        file_name=opt.file_name,
+        max_size=opt.max_size)
+
+    # Pick the output names up front, so they don't depend on the
+    # order the concurrent downloads finish in
+    paths = []
+    for att in attachments:
+        with open_without_clobber(att["file_name"], "wb") as outfile:
+            paths.append(outfile.name)
 
-        att = bz.openattachment_data(attdata)
-        outfile = open_without_clobber(att.name, "wb")
-        data = att.read(4096)
-        while data:
-            outfile.write(data)
-            data = att.read(4096)
-        print("Wrote %s" % outfile.name)
+    try:
+        bz.download_attachments(
+            [(att["id"], path) for att, path in zip(attachments, paths)])
+    except BaseException:
+        # Don't leave behind files of downloads that never ran
+        for path in paths:
+            if os.path.exists(path) and not os.path.getsize(path):
+                os.unlink(path)
+        raise
+
+    for path in paths:
+        print("Wrote %s" % path)
 
 
 def _do_set_attach(bz, opt, parser):
@@ -1179,12 +1465,288 @@ def _do_set_attach(bz, opt, parser):
 
     _merge_field_opts(kwargs, opt.fields, opt.field_jsons, parser)
 
-    # Upload attachments
-    for bugid in opt.ids:
-        attid = bz.attachfile(bugid, fileobj, desc, **kwargs)
+    # Upload the attachment to every bug with a single request, so the
+    # file is only read and encoded once
+    attids = bz.attachfile(opt.ids, fileobj, desc, **kwargs)
+    if not isinstance(attids, list):
+        attids = [attids]
+    if len(attids) != len(opt.ids):
+        # Old bugzilla versions don't report which bug got which ID
+        print("Created attachments %s on bugs %s" %
+              (", ".join(str(a) for a in attids), ", ".join(opt.ids)))
+        return
+    for attid, bugid in zip(attids, opt.ids):
         print("Created attachment %i on bug %s" % (attid, bugid))
 
 
+##########################
+# Batch and server modes #
+##########################
+
+class _ThreadLocalOutput(object):
+    """
+    Stand in for sys.stdout/sys.stderr that lets each thread capture
+    its output into its own buffer, so commands running in parallel
+    don't interleave their output. Threads that aren't capturing write
+    to the original stream.
+    """
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def start_capture(self):
+        self._local.buf = io.StringIO()
+
+    def stop_capture(self):
+        buf = self._local.buf
+        self._local.buf = None
+        return buf.getvalue()
+
+    def _target(self):
+        buf = getattr(self._local, "buf", None)
+        if buf is None:
+            return self._stream
+        return buf
+
+    def write(self, data):
+        return self._target().write(data)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _run_one_command(bz, parser, argv):
+    """
+    Parse and run a single command line over the already connected
+    bz instance.
+
+    :returns: The command's exit status
+    """
+    if argv and argv[0] == "bugzilla":
+        argv = argv[1:]
+
+    try:
+        opt = parser.parse_args(argv)
+        if opt.command in ["login", "batch", "serve"]:
+            parser.error("'%s' can't be run by batch or serve" %
+                         opt.command)
+        _run_command(bz, parser, opt)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except Exception as e:
+        log.debug("", exc_info=True)
+        try:
+            _exit_on_known_error(e)
+        except SystemExit as exitexc:
+            return exitexc.code
+        print("Error: %s" % e, file=sys.stderr)
+        return 1
+    return 0
+
+
+def _read_batch_commands(opt):
+    if opt.batch_file:
+        with open(opt.batch_file, "r") as fobj:
+            lines = fobj.readlines()
+    else:
+        lines = sys.stdin.readlines()
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        yield shlex.split(line)
+
+
+def _do_batch(bz, opt):
+    """
+    Handle the 'batch' subcommand
+    """
+    parser = setup_parser()
+    commands = list(_read_batch_commands(opt))
+    failed = 0
+
+    def _report(idx, status):
+        if status:
+            print("Command %d failed with status %s: %s" %
+                  (idx + 1, status,
+                   " ".join(shlex.quote(a) for a in commands[idx])),
+                  file=sys.stderr)
+        return bool(status)
+
+    if opt.parallel <= 1:
+        for idx, argv in enumerate(commands):
+            failed += _report(idx, _run_one_command(bz, parser, argv))
+    else:
+        stdout = sys.stdout
+        proxy = _ThreadLocalOutput(stdout)
+
+        def _run(argv):
+            proxy.start_capture()
+            try:
+                status = _run_one_command(bz, parser, argv)
+            finally:
+                out = proxy.stop_capture()
+            return status, out
+
+        sys.stdout = proxy
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                    opt.parallel) as executor:
+                futures = [executor.submit(_run, argv) for argv in commands]
+                for idx, future in enumerate(futures):
+                    status, out = future.result()
+                    stdout.write(out)
+                    stdout.flush()
+                    failed += _report(idx, status)
+        finally:
+            sys.stdout = stdout
+
+    if failed:
+        sys.exit(1)
+
+
+class _ClientStdin(io.StringIO):
+    """
+    Stand in for sys.stdin while 'bugzilla serve' runs a client's
+    command. It holds the input the client forwarded, and looks like a
+    terminal if there was none, so commands never read the server's
+    own stdin.
+    """
+    def __init__(self, data):
+        io.StringIO.__init__(self, data or "")
+        self._isatty = data is None
+
+    def isatty(self):
+        return self._isatty
+
+
+def _make_cli_server(bz, path):
+    """
+    Build the socketserver for 'bugzilla serve'. Clients send one JSON
+    object per line like {"argv": [...], "cwd": "...", "stdin": "..."},
+    and get back one JSON object per line like
+    {"status": 0, "stdout": "...", "stderr": "..."}.
+    Each client connection is handled in its own thread, all sharing
+    the one bz instance. Commands run one at a time, since they are
+    run in the client's working directory, with the client's stdin.
+    """
+    import socketserver
+
+    parser = setup_parser()
+    stdout = _ThreadLocalOutput(sys.stdout)
+    stderr = _ThreadLocalOutput(sys.stderr)
+    servercwd = os.getcwd()
+    runlock = threading.Lock()
+
+    def _run(request):
+        with runlock:
+            origstdin = sys.stdin
+            try:
+                os.chdir(request.get("cwd") or servercwd)
+            except OSError as e:
+                print("Error: %s" % e, file=sys.stderr)
+                return 1
+            sys.stdin = _ClientStdin(request.get("stdin"))
+            try:
+                return _run_one_command(bz, parser, request["argv"])
+            finally:
+                sys.stdin = origstdin
+                os.chdir(servercwd)
+
+    class _Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                request = json.loads(line.decode("utf-8"))
+                log.debug("serve: running %s in %s",
+                          request["argv"], request.get("cwd"))
+                stdout.start_capture()
+                stderr.start_capture()
+                try:
+                    status = _run(request)
+                finally:
+                    out = stdout.stop_capture()
+                    err = stderr.stop_capture()
+                reply = {"status": status, "stdout": out, "stderr": err}
+                self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+                self.wfile.flush()
+
+    class _Server(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+        def server_activate(self):
+            sys.stdout = stdout
+            sys.stderr = stderr
+            socketserver.ThreadingUnixStreamServer.server_activate(self)
+
+        def server_close(self):
+            socketserver.ThreadingUnixStreamServer.server_close(self)
+            sys.stdout = stdout._stream  # pylint: disable=protected-access
+            sys.stderr = stderr._stream  # pylint: disable=protected-access
+            if os.path.exists(path):
+                os.unlink(path)
+
+    if os.path.exists(path):
+        # Stale socket from a previous server. Refuse to clobber
+        # anything that isn't a socket
+        import stat
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            raise RuntimeError("%s exists and is not a socket" % path)
+        os.unlink(path)
+
+    # The socket gives full access to our logged in bugzilla session,
+    # so make it accessible by the current user only
+    oldmask = os.umask(0o177)
+    try:
+        return _Server(path, _Handler)
+    finally:
+        os.umask(oldmask)
+
+
+def _do_serve(bz, opt):
+    """
+    Handle the 'serve' subcommand
+    """
+    server = _make_cli_server(bz, opt.serve_socket)
+    log.info("Listening on %s", opt.serve_socket)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def _run_socket_client(path, argv, opt):
+    """
+    Send argv to a 'bugzilla serve' process, print its output, and
+    return the exit status. The server runs the command in our working
+    directory, and gets our piped stdin if the command reads it.
+    """
+    request = {"argv": argv, "cwd": os.getcwd()}
+    # Only 'attach' uploads read stdin. Don't consume it for other
+    # commands, which may be run in a loop that reads stdin itself
+    reads_stdin = (opt.command == "attach" and
+                   not (opt.get or opt.getall))
+    if reads_stdin and not sys.stdin.isatty():
+        request["stdin"] = sys.stdin.read()
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as fobj:
+            reply = json.loads(fobj.readline().decode("utf-8"))
+
+    sys.stdout.write(reply["stdout"])
+    sys.stderr.write(reply["stderr"])
+    return reply["status"]
+
+
 #################
 # Main handling #
 #################
@@ -1249,11 +1811,59 @@ def _handle_login(opt, action, bz):
         sys.exit(0)
 
 
+def _run_command(bz, parser, opt):
+    """
+    Run the command described by parsed options opt
+    """
+    action = opt.command
+    if hasattr(opt, "outputformat"):
+        if (not opt.outputformat and
+                opt.output not in ['raw', 'json', 'ndjson', None]):
+            opt.outputformat = _convert_to_outputformat(opt.output)
+
+    with bz.timeout(opt.timeout):
+        buglist = []
+        if action == 'info':
+            _do_info(bz, opt)
+
+        elif action == 'query':
+            buglist = _do_query(bz, opt, parser)
+
+        elif action == 'new':
+            buglist = _do_new(bz, opt, parser)
+
+        elif action == 'attach':
+            if opt.get or opt.getall:
+                if opt.ids:
+                    parser.error("Bug IDs '%s' not used for "
+                        "getting attachments" % opt.ids)
+                _do_get_attach(bz, opt)
+            else:
+                _do_set_attach(bz, opt, parser)
+
+        elif action == 'modify':
+            _do_modify(bz, parser, opt)
+        else:  # pragma: no cover
+            raise RuntimeError("Unexpected action '%s'" % action)
+
+        # If we're doing new/query/modify, output our results
+        if action in ['new', 'query']:
+            # query already fetched the full bug content
+            _format_output(bz, opt, buglist, refetch=(action != 'query'))
+
+
 def _main(unittest_bz_instance):
     parser = setup_parser()
     opt = parser.parse_args()
     action = opt.command
+
+    if opt.socket and action != "serve":
+        # Let the server do all the work
+        sys.exit(_run_socket_client(opt.socket, sys.argv[1:], opt))
+
     setup_logging(opt.debug, opt.verbose)
+    if opt.profile or opt.profile_output:
+        _profile.enable(opt.profile_output)
 
     log.debug("Launched with command line: %s", " ".join(sys.argv))
     log.debug("Bugzilla module: %s", bugzilla)
@@ -1271,67 +1881,57 @@ def _main(unittest_bz_instance):
     # Run the actual commands #
     ###########################
 
-    if hasattr(opt, "outputformat"):
-        if not opt.outputformat and opt.output not in ['raw', 'json', None]:
-            opt.outputformat = _convert_to_outputformat(opt.output)
-
-    buglist = []
-    if action == 'info':
-        _do_info(bz, opt)
-
-    elif action == 'query':
-        buglist = _do_query(bz, opt, parser)
-
-    elif action == 'new':
-        buglist = _do_new(bz, opt, parser)
-
-    elif action == 'attach':
-        if opt.get or opt.getall:
-            if opt.ids:
-                parser.error("Bug IDs '%s' not used for "
-                    "getting attachments" % opt.ids)
-            _do_get_attach(bz, opt)
-        else:
-            _do_set_attach(bz, opt, parser)
-
-    elif action == 'modify':
-        _do_modify(bz, parser, opt)
-    else:  # pragma: no cover
-        raise RuntimeError("Unexpected action '%s'" % action)
+    if action == 'batch':
+        _do_batch(bz, opt)
+    elif action == 'serve':
+        _do_serve(bz, opt)
+    else:
+        _run_command(bz, parser, opt)
 
-    # If we're doing new/query/modify, output our results
-    if action in ['new', 'query']:
-        _format_output(bz, opt, buglist)
 
+def _exit_on_known_error(e):
+    """
+    Print a friendly message and exit for expected error types.
+    requests and xmlrpc.client are only imported here, when an error
+    actually happened, to keep CLI startup fast.
+    """
+    import xmlrpc.client
+    import requests.exceptions
 
-def main(unittest_bz_instance=None):
-    try:
-        try:
-            return _main(unittest_bz_instance)
-        except (Exception, KeyboardInterrupt):
-            log.debug("", exc_info=True)
-            raise
-    except KeyboardInterrupt:
-        print("\nExited at user request.")
-        sys.exit(1)
-    except (xmlrpc.client.Fault, bugzilla.BugzillaError) as e:
+    if isinstance(e, (xmlrpc.client.Fault, bugzilla.BugzillaError)):
         print("\nServer error: %s" % str(e))
         sys.exit(3)
-    except requests.exceptions.SSLError as e:
+    if isinstance(e, requests.exceptions.SSLError):
         # Give SSL recommendations
         print("SSL error: %s" % e)
         print("\nIf you trust the remote server, you can work "
               "around this error with:\n"
               "  bugzilla --nosslverify ...")
         sys.exit(4)
-    except (socket.error,
+    if isinstance(e, (socket.error,
             requests.exceptions.HTTPError,
             requests.exceptions.ConnectionError,
             requests.exceptions.InvalidURL,
-            xmlrpc.client.ProtocolError) as e:
+            requests.exceptions.Timeout,
+            xmlrpc.client.ProtocolError)):
         print("\nConnection lost/failed: %s" % str(e))
         sys.exit(2)
 
 
+def main(unittest_bz_instance=None):
+    try:
+        try:
+            return _main(unittest_bz_instance)
+        except (Exception, KeyboardInterrupt):
+            log.debug("", exc_info=True)
+            raise
+    except KeyboardInterrupt:
+        print("\nExited at user request.")
+        sys.exit(1)
+    except Exception as e:
+        _exit_on_known_error(e)
+        raise
+
+
 def cli():
     main()
@@ -0,0 +1,198 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+"""
+Opt-in phase profiling, enabled with 'bugzilla --profile' or
+PYTHONBUGZILLA_PROFILE for library users.
+
+The library reports time spent in a few coarse phases (connect, login,
+request, decode, construct, render) plus transferred bytes. At exit a
+summary table is printed to stderr. If an output prefix is given, a
+cProfile dump is written to PREFIX.pstats, and a JSON trace to
+PREFIX.json that chrome://tracing and Perfetto can load.
+
+When profiling is off, every instrumentation point costs one global
+lookup.
+"""
+
+import atexit
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+
+# The active _Profiler, or None
+active = None
+_lock = threading.Lock()
+
+
+class _NullPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase(object):
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._profiler.add_time(self._name, self._start, trace=True)
+        return False
+
+
+class _Profiler(object):
+    """
+    Thread safe accumulator of per phase call counts and times
+    """
+    # Cap on recorded trace events, so long runs don't grow unbounded
+    MAX_EVENTS = 100000
+
+    def __init__(self, output=None):
+        self.output = output
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._phases = collections.OrderedDict()
+        self._bytes = {"requests": 0, "sent_bytes": 0, "received_bytes": 0}
+        self._events = []
+        self._cprofile = None
+        if output:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def add_time(self, name, start, trace=False):
+        """
+        Account the time since the time.perf_counter() value start
+        to phase name. trace=True also records a trace event
+        """
+        end = time.perf_counter()
+        with self._lock:
+            counts = self._phases.setdefault(name, [0, 0.0])
+            counts[0] += 1
+            counts[1] += end - start
+            if trace and len(self._events) < self.MAX_EVENTS:
+                self._events.append({
+                    "name": name, "ph": "X", "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "ts": round((start - self._start) * 1000000, 1),
+                    "dur": round((end - start) * 1000000, 1),
+                })
+
+    def add_bytes(self, sent, received):
+        with self._lock:
+            self._bytes["requests"] += 1
+            self._bytes["sent_bytes"] += sent
+            self._bytes["received_bytes"] += received
+
+    def get_summary(self):
+        with self._lock:
+            ret = {"wall_seconds": time.perf_counter() - self._start,
+                   "phases": collections.OrderedDict()}
+            for name, (calls, seconds) in self._phases.items():
+                ret["phases"][name] = {"calls": calls, "seconds": seconds}
+            ret.update(self._bytes)
+        return ret
+
+    def format_summary(self):
+        summary = self.get_summary()
+        wall = summary["wall_seconds"] or 1
+        lines = ["python-bugzilla profile, %.3fs wall time" %
+                 summary["wall_seconds"],
+                 "%-12s %8s %10s %7s" % ("phase", "calls", "seconds", "wall")]
+        for name, info in summary["phases"].items():
+            lines.append("%-12s %8d %10.3f %6.1f%%" % (
+                name, info["calls"], info["seconds"],
+                info["seconds"] * 100 / wall))
+        lines.append("%d requests, %d bytes sent, %d bytes received" % (
+            summary["requests"], summary["sent_bytes"],
+            summary["received_bytes"]))
+        lines.append("Phases nest, connect includes its requests for "
+                     "example, so they don't add up to 100%.")
+        return "\n".join(lines)
+
+    def finish(self):
+        """
+        Stop profiling, write any output files, and print the summary
+        to stderr
+        """
+        if self._cprofile:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.output + ".pstats")
+            with open(self.output + ".json", "w") as fobj:
+                with self._lock:
+                    events = list(self._events)
+                json.dump({"traceEvents": events,
+                           "summary": self.get_summary()}, fobj)
+        sys.stderr.write(self.format_summary() + "\n")
+        if self.output:
+            sys.stderr.write("Wrote %s.pstats and %s.json\n" %
+                             (self.output, self.output))
+
+
+def phase(name):
+    """
+    Context manager timing its block as phase name, a no-op if
+    profiling is disabled
+    """
+    if active is None:
+        return _NULL_PHASE
+    return _Phase(active, name)
+
+
+def enable(output=None):
+    """
+    Start profiling, if it isn't already. Results are reported at
+    process exit, or by disable().
+
+    :param output: If set, the path prefix for the .pstats and .json
+        output files
+    """
+    global active  # pylint: disable=global-statement
+    with _lock:
+        if active is None:
+            active = _Profiler(output)
+            atexit.register(disable)
+        return active
+
+
+def enable_from_env():
+    """
+    Enable profiling if $PYTHONBUGZILLA_PROFILE is set. "1" only prints
+    the summary, any other value is used as the output path prefix
+    """
+    value = os.environ.get("PYTHONBUGZILLA_PROFILE")
+    if not value or value == "0":
+        return
+    enable(None if value == "1" else value)
+
+
+def disable():
+    """
+    Stop profiling and report the results.
+
+    :returns: The summary dict, or None if profiling wasn't enabled
+    """
+    global active  # pylint: disable=global-statement
+    with _lock:
+        profiler = active
+        active = None
+    if profiler is None:
+        return None
+    atexit.unregister(disable)
+    profiler.finish()
+    return profiler.get_summary()
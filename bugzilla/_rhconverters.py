@@ -8,7 +8,7 @@
 
 from logging import getLogger
 
-from ._util import listify
+from ._util import listify, log_truncate
 
 log = getLogger(__name__)
 
@@ -93,7 +93,8 @@ class _RHBugzillaConverters(object):
             query['include_fields'] = query.pop('column_list')
 
         if old != query:
-            log.debug("RHBugzilla pretranslated query to: %s", query)
+            log.debug("RHBugzilla pretranslated query to: %s",
+                      log_truncate(query))
 
     @staticmethod
     def post_translation(query, bug):
@@ -1,27 +1,141 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import collections
+import concurrent.futures
+import contextlib
+import gzip
 from logging import getLogger
 
 import os
 import sys
+import threading
+import time
 import urllib.parse
 
 import requests
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
 
-from .exceptions import BugzillaHTTPError
+from . import _profile
 
 log = getLogger(__name__)
 
 
+class BugzillaHTTPError(requests.HTTPError):
+    """Error raised in the Bugzilla session"""
+
+
+def _body_len(data):
+    if isinstance(data, (bytes, str)) or hasattr(data, "read"):
+        return len(data)
+    return 0
+
+
+# Per-thread deadline state for _deadline_scope
+_deadline_local = threading.local()
+
+
+def _get_deadline():
+    return getattr(_deadline_local, "deadline", None)
+
+
+@contextlib.contextmanager
+def _deadline_scope(seconds=None, deadline=None):
+    """
+    Bound the total time of every request this thread makes inside the
+    block. Nested scopes can only shorten an outer deadline, never
+    extend it. seconds=None and deadline=None is a no-op.
+
+    :param seconds: Relative timeout from now
+    :param deadline: Absolute time.monotonic() value, used to hand an
+        existing deadline over to worker threads
+    """
+    if seconds is not None:
+        deadline = time.monotonic() + float(seconds)
+    outer = _get_deadline()
+    if deadline is None or (outer is not None and outer <= deadline):
+        yield
+        return
+
+    _deadline_local.deadline = deadline
+    try:
+        yield
+    finally:
+        _deadline_local.deadline = outer
+
+
+class _TransferStats(object):
+    """
+    Per-request record of sent and received byte counts, before and
+    after compression, so the effect of compression can be verified.
+    """
+    # How many individual request records to keep around
+    MAX_RECORDS = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = collections.deque(maxlen=self.MAX_RECORDS)
+        self._totals = {
+            "requests": 0,
+            "sent_bytes": 0,
+            "sent_wire_bytes": 0,
+            "received_bytes": 0,
+            "received_wire_bytes": 0,
+        }
+
+    def record(self, method, url, sent_bytes, sent_wire_bytes, response):
+        received_bytes = len(response.content or b"")
+        received_wire_bytes = received_bytes
+        try:
+            # urllib3 counts the raw, still compressed bytes off the wire
+            received_wire_bytes = int(response.raw.tell()) or received_bytes
+        except Exception:
+            pass
+
+        rec = {
+            "method": method,
+            "url": urllib.parse.urlparse(url)._replace(query="").geturl(),
+            "content_encoding": response.headers.get("Content-Encoding"),
+            "sent_bytes": sent_bytes,
+            "sent_wire_bytes": sent_wire_bytes,
+            "received_bytes": received_bytes,
+            "received_wire_bytes": received_wire_bytes,
+        }
+        with self._lock:
+            self._records.append(rec)
+            self._totals["requests"] += 1
+            for key in ["sent_bytes", "sent_wire_bytes",
+                        "received_bytes", "received_wire_bytes"]:
+                self._totals[key] += rec[key]
+
+    def get(self):
+        with self._lock:
+            ret = self._totals.copy()
+            ret["records"] = list(self._records)
+        return ret
+
+
 class _BugzillaSession(object):
     """
     Class to handle the backend agnostic 'requests' setup
     """
+    # Apache's default LimitRequestLine is 8190 bytes, which includes
+    # the method and protocol. Leave some headroom for proxies
+    DEFAULT_MAX_URL_LENGTH = 7000
+    DEFAULT_MAX_WORKERS = 8
+    # Request bodies smaller than this aren't worth compressing
+    COMPRESS_MIN_SIZE = 64 * 1024
+
     def __init__(self, url, user_agent,
             sslverify, cert, tokencache, api_key,
             is_redhat_bugzilla,
-            requests_session=None):
+            requests_session=None,
+            max_url_length=None,
+            compress_requests=False,
+            pool_connections=None, pool_maxsize=None,
+            keepalive=None, connect_timeout=None,
+            timeout=None,
+            cassette_recorder=None, cassette_player=None):
         self._url = url
         self._user_agent = user_agent
         self._scheme = urllib.parse.urlparse(url)[0]
@@ -29,6 +143,15 @@ class _BugzillaSession(object):
         self._api_key = api_key
         self._is_xmlrpc = False
         self._use_auth_bearer = False
+        self._max_url_length = max_url_length or self.DEFAULT_MAX_URL_LENGTH
+        self._max_workers = pool_maxsize or self.DEFAULT_MAX_WORKERS
+        self._connect_timeout = connect_timeout
+        self._timeout = self._get_default_timeout(timeout)
+        self._compress_requests = compress_requests
+        self._transfer_stats = _TransferStats()
+
+        self._recorder = cassette_recorder
+        self._player = cassette_player
 
         if self._scheme not in ["http", "https"]:
             raise ValueError("Invalid URL scheme: %s (%s)" % (
@@ -37,6 +160,11 @@ class _BugzillaSession(object):
         self._session = requests_session
         if not self._session:
             self._session = requests.Session()
+        if (not requests_session or
+            pool_connections is not None or pool_maxsize is not None):
+            self._mount_adapters(pool_connections, pool_maxsize)
+        if keepalive is False:
+            self._session.headers["Connection"] = "close"
 
         if cert:
             self._session.cert = cert
@@ -49,14 +177,46 @@ class _BugzillaSession(object):
             self._session.headers["Authorization"] = (
                 "Bearer %s" % self._api_key)
 
-    def _get_timeout(self):
+    def _mount_adapters(self, pool_connections, pool_maxsize):
+        # pool_block=True makes threads beyond pool_maxsize wait for a
+        # free connection, rather than opening extra connections that
+        # are thrown away afterwards, so a busy thread pool doesn't
+        # churn through TCP/TLS handshakes.
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections or DEFAULT_POOLSIZE,
+            pool_maxsize=pool_maxsize or DEFAULT_POOLSIZE,
+            pool_block=True)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def _get_default_timeout(self, timeout):
         # Default to 5 minutes. This is longer than bugzilla.redhat.com's
         # apparent 3 minute timeout so shouldn't affect legitimate usage,
         # but saves us from indefinite hangs
         DEFAULT_TIMEOUT = 300
+        if timeout is not None:
+            return float(timeout)
         envtimeout = os.environ.get("PYTHONBUGZILLA_REQUESTS_TIMEOUT")
         return float(envtimeout or DEFAULT_TIMEOUT)
 
+    def _get_timeout(self):
+        """
+        Return the timeout for the next request: the per-request default,
+        shortened to whatever is left of the thread's deadline.
+        """
+        timeout = self._timeout
+        deadline = _get_deadline()
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise requests.exceptions.Timeout(
+                    "Deadline exceeded before sending request")
+            timeout = min(timeout, remaining)
+
+        if self._connect_timeout:
+            return (min(self._connect_timeout, timeout), timeout)
+        return timeout
+
     def set_rest_defaults(self):
         self._session.headers["Content-Type"] = "application/json"
     def set_xmlrpc_defaults(self):
@@ -67,6 +227,8 @@ class _BugzillaSession(object):
         return self._user_agent
     def get_scheme(self):
         return self._scheme
+    def get_max_url_length(self):
+        return self._max_url_length
 
     def get_auth_params(self):
         # bugzilla.redhat.com will error if there's auth bits in params
@@ -93,13 +255,98 @@ class _BugzillaSession(object):
     def get_requests_session(self):
         return self._session
 
-    def request(self, *args, **kwargs):
-        timeout = self._get_timeout()
+    def get_transfer_stats(self):
+        return self._transfer_stats.get()
+
+    def _get_secrets(self):
+        # Values to scrub from recorded traffic
+        return [self._api_key, self._tokencache.get_value(self._url)]
+
+    def _send(self, method, url, kwargs, sendkwargs):
+        """
+        Send the request, or answer it from the replay cassette, and
+        record the exchange if recording
+        """
+        if self._player:
+            return self._player.play(method, url, kwargs, self._get_secrets())
+
+        start = time.monotonic()
+        response = self._session.request(method, url, **(sendkwargs or kwargs))
+        if self._recorder:
+            self._recorder.record(method, url, kwargs, response,
+                                  time.monotonic() - start,
+                                  self._get_secrets())
+        return response
+
+    def _compress_request_body(self, kwargs):
+        """
+        If request compression is enabled and the body is big enough,
+        return a copy of kwargs with a gzipped body, otherwise None
+        """
+        data = kwargs.get("data")
+        if (not self._compress_requests or
+            not isinstance(data, (bytes, str)) or
+            _body_len(data) < self.COMPRESS_MIN_SIZE):
+            return None
+
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        newkwargs = kwargs.copy()
+        newkwargs["data"] = gzip.compress(data, compresslevel=6)
+        newkwargs["headers"] = dict(kwargs.get("headers") or {})
+        newkwargs["headers"]["Content-Encoding"] = "gzip"
+        return newkwargs
+
+    def run_concurrently(self, func, arglist):
+        """
+        Call func(arg) for every arg in arglist over a thread pool, and
+        return the results in arglist order. If any call raises an
+        exception, outstanding calls are cancelled and it is re-raised.
+
+        The calling thread's deadline applies to every worker, so the
+        whole fan out is bounded by it.
+        """
+        arglist = list(arglist)
+        if len(arglist) <= 1:
+            return [func(arg) for arg in arglist]
+
+        deadline = _get_deadline()
+        cancelled = threading.Event()
+
+        def _run(arg):
+            if cancelled.is_set():
+                raise concurrent.futures.CancelledError()
+            with _deadline_scope(deadline=deadline):
+                return func(arg)
+
+        workers = min(len(arglist), self._max_workers)
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = [executor.submit(_run, arg) for arg in arglist]
+            try:
+                return [f.result() for f in futures]
+            except BaseException:
+                cancelled.set()
+                for f in futures:
+                    f.cancel()
+                raise
+
+    def request(self, method, url, **kwargs):
         if "timeout" not in kwargs:
-            kwargs["timeout"] = timeout
+            kwargs["timeout"] = self._get_timeout()
 
+        sendkwargs = self._compress_request_body(kwargs)
+        profiler = _profile.active
+        start = profiler and time.perf_counter()
         try:
-            response = self._session.request(*args, **kwargs)
+            if sendkwargs:
+                response = self._send(method, url, kwargs, sendkwargs)
+                if response.status_code == 415:
+                    log.debug("Server rejected gzip request body, "
+                              "disabling request compression")
+                    self._compress_requests = False
+                    sendkwargs = None
+            if not sendkwargs:
+                response = self._send(method, url, kwargs, None)
 
             if self._is_xmlrpc:
                 # This still appears to matter for properly decoding unicode
@@ -116,6 +363,20 @@ class _BugzillaSession(object):
                     message, response=response).with_traceback(
                         sys.exc_info()[2])
             raise type(e)(message).with_traceback(sys.exc_info()[2])
+        finally:
+            if profiler:
+                profiler.add_time("request", start, trace=True)
 
-
+        if profiler:
+            # Streamed bodies haven't been read yet, go by the header
+            received = (int(response.headers.get("Content-Length") or 0)
+                        if kwargs.get("stream") else len(response.content))
+            profiler.add_bytes(_body_len(kwargs.get("data")), received)
+        if not kwargs.get("stream"):
+            # Recording a streamed response would force reading it all
+            self._transfer_stats.record(
+                response.request.method, response.request.url,
+                _body_len(kwargs.get("data")),
+                _body_len((sendkwargs or kwargs).get("data")),
+                response)
         return response
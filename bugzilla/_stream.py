@@ -0,0 +1,324 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+"""
+Helpers for moving attachment data between the network and files
+without holding the whole content in memory
+"""
+
+import base64
+import hashlib
+import io
+import json
+import mmap
+import os
+import re
+import stat
+import xml.parsers.expat
+
+
+# Size of the reads from the response body
+CHUNK_SIZE = 64 * 1024
+# Raw bytes encoded at a time for uploads. A multiple of 3, so every
+# chunk encodes to base64 without padding
+UPLOAD_CHUNK_SIZE = 3 * 16 * 1024
+
+_JSON_UNESCAPE = {
+    b"/": b"/", b"\\": b"\\", b'"': b'"',
+    b"n": b"\n", b"r": b"\r", b"t": b"\t",
+}
+_JSON_SPECIAL_RE = re.compile(br'["\\]')
+
+
+class _Base64StreamDecoder(object):
+    """
+    Decode base64 text fed in arbitrary pieces, writing the decoded
+    bytes to fileobj as soon as whole 4 character groups are available
+    """
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._pending = b""
+        self.size = 0
+
+    def feed(self, text):
+        if isinstance(text, str):
+            text = text.encode("ascii")
+        data = self._pending + text.translate(None, b" \t\r\n")
+        usable = len(data) - (len(data) % 4)
+        self._pending = data[usable:]
+        if usable:
+            out = base64.b64decode(data[:usable])
+            self._fileobj.write(out)
+            self.size += len(out)
+
+    def close(self):
+        if self._pending:
+            raise ValueError("Truncated base64 attachment data")
+        return self.size
+
+
+class _JSONValueScanner(object):
+    """
+    Incremental scanner over a JSON document, passing the contents of
+    the first string value of the given key to callback. Only the
+    document text before that value is buffered, so the error payload
+    can be parsed if the key never shows up.
+    """
+    def __init__(self, key, callback):
+        self._key = key
+        self._callback = callback
+        self._state = "out"
+        self._escape = False
+        self._string = []
+        self._last_string = None
+        self._want_value = False
+        self._head = []
+        self.found = False
+
+    def get_head(self):
+        return b"".join(self._head)
+
+    def feed(self, data):
+        if not self.found:
+            self._head.append(data)
+
+        idx = 0
+        while idx < len(data):
+            if self._state == "value":
+                idx = self._feed_value(data, idx)
+            elif self._state == "string":
+                idx = self._feed_string(data, idx)
+            else:
+                idx = self._feed_out(data, idx)
+
+    def _feed_out(self, data, idx):
+        char = data[idx:idx + 1]
+        if char == b'"':
+            if self._want_value:
+                self._state = "value"
+                self.found = True
+                self._head = []
+            else:
+                self._state = "string"
+                self._string = []
+        elif char == b":":
+            self._want_value = self._last_string == self._key
+        elif not char.isspace():
+            self._want_value = False
+            self._last_string = None
+        return idx + 1
+
+    def _feed_string(self, data, idx):
+        char = data[idx:idx + 1]
+        if self._escape:
+            self._escape = False
+            self._string.append(char)
+        elif char == b"\\":
+            self._escape = True
+        elif char == b'"':
+            self._state = "out"
+            self._last_string = b"".join(self._string)
+        else:
+            self._string.append(char)
+        return idx + 1
+
+    def _feed_value(self, data, idx):
+        if self._escape:
+            self._escape = False
+            self._callback(_JSON_UNESCAPE.get(data[idx:idx + 1], b""))
+            return idx + 1
+
+        match = _JSON_SPECIAL_RE.search(data, idx)
+        if not match:
+            self._callback(data[idx:])
+            return len(data)
+
+        end = match.start()
+        if end > idx:
+            self._callback(data[idx:end])
+        if data[end:end + 1] == b'"':
+            self._state = "out"
+            self._want_value = False
+            self._last_string = None
+        else:
+            self._escape = True
+        return end + 1
+
+
+def _stream_json_base64(chunks, fileobj, key="data"):
+    """
+    Decode the base64 string value of key in the JSON document read
+    from chunks into fileobj.
+
+    :returns: (size, head). size is the number of bytes written, or None
+        if key wasn't found. head is the document text, only returned
+        when key wasn't found.
+    """
+    decoder = _Base64StreamDecoder(fileobj)
+    scanner = _JSONValueScanner(key.encode("utf-8"), decoder.feed)
+    for chunk in chunks:
+        scanner.feed(chunk)
+    if not scanner.found:
+        return None, scanner.get_head()
+    return decoder.close(), None
+
+
+def _stream_xmlrpc_base64(chunks, fileobj):
+    """
+    Decode the <base64> value of an XMLRPC response read from chunks
+    into fileobj. Same return value as _stream_json_base64
+    """
+    decoder = _Base64StreamDecoder(fileobj)
+    state = {"inb64": False, "found": False}
+    head = []
+
+    def _start(name, _attrs):
+        if name == "base64":
+            state["inb64"] = True
+            state["found"] = True
+
+    def _end(name):
+        if name == "base64":
+            state["inb64"] = False
+
+    def _chardata(text):
+        if state["inb64"]:
+            decoder.feed(text)
+
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = _start
+    parser.EndElementHandler = _end
+    parser.CharacterDataHandler = _chardata
+    parser.buffer_text = True
+
+    for chunk in chunks:
+        if not state["found"]:
+            head.append(chunk)
+        parser.Parse(chunk, False)
+        if state["found"] and head:
+            head = []
+    parser.Parse(b"", True)
+
+    if not state["found"]:
+        return None, b"".join(head)
+    return decoder.close(), None
+
+
+class _UploadSource(object):
+    """
+    Attachment content to upload from an on disk file. The file is
+    memory mapped and base64 encoded one chunk at a time while the
+    request body is sent.
+    """
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._start = fileobj.tell()
+        self.size = os.fstat(fileobj.fileno()).st_size - self._start
+
+    @classmethod
+    def from_file(cls, fileobj):
+        """
+        Return an _UploadSource for fileobj, or None if it isn't a
+        binary, non-empty regular file that we can stream
+        """
+        if isinstance(fileobj, io.TextIOBase):
+            return None
+        try:
+            if not stat.S_ISREG(os.fstat(fileobj.fileno()).st_mode):
+                return None
+            ret = cls(fileobj)
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            return None
+        return ret.size > 0 and ret or None
+
+    def _iter_raw(self):
+        mm = mmap.mmap(self._fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mm)
+        try:
+            end = self._start + self.size
+            for offset in range(self._start, end, UPLOAD_CHUNK_SIZE):
+                # Released once the caller is done, so the map can close
+                with view[offset:min(offset + UPLOAD_CHUNK_SIZE,
+                                     end)] as chunk:
+                    yield chunk
+        finally:
+            view.release()
+            mm.close()
+
+    def sha256(self):
+        """
+        Return the hex sha256 digest of the content
+        """
+        digest = hashlib.sha256()
+        for chunk in self._iter_raw():
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def base64_len(self):
+        return 4 * ((self.size + 2) // 3)
+
+    def iter_base64(self):
+        for chunk in self._iter_raw():
+            yield base64.b64encode(chunk)
+
+    def read(self):
+        """
+        Return the whole content, for code paths that can't stream
+        """
+        with mmap.mmap(self._fileobj.fileno(), 0,
+                       access=mmap.ACCESS_READ) as mm:
+            return mm[self._start:self._start + self.size]
+
+
+class _Base64Body(object):
+    """
+    File-like request body of prefix + base64(source) + suffix, encoded
+    as it is read. The length is known up front, so requests sends a
+    Content-Length rather than using chunked encoding, which some
+    server setups refuse.
+    """
+    def __init__(self, prefix, source, suffix):
+        self._prefix = prefix
+        self._source = source
+        self._suffix = suffix
+        self._chunks = None
+        self._buf = b""
+
+    def __len__(self):
+        return (len(self._prefix) + self._source.base64_len() +
+                len(self._suffix))
+
+    def __iter__(self):
+        yield self._prefix
+        for chunk in self._source.iter_base64():
+            yield chunk
+        yield self._suffix
+
+    def read(self, size=-1):
+        if self._chunks is None:
+            self._chunks = iter(self)
+        if size is None or size < 0:
+            ret = self._buf + b"".join(self._chunks)
+            self._buf = b""
+            return ret
+
+        while len(self._buf) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buf += chunk
+        ret = self._buf[:size]
+        self._buf = self._buf[size:]
+        return ret
+
+
+def _json_base64_body(paramdict, key, source):
+    """
+    Return a streaming body for the JSON object paramdict, with key set
+    to the base64 encoded content of source
+    """
+    prefix = json.dumps(paramdict)[:-1]
+    if paramdict:
+        prefix += ", "
+    prefix += json.dumps(key) + ': "'
+    return _Base64Body(prefix.encode("utf-8"), source, b'"}')
@@ -0,0 +1,72 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+from ._util import listify
+
+
+# build_update() fields that take {"add": [], "remove": [], "set": []}
+_SET_FIELDS = ["blocks", "cc", "depends_on", "groups", "keywords",
+               "see_also"]
+# Fields that are a change every time they are sent
+_ALWAYS_CHANGES = ["comment", "flags", "reset_assigned_to",
+                   "reset_qa_contact", "work_time"]
+# Fields that only qualify the other changes in the update
+_MODIFIERS = ["comment_tags", "minor_update"]
+
+
+def _as_set(val):
+    return set(str(v) for v in (listify(val) or []))
+
+
+def _is_noop(key, newval, bugdata):
+    if key in _ALWAYS_CHANGES or key not in bugdata:
+        return False
+    oldval = bugdata[key]
+
+    if key in _SET_FIELDS and isinstance(newval, dict):
+        current = _as_set(oldval)
+        if not _as_set(newval.get("add")) <= current:
+            return False
+        if _as_set(newval.get("remove")) & current:
+            return False
+        if "set" in newval and _as_set(newval["set"]) != current:
+            return False
+        return True
+
+    if isinstance(oldval, list) or isinstance(newval, list):
+        # Some fields like rhbz 'version' are returned as lists
+        return _as_set(oldval) == _as_set(newval)
+    return oldval == newval
+
+
+def _get_compare_fields(update):
+    """
+    The bug fields that need to be fetched to diff this update
+    """
+    return [key for key in update
+            if key not in _ALWAYS_CHANGES and key not in _MODIFIERS]
+
+
+def _prune_noop_update(update, bugdata):
+    """
+    Drop the fields of update that wouldn't change the bug described
+    by the raw dict bugdata. Fields missing from bugdata are kept.
+
+    :returns: (pruned update dict, list of dropped field names). The
+        pruned update is empty if there is nothing left to change.
+    """
+    ret = {}
+    skipped = []
+    for key, val in update.items():
+        if key in _MODIFIERS:
+            continue
+        if _is_noop(key, val, bugdata):
+            skipped.append(key)
+        else:
+            ret[key] = val
+
+    if ret:
+        for key in _MODIFIERS:
+            if key in update:
+                ret[key] = update[key]
+    return ret, skipped
@@ -1,6 +1,8 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import reprlib
+
 
 def listify(val):
     """Ensure that value is either None or a list, converting single values
@@ -10,3 +12,45 @@ def listify(val):
     if isinstance(val, list):
         return val
     return [val]
+
+
+class _TruncatedLogValue(object):
+    """
+    Wrapper that formats its value only when the log message is
+    actually emitted, and caps the output length. The reprlib limits
+    keep it from ever building the full string of a huge payload
+    """
+    MAX_LENGTH = 2000
+
+    _repr = reprlib.Repr()
+    _repr.maxlevel = 4
+    _repr.maxdict = _repr.maxlist = _repr.maxtuple = _repr.maxset = 10
+    _repr.maxstring = _repr.maxother = 100
+
+    __slots__ = ["_value"]
+
+    def __init__(self, value):
+        self._value = value
+
+    def __str__(self):
+        value = self._value
+        if isinstance(value, (str, bytes)):
+            total = len(value)
+            text = value[:self.MAX_LENGTH]
+            if isinstance(text, bytes):
+                text = text.decode("utf-8", "replace")
+        else:
+            text = self._repr.repr(value)
+            total = len(text)
+            text = text[:self.MAX_LENGTH]
+        if total > self.MAX_LENGTH:
+            text += "... (%d more characters)" % (total - self.MAX_LENGTH)
+        return text
+
+
+def log_truncate(value):
+    """
+    Return value wrapped for use as a lazy, size capped log.debug()
+    argument, for API payloads that can be megabytes big
+    """
+    return _TruncatedLogValue(value)
@@ -7,25 +7,36 @@
 # See the COPYING file in the top-level directory.
 
 import collections
+import fnmatch
 import getpass
+import hashlib
 import locale
-from logging import getLogger
+from logging import getLogger, DEBUG
 import mimetypes
 import os
 import sys
+import threading
 import urllib.parse
 
 from io import BytesIO
 
+from . import _profile
+from ._attachcache import (_AttachmentCache,
+                           _default_attachment_cache_path)
 from ._authfiles import _BugzillaRCFile, _BugzillaTokenCache
+from ._bulk import _RateLimiter, _run_bulk_update
 from .apiversion import __version__
-from ._backendrest import _BackendREST
-from ._backendxmlrpc import _BackendXMLRPC
 from .bug import Bug, Group, User
 from .exceptions import BugzillaError
 from ._rhconverters import _RHBugzillaConverters
-from ._session import _BugzillaSession
-from ._util import listify
+from ._stream import _UploadSource
+from ._updatediff import _get_compare_fields, _prune_noop_update
+from ._util import listify, log_truncate
+
+# The backends and _session pull in 'requests' and 'xmlrpc.client',
+# which are slow to import. They are imported on first use, so things
+# like 'bugzilla --help' don't pay for them, and only the backend
+# that's actually used gets loaded.
 
 
 log = getLogger(__name__)
@@ -66,9 +77,11 @@ class _FieldAlias(object):
 class _BugzillaAPICache(object):
     """
     Helper class that holds cached API results for things like products,
-    components, etc.
+    components, etc. Hold 'lock' while reading and updating the cache,
+    since the owning Bugzilla instance may be shared between threads.
     """
     def __init__(self):
+        self.lock = threading.RLock()
         self.products = []
         self.component_names = {}
         self.bugfields = []
@@ -99,6 +112,13 @@ class Bugzilla(object):
 
     Another way to specify auth credentials is via a 'bugzillarc' file.
     See readconfig() documentation for details.
+
+    Once connected, a Bugzilla instance can be shared between threads,
+    including its product/component caches and login token cache.
+    For large thread pools, set pool_maxsize to the number of threads
+    so each thread can keep its own connection alive. connect(),
+    disconnect(), login() and logout() should not be called while
+    other threads are using the instance.
     """
     @staticmethod
     def url_to_query(url):
@@ -177,7 +197,14 @@ class Bugzilla(object):
     def __init__(self, url=-1, user=None, password=None, cookiefile=-1,
                  sslverify=True, tokenfile=-1, use_creds=True, api_key=None,
                  cert=None, configpaths=-1,
-                 force_rest=False, force_xmlrpc=False, requests_session=None):
+                 force_rest=False, force_xmlrpc=False, requests_session=None,
+                 force_hybrid=False, max_url_length=None,
+                 compress_requests=False,
+                 pool_connections=None, pool_maxsize=None,
+                 keepalive=None, connect_timeout=None, timeout=None,
+                 attachment_cache=None, attachment_cache_size=None,
+                 record_cassette=None, replay_cassette=None,
+                 replay_timing=False):
         """
         :param url: The bugzilla instance URL, which we will connect
             to immediately. Most users will want to specify this at
@@ -210,6 +237,55 @@ class Bugzilla(object):
         :param requests_session: An optional requests.Session object the
             API will use to contact the remote bugzilla instance. This
             way the API user can set up whatever auth bits they may need.
+        :param force_hybrid: Use both the REST and XMLRPC APIs over a
+            single connection, routing each call to the cheapest API for
+            it. The url can point at either API. If set to the string
+            "calibrate", time both APIs against the server at connect()
+            time and route each class of operation to the faster one.
+        :param max_url_length: Maximum length of a REST GET URL. Requests
+            for many bug IDs that would exceed it are transparently split
+            into multiple concurrent requests. If the other parameters,
+            like include_fields, don't fit on their own, BugzillaError
+            is raised. Defaults to 7000.
+        :param compress_requests: If True, gzip large request bodies, like
+            attachment uploads. If the server rejects them with
+            HTTP 415, we retry uncompressed and stop compressing.
+            Compressed responses need no option, the requests library
+            already asks for them.
+        :param pool_connections: Number of per-host connection pools
+            to cache. Defaults to 10.
+        :param pool_maxsize: Maximum number of connections kept open to
+            the bugzilla host. Threads beyond this count wait for a free
+            connection instead of opening throwaway ones. Defaults to 10.
+        :param keepalive: If False, close the connection after every
+            request. Defaults to True.
+        :param connect_timeout: Timeout in seconds for establishing the
+            TCP connection, separate from the response read timeout.
+        :param timeout: Per-request default timeout in seconds, applied
+            to each individual HTTP request. It is not a deadline for a
+            whole operation, a call that makes several requests can take
+            several times as long. Defaults to
+            $PYTHONBUGZILLA_REQUESTS_TIMEOUT if set, otherwise 300. To
+            bound the total time of an operation, pass timeout= to the
+            method, which every method that contacts the server accepts,
+            or use the timeout() context manager.
+        :param attachment_cache: Directory to cache attachment content
+            fetched by openattachment(), or True to use
+            ~/.cache/python-bugzilla/attachments. Cached attachments
+            are reused while their size and last_change_time are
+            unchanged, and are returned as on disk file objects rather
+            than in memory. Defaults to no caching.
+        :param attachment_cache_size: Maximum size in bytes of the
+            attachment cache. The least recently used attachments are
+            removed to stay under it. Defaults to 1GiB.
+        :param record_cassette: Path of a cassette file to record all the
+            HTTP requests and responses to, for later offline replay.
+            API keys, tokens, and passwords are scrubbed. If the path
+            ends with .gz the cassette is gzip compressed.
+        :param replay_cassette: Path of a recorded cassette. Requests are
+            answered from it, and nothing is sent over the network.
+        :param replay_timing: If True, replayed responses take as long
+            as they originally did.
         """
         if url == -1:
             raise TypeError("Specify a valid bugzilla url, or pass url=None")
@@ -234,6 +310,33 @@ class Bugzilla(object):
 
         self._force_rest = force_rest
         self._force_xmlrpc = force_xmlrpc
+        self._force_hybrid = force_hybrid
+        self._max_url_length = max_url_length
+        self._compress_requests = compress_requests
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._keepalive = keepalive
+        self._connect_timeout = connect_timeout
+        self._timeout = timeout
+
+        self._cassette_recorder = None
+        self._cassette_player = None
+        if record_cassette and replay_cassette:
+            raise TypeError("Can't both record and replay a cassette")
+        if record_cassette:
+            from ._cassette import _CassetteRecorder
+            self._cassette_recorder = _CassetteRecorder(record_cassette)
+        if replay_cassette:
+            from ._cassette import _CassettePlayer
+            self._cassette_player = _CassettePlayer(
+                replay_cassette, timing=replay_timing)
+
+        self._attachment_cache = None
+        if attachment_cache:
+            if attachment_cache is True:
+                attachment_cache = _default_attachment_cache_path()
+            self._attachment_cache = _AttachmentCache(
+                attachment_cache, attachment_cache_size)
 
         if cookiefile not in [None, -1]:
             raise TypeError("cookiefile is deprecated, don't pass any value.")
@@ -250,6 +353,9 @@ class Bugzilla(object):
         self._settokenfile(tokenfile)
         self._setconfigpath(configpaths)
 
+        # Profiling for library users, the CLI has --profile
+        _profile.enable_from_env()
+
         if url:
             self.connect(url)
 
@@ -411,6 +517,13 @@ class Bugzilla(object):
           [bugzilla.yoursite.com]
           api_key = key
 
+        Connection tuning values matching the pool_connections,
+        pool_maxsize, keepalive, and connect_timeout __init__ parameters
+        can be set there too, like:
+          [bugzilla.yoursite.com]
+          pool_maxsize = 64
+          connect_timeout = 5
+
         The file can have multiple sections for different bugzilla instances.
         A 'url' field in the [DEFAULT] section can be used to set a default
         URL for the bugzilla command line tool.
@@ -438,9 +551,23 @@ class Bugzilla(object):
             elif key == "cert" and (overwrite or not self.cert):
                 log.debug("bugzillarc: setting cert")
                 self.cert = val
+            elif key in self._RCFILE_CONNECTION_KEYS:
+                attrname = "_%s" % key
+                if overwrite or getattr(self, attrname) is None:
+                    log.debug("bugzillarc: setting %s=%s", key, val)
+                    setattr(self, attrname,
+                            self._RCFILE_CONNECTION_KEYS[key](val))
             else:
                 log.debug("bugzillarc: unknown key=%s", key)
 
+    # bugzillarc keys for connection tuning, mapped to their value parser
+    _RCFILE_CONNECTION_KEYS = {
+        "pool_connections": int,
+        "pool_maxsize": int,
+        "keepalive": lambda v: v.lower() in ["1", "true", "yes", "on"],
+        "connect_timeout": float,
+    }
+
     def _set_bz_version(self, version):
         self._cache.version_raw = version
         try:
@@ -454,26 +581,37 @@ class Bugzilla(object):
 
     def _get_backend_class(self, url):  # pragma: no cover
         # This is a hook for the test suite to do some mock hackery
-        if self._force_rest and self._force_xmlrpc:
-            raise BugzillaError(
-                "Cannot specify both force_rest and force_xmlrpc")
+        if len([f for f in [self._force_rest, self._force_xmlrpc,
+                            self._force_hybrid] if f]) > 1:
+            raise BugzillaError("Cannot specify more than one of "
+                "force_rest, force_xmlrpc, and force_hybrid")
 
         xmlurl = self.fix_url(url)
         if self._force_xmlrpc:
+            from ._backendxmlrpc import _BackendXMLRPC
             return _BackendXMLRPC, xmlurl
+        if self._force_hybrid:
+            from ._backendhybrid import (_BackendHybrid,
+                                         _xmlrpc_url_from_rest_url)
+            return _BackendHybrid, _xmlrpc_url_from_rest_url(xmlurl)
 
         resturl = self.fix_url(url, force_rest=self._force_rest)
         if self._force_rest:
+            from ._backendrest import _BackendREST
             return _BackendREST, resturl
 
         # Simple heuristic if the original url has a path in it
         if "/xmlrpc" in url:
+            from ._backendxmlrpc import _BackendXMLRPC
             return _BackendXMLRPC, xmlurl
         if "/rest" in url:
+            from ._backendrest import _BackendREST
             return _BackendREST, resturl
 
         # We were passed something like bugzilla.example.com but we
         # aren't sure which method to use, try probing
+        from ._backendrest import _BackendREST
+        from ._backendxmlrpc import _BackendXMLRPC
         if _BackendXMLRPC.probe(xmlurl):
             return _BackendXMLRPC, xmlurl
         if _BackendREST.probe(resturl):
@@ -497,6 +635,10 @@ class Bugzilla(object):
         if self._session:
             self.disconnect()
 
+        with _profile.phase("connect"):
+            self._connect(url)
+
+    def _connect(self, url):
         url = url or self.url
         backendclass, newurl = self._get_backend_class(url)
         if url != newurl:
@@ -510,14 +652,26 @@ class Bugzilla(object):
         # Detect if connecting to redhat bugzilla
         self._init_class_from_url()
 
+        from ._session import _BugzillaSession
         self._session = _BugzillaSession(self.url, self.user_agent,
                 sslverify=self._sslverify,
                 cert=self.cert,
                 tokencache=self._tokencache,
                 api_key=self.api_key,
                 is_redhat_bugzilla=self._is_redhat_bugzilla,
-                requests_session=self._user_requests_session)
+                requests_session=self._user_requests_session,
+                max_url_length=self._max_url_length,
+                compress_requests=self._compress_requests,
+                pool_connections=self._pool_connections,
+                pool_maxsize=self._pool_maxsize,
+                keepalive=self._keepalive,
+                connect_timeout=self._connect_timeout,
+                timeout=self._timeout,
+                cassette_recorder=self._cassette_recorder,
+                cassette_player=self._cassette_player)
         self._backend = backendclass(self.url, self._session)
+        if self._force_hybrid == "calibrate" and self._backend.is_hybrid():
+            self._backend.calibrate()  # pylint: disable=no-member
 
         if (self.user and self.password):
             log.info("user and password present - doing login()")
@@ -554,6 +708,13 @@ class Bugzilla(object):
         """
         return self._backend.is_rest()
 
+    def is_hybrid(self):
+        """
+        :returns: True if routing calls between both the REST
+            and XMLRPC APIs
+        """
+        return self._backend.is_hybrid()
+
     def get_requests_session(self):
         """
         Give API users access to the Requests.session object we use for
@@ -563,6 +724,38 @@ class Bugzilla(object):
         """
         return self._session.get_requests_session()
 
+    def get_transfer_stats(self):
+        """
+        Report how many bytes were sent and received by this connection,
+        both before and after any compression.
+
+        :returns: dict with 'requests', 'sent_bytes', 'sent_wire_bytes',
+            'received_bytes', and 'received_wire_bytes' totals, and a
+            'records' list with the same values for recent requests.
+        """
+        return self._session.get_transfer_stats()
+
+    def timeout(self, seconds):
+        """
+        Context manager that bounds the total time of every API call
+        made by the current thread inside the block, including all
+        the sub-requests of calls like a split getbugs(). Once the
+        deadline passes, requests.exceptions.Timeout is raised and
+        outstanding concurrent sub-requests are cancelled. Nested
+        scopes can only shorten the deadline. Example:
+
+            with bz.timeout(10):
+                bugs = bz.getbugs(idlist)
+                comments = bz.get_comments(idlist)
+
+        Every method that contacts the server also accepts a timeout=
+        keyword argument, which does the same for just that call.
+
+        :param seconds: Deadline in seconds from now. None means no limit.
+        """
+        from ._session import _deadline_scope
+        return _deadline_scope(seconds)
+
     def disconnect(self):
         """
         Disconnect from the given bugzilla instance.
@@ -571,7 +764,8 @@ class Bugzilla(object):
         self._session = None
         self._cache = _BugzillaAPICache()
 
-    def login(self, user=None, password=None, restrict_login=None):
+    def login(self, user=None, password=None, restrict_login=None,
+              timeout=None):
         """
         Attempt to log in using the given username and password. Subsequent
         method calls will use this username and password. Returns False if
@@ -588,6 +782,8 @@ class Bugzilla(object):
         This method will be called implicitly at the end of connect() if user
         and password are both set. So under most circumstances you won't need
         to call this yourself.
+
+        :param timeout: Bound the total time of the call, see timeout()
         """
         if self.api_key:
             raise ValueError("cannot login when using an API key")
@@ -605,18 +801,19 @@ class Bugzilla(object):
         payload = {"login": self.user}
         if restrict_login:
             payload['restrict_login'] = True
-        log.debug("logging in with options %s", str(payload))
+        log.debug("logging in with options %s", payload)
         payload['password'] = self.password
 
         try:
-            ret = self._backend.user_login(payload)
+            with _profile.phase("login"), self.timeout(timeout):
+                ret = self._backend.user_login(payload)
             self.password = ''
             log.info("login succeeded for user=%s", self.user)
             if "token" in ret:
                 self._tokencache.set_value(self.url, ret["token"])
             return ret
         except Exception as e:
-            log.debug("Login exception: %s", str(e), exc_info=True)
+            log.debug("Login exception: %s", e, exc_info=True)
             raise BugzillaError("Login failed: %s" %
                     BugzillaError.get_bugzilla_error_string(e)) from None
 
@@ -684,12 +881,15 @@ class Bugzilla(object):
                 msg += "See `man bugzilla` for more details."
         print(msg)
 
-    def logout(self):
+    def logout(self, timeout=None):
         """
         Log out of bugzilla. Drops server connection and user info, and
         destroys authentication cache
+
+        :param timeout: Bound the total time of the call, see timeout()
         """
-        self._backend.user_logout()
+        with self.timeout(timeout):
+            self._backend.user_logout()
         self.disconnect()
         self.user = ''
         self.password = ''
@@ -727,7 +927,7 @@ class Bugzilla(object):
     # Bugfields querying #
     ######################
 
-    def getbugfields(self, force_refresh=False, names=None):
+    def getbugfields(self, force_refresh=False, names=None, timeout=None):
         """
         Calls getBugFields, which returns a list of fields in each bug
         for this bugzilla instance. This can be used to set the list of attrs
@@ -736,6 +936,7 @@ class Bugzilla(object):
         :param force_refresh: If True, overwrite the bugfield cache
             with these newly checked values.
         :param names: Only check for the passed bug field names
+        :param timeout: Bound the total time of the call, see timeout()
         """
         def _fieldnames():
             data = {"include_fields": ["name"]}
@@ -744,13 +945,17 @@ class Bugzilla(object):
             r = self._backend.bug_fields(data)
             return [f['name'] for f in r['fields']]
 
-        if force_refresh or not self._cache.bugfields:
-            log.debug("Refreshing bugfields")
-            self._cache.bugfields = _fieldnames()
-            self._cache.bugfields.sort()
-            log.debug("bugfields = %s", self._cache.bugfields)
-
-        return self._cache.bugfields
+        with self._cache.lock:
+            if force_refresh or not self._cache.bugfields:
+                log.debug("Refreshing bugfields")
+                with self.timeout(timeout):
+                    bugfields = _fieldnames()
+                bugfields.sort()
+                self._cache.bugfields = bugfields
+                log.debug("bugfields = %s",
+                          log_truncate(self._cache.bugfields))
+
+            return self._cache.bugfields
     bugfields = property(fget=lambda self: self.getbugfields(),
                          fdel=lambda self: setattr(self, '_bugfields', None))
 
@@ -761,7 +966,7 @@ class Bugzilla(object):
 
     def product_get(self, ids=None, names=None,
                     include_fields=None, exclude_fields=None,
-                    ptype=None):
+                    ptype=None, timeout=None):
         """
         Raw wrapper around Product.get
         https://bugzilla.readthedocs.io/en/latest/api/core/v1/product.html#get-product
@@ -776,27 +981,12 @@ class Bugzilla(object):
             specified, we return data for all those
         @include_fields: Only include these fields in the output
         @exclude_fields: Do not include these fields in the output
+        @timeout: Bound the total time of the call, see timeout()
         """
         if ids is None and names is None and ptype is None:
             ptype = "accessible"
 
-        if ptype:
-            raw = None
-            if ptype == "accessible":
-                raw = self._backend.product_get_accessible()
-            elif ptype == "enterable":
-                raw = self._backend.product_get_enterable()
-            elif ptype == "selectable":
-                raw = self._backend.product_get_selectable()
-
-            if raw is None:
-                raise RuntimeError("Unknown ptype=%s" % ptype)
-            ids = raw['ids']
-            log.debug("For ptype=%s found ids=%s", ptype, ids)
-
         kwargs = {}
-        if ids:
-            kwargs["ids"] = listify(ids)
         if names:
             kwargs["names"] = listify(names)
         if include_fields:
@@ -804,7 +994,24 @@ class Bugzilla(object):
         if exclude_fields:
             kwargs["exclude_fields"] = exclude_fields
 
-        ret = self._backend.product_get(kwargs)
+        with self.timeout(timeout):
+            if ptype:
+                raw = None
+                if ptype == "accessible":
+                    raw = self._backend.product_get_accessible()
+                elif ptype == "enterable":
+                    raw = self._backend.product_get_enterable()
+                elif ptype == "selectable":
+                    raw = self._backend.product_get_selectable()
+
+                if raw is None:
+                    raise RuntimeError("Unknown ptype=%s" % ptype)
+                ids = raw['ids']
+                log.debug("For ptype=%s found ids=%s", ptype, ids)
+
+            if ids:
+                kwargs["ids"] = listify(ids)
+            ret = self._backend.product_get(kwargs)
         return ret['products']
 
     def refresh_products(self, **kwargs):
@@ -818,18 +1025,20 @@ class Bugzilla(object):
         info for products foo, bar, baz. Individual product fields are
         also updated.
         """
-        for product in self.product_get(**kwargs):
-            updated = False
-            for current in self._cache.products[:]:
-                if (current.get("id", -1) != product.get("id", -2) and
-                    current.get("name", -1) != product.get("name", -2)):
-                    continue
-
-                _nested_update(current, product)
-                updated = True
-                break
-            if not updated:
-                self._cache.products.append(product)
+        products = self.product_get(**kwargs)
+        with self._cache.lock:
+            for product in products:
+                updated = False
+                for current in self._cache.products[:]:
+                    if (current.get("id", -1) != product.get("id", -2) and
+                        current.get("name", -1) != product.get("name", -2)):
+                        continue
+
+                    _nested_update(current, product)
+                    updated = True
+                    break
+                if not updated:
+                    self._cache.products.append(product)
 
     def getproducts(self, force_refresh=False, **kwargs):
         """
@@ -842,9 +1051,10 @@ class Bugzilla(object):
 
         :param force_refresh: force refreshing via refresh_products()
         """
-        if force_refresh or not self._cache.products:
-            self.refresh_products(**kwargs)
-        return self._cache.products
+        with self._cache.lock:
+            if force_refresh or not self._cache.products:
+                self.refresh_products(**kwargs)
+            return self._cache.products
 
     products = property(
         fget=lambda self: self.getproducts(),
@@ -860,14 +1070,16 @@ class Bugzilla(object):
     def _lookup_product_in_cache(self, productname):
         prodstr = isinstance(productname, str) and productname or None
         prodint = isinstance(productname, int) and productname or None
-        for proddict in self._cache.products:
-            if prodstr == proddict.get("name", -1):
-                return proddict
-            if prodint == proddict.get("id", "nope"):
-                return proddict
+        with self._cache.lock:
+            for proddict in self._cache.products:
+                if prodstr == proddict.get("name", -1):
+                    return proddict
+                if prodint == proddict.get("id", "nope"):
+                    return proddict
         return {}
 
-    def getcomponentsdetails(self, product, force_refresh=False):
+    def getcomponentsdetails(self, product, force_refresh=False,
+                             timeout=None):
         """
         Wrapper around Product.get(include_fields=["components"]),
         returning only the "components" data for the requested product,
@@ -880,28 +1092,34 @@ class Bugzilla(object):
         In cases like bugzilla.redhat.com where there are tons of
         components for some products, this API will time out. You
         should use product_get instead.
-        """
-        proddict = self._lookup_product_in_cache(product)
 
-        if (force_refresh or not proddict or "components" not in proddict):
-            self.refresh_products(names=[product],
-                                  include_fields=["name", "id", "components"])
+        :param timeout: Bound the total time of the call, see timeout()
+        """
+        with self._cache.lock:
             proddict = self._lookup_product_in_cache(product)
 
-        ret = {}
-        for compdict in proddict["components"]:
-            ret[compdict["name"]] = compdict
-        return ret
+            if (force_refresh or not proddict or
+                "components" not in proddict):
+                self.refresh_products(names=[product],
+                    include_fields=["name", "id", "components"],
+                    timeout=timeout)
+                proddict = self._lookup_product_in_cache(product)
 
-    def getcomponentdetails(self, product, component, force_refresh=False):
+            ret = {}
+            for compdict in proddict["components"]:
+                ret[compdict["name"]] = compdict
+            return ret
+
+    def getcomponentdetails(self, product, component, force_refresh=False,
+                            timeout=None):
         """
         Helper for accessing a single component's info. This is a wrapper
         around getcomponentsdetails, see that for explanation
         """
-        d = self.getcomponentsdetails(product, force_refresh)
+        d = self.getcomponentsdetails(product, force_refresh, timeout=timeout)
         return d[component]
 
-    def getcomponents(self, product, force_refresh=False):
+    def getcomponents(self, product, force_refresh=False, timeout=None):
         """
         Return a list of component names for the passed product.
 
@@ -910,29 +1128,32 @@ class Bugzilla(object):
 
         :param force_refresh: Force refreshing the cache, and return
             the new data
+        :param timeout: Bound the total time of the call, see timeout()
         """
-        proddict = self._lookup_product_in_cache(product)
-        product_id = proddict.get("id", None)
-
-        if (force_refresh or product_id is None or
-            "components" not in proddict):
-            self.refresh_products(
-                names=[product],
-                include_fields=["name", "id", "components.name"])
+        with self._cache.lock:
             proddict = self._lookup_product_in_cache(product)
-            if "id" not in proddict:
-                raise BugzillaError("Product '%s' not found" % product)
-            product_id = proddict["id"]
-
-        if product_id not in self._cache.component_names:
-            names = []
-            for comp in proddict.get("components", []):
-                name = comp.get("name")
-                if name:
-                    names.append(name)
-            self._cache.component_names[product_id] = names
-
-        return self._cache.component_names[product_id]
+            product_id = proddict.get("id", None)
+
+            if (force_refresh or product_id is None or
+                "components" not in proddict):
+                self.refresh_products(
+                    names=[product],
+                    include_fields=["name", "id", "components.name"],
+                    timeout=timeout)
+                proddict = self._lookup_product_in_cache(product)
+                if "id" not in proddict:
+                    raise BugzillaError("Product '%s' not found" % product)
+                product_id = proddict["id"]
+
+            if product_id not in self._cache.component_names:
+                names = []
+                for comp in proddict.get("components", []):
+                    name = comp.get("name")
+                    if name:
+                        names.append(name)
+                self._cache.component_names[product_id] = names
+
+            return self._cache.component_names[product_id]
 
 
     ############################
@@ -961,7 +1182,7 @@ class Bugzilla(object):
             data["updates"] = updates
 
 
-    def addcomponent(self, data):
+    def addcomponent(self, data, timeout=None):
         """
         A method to create a component in Bugzilla. Takes a dict, with the
         following elements:
@@ -977,21 +1198,26 @@ class Bugzilla(object):
                                new bugs for the component.
         is_active: (optional) If False, the component is hidden from
                               the component list when filing new bugs.
+        timeout: Bound the total time of the call, see timeout()
         """
         data = data.copy()
         self._component_data_convert(data)
-        return self._backend.component_create(data)
+        with self.timeout(timeout):
+            return self._backend.component_create(data)
 
-    def editcomponent(self, data):
+    def editcomponent(self, data, timeout=None):
         """
         A method to edit a component in Bugzilla. Takes a dict, with
         mandatory elements of product. component, and initialowner.
         All other elements are optional and use the same names as the
         addcomponent() method.
+
+        :param timeout: Bound the total time of the call, see timeout()
         """
         data = data.copy()
         self._component_data_convert(data, update=True)
-        return self._backend.component_update(data)
+        with self.timeout(timeout):
+            return self._backend.component_update(data)
 
 
     ###################
@@ -1129,37 +1355,48 @@ class Bugzilla(object):
         return self._getbugs([objid], permissive=False, **kwargs)[0]
 
     def getbug(self, objid,
-               include_fields=None, exclude_fields=None, extra_fields=None):
+               include_fields=None, exclude_fields=None, extra_fields=None,
+               timeout=None):
         """
         Return a Bug object with the full complement of bug data
         already loaded.
+
+        :param timeout: Bound the total time of the call, see timeout()
         """
-        data = self._getbug(objid,
-            include_fields=include_fields, exclude_fields=exclude_fields,
-            extra_fields=extra_fields)
+        with self.timeout(timeout):
+            data = self._getbug(objid,
+                include_fields=include_fields, exclude_fields=exclude_fields,
+                extra_fields=extra_fields)
         return Bug(self, dict=data, autorefresh=self.bug_autorefresh)
 
     def getbugs(self, idlist,
                 include_fields=None, exclude_fields=None, extra_fields=None,
-                permissive=True):
+                permissive=True, timeout=None):
         """
         Return a list of Bug objects with the full complement of bug data
         already loaded. If there's a problem getting the data for a given id,
         the corresponding item in the returned list will be None.
+
+        :param timeout: Bound the total time of the call, including any
+            split sub-requests, see timeout()
         """
-        data = self._getbugs(idlist, include_fields=include_fields,
-            exclude_fields=exclude_fields, extra_fields=extra_fields,
-            permissive=permissive)
+        with self.timeout(timeout):
+            data = self._getbugs(idlist, include_fields=include_fields,
+                exclude_fields=exclude_fields, extra_fields=extra_fields,
+                permissive=permissive)
         return [(b and Bug(self, dict=b,
                            autorefresh=self.bug_autorefresh)) or None
                 for b in data]
 
-    def get_comments(self, idlist):
+    def get_comments(self, idlist, timeout=None):
         """
         Returns a dictionary of bugs and comments.  The comments key will
         be empty.  See bugzilla docs for details
+
+        :param timeout: Bound the total time of the call, see timeout()
         """
-        return self._backend.bug_comments(idlist, {})
+        with self.timeout(timeout):
+            return self._backend.bug_comments(idlist, {})
 
 
     #################
@@ -1318,7 +1555,7 @@ class Bugzilla(object):
         return query
 
 
-    def query_return_extra(self, query):
+    def query_return_extra(self, query, timeout=None):
         """
         Same as `query()`, but the return value is altered to be
         (buglist, values), where `values` is raw dictionary output from
@@ -1327,8 +1564,11 @@ class Bugzilla(object):
         limit on returned result numbers.
         """
         try:
-            r = self._backend.bug_search(query)
-            log.debug("bug_search returned:\n%s", str(r))
+            with self.timeout(timeout):
+                r = self._backend.bug_search(query)
+            if log.isEnabledFor(DEBUG):
+                # Format now, the bugs are popped out of r below
+                log.debug("bug_search returned:\n%s", str(log_truncate(r)))
         except Exception as e:
             # Try to give a hint in the error message if url_to_query
             # isn't supported by this bugzilla instance
@@ -1347,15 +1587,17 @@ class Bugzilla(object):
 
         return bugs, r
 
-    def query(self, query):
+    def query(self, query, timeout=None):
         """
         Pass search terms to bugzilla and and return a list of matching
         Bug objects.
 
         See `build_query` for more details about constructing the
         `query` dict parameter.
+
+        :param timeout: Bound the total time of the call, see timeout()
         """
-        bugs, dummy = self.query_return_extra(query)
+        bugs, dummy = self.query_return_extra(query, timeout=timeout)
         return bugs
 
     def pre_translation(self, query):
@@ -1376,12 +1618,15 @@ class Bugzilla(object):
         if self._is_redhat_bugzilla:
             _RHBugzillaConverters.post_translation(query, bug)
 
-    def bugs_history_raw(self, bug_ids):
+    def bugs_history_raw(self, bug_ids, timeout=None):
         """
         Experimental. Gets the history of changes for
         particular bugs in the database.
+
+        :param timeout: Bound the total time of the call, see timeout()
         """
-        return self._backend.bug_history(bug_ids, {})
+        with self.timeout(timeout):
+            return self._backend.bug_history(bug_ids, {})
 
 
     #######################################
@@ -1390,20 +1635,126 @@ class Bugzilla(object):
 
     # Bug() also has individual methods for many ops, like setassignee()
 
-    def update_bugs(self, ids, updates):
+    def update_bugs(self, ids, updates, timeout=None,
+                    skip_noop=False, known_bugs=None):
         """
         A thin wrapper around bugzilla Bug.update(). Used to update all
         values of an existing bug report, as well as add comments.
 
         The dictionary passed to this function should be generated with
         build_update(), otherwise we cannot guarantee back compatibility.
+
+        :param timeout: Bound the total time of the call, see timeout()
+        :param skip_noop: If True, compare the update against the current
+            state of each bug first, and leave out the fields, or whole
+            bugs, that it wouldn't change. This saves a server transaction
+            and notification mail for every no-op. The returned dict gets
+            an extra 'skipped' key mapping bug ID to the list of update
+            fields left out for that bug. 'comment' and 'flags', and
+            fields the bug data doesn't report, are always sent.
+        :param known_bugs: With skip_noop, an optional list of already
+            fetched Bug objects to compare against. Bugs that aren't in
+            the list are fetched, with only the fields the update touches.
         """
         tmp = updates.copy()
-        return self._backend.bug_update(listify(ids), tmp)
+        with self.timeout(timeout):
+            if skip_noop:
+                return self._update_bugs_skip_noop(
+                    listify(ids), tmp, known_bugs)
+            return self._backend.bug_update(listify(ids), tmp)
+
+    def _update_bugs_skip_noop(self, ids, updates, known_bugs):
+        bugdatamap = {}
+
+        def _add_bugdata(bugdata):
+            for key in [bugdata.get("id")] + (
+                    listify(bugdata.get("alias")) or []):
+                bugdatamap[str(key)] = bugdata
+
+        for bug in (known_bugs or []):
+            _add_bugdata(bug.get_raw_data())
+        missing = [bugid for bugid in ids if str(bugid) not in bugdatamap]
+        if missing:
+            fields = _get_compare_fields(updates) + ["id", "alias"]
+            for bug in self.getbugs(missing, include_fields=fields):
+                if bug:
+                    _add_bugdata(bug.get_raw_data())
+
+        # Bugs that end up with the same set of fields get the same
+        # pruned update, so they can share one Bug.update call
+        groups = {}
+        skipped = {}
+        for bugid in ids:
+            pruned = updates
+            bugdata = bugdatamap.get(str(bugid))
+            if bugdata is not None:
+                pruned, skippedfields = _prune_noop_update(updates, bugdata)
+                if skippedfields:
+                    skipped[bugid] = skippedfields
+            if not pruned:
+                log.debug("Skipping no-op update of bug %s", bugid)
+                continue
+            key = tuple(sorted(pruned))
+            groups.setdefault(key, (pruned, []))[1].append(bugid)
+
+        def _update(group):
+            pruned, groupids = group
+            return self._backend.bug_update(groupids, pruned)
+        results = self._session.run_concurrently(
+            _update, list(groups.values()))
+
+        ret = {"bugs": [], "skipped": skipped}
+        for result in results:
+            ret["bugs"].extend((result or {}).get("bugs", []))
+        return ret
 
-    def update_tags(self, idlist, tags_add=None, tags_remove=None):
+    def update_bugs_bulk(self, updates, journal=None, max_rate=None,
+                         timeout=None, skip_noop=False):
+        """
+        Apply many different updates in one go. Bugs that receive an
+        identical update are merged into a single update_bugs() call,
+        and the distinct calls are run concurrently. Example:
+
+            bz.update_bugs_bulk([
+                ([123, 456], bz.build_update(status="POST")),
+                (789, bz.build_update(status="POST")),
+                (1000, bz.build_update(assigned_to="foo@example.com")),
+            ])
+
+        makes two Bug.update calls, one of them for bugs 123, 456, 789.
+
+        A bug listed with several different updates gets them in input
+        order: its second update is only sent after the calls carrying
+        its first have finished, and is skipped with an error if its
+        first failed.
+
+        A failing update call doesn't stop the others. Its error is
+        reported in the returned list instead.
+
+        :param updates: List of (ids, update) pairs, where update is a
+            dict from build_update()
+        :param journal: Optional path of a file recording which updates
+            have completed. If a run is interrupted, running it again
+            with the same journal skips bugs that were already updated.
+        :param max_rate: Optional limit of update calls per second
+        :param timeout: Bound the total time of the call, see timeout()
+        :param skip_noop: Leave out no-op changes, see update_bugs()
+        :returns: List of dicts, one per update call, with 'ids',
+            'update', and either 'result' or 'error' keys
+        """
+        with self.timeout(timeout):
+            def _update(ids, update):
+                return self.update_bugs(ids, update, skip_noop=skip_noop)
+            return _run_bulk_update(_update,
+                self._session.run_concurrently, updates,
+                journal=journal, max_rate=max_rate)
+
+    def update_tags(self, idlist, tags_add=None, tags_remove=None,
+                    timeout=None):
         """
         Updates the 'tags' field for a bug.
+
+        :param timeout: Bound the total time of the call, see timeout()
         """
         tags = {}
         if tags_add:
@@ -1415,13 +1766,15 @@ class Bugzilla(object):
             "tags": tags,
         }
 
-        return self._backend.bug_update_tags(listify(idlist), d)
+        with self.timeout(timeout):
+            return self._backend.bug_update_tags(listify(idlist), d)
 
-    def update_flags(self, idlist, flags):
+    def update_flags(self, idlist, flags, timeout=None):
         """
         A thin back compat wrapper around build_update(flags=X)
         """
-        return self.update_bugs(idlist, self.build_update(flags=flags))
+        return self.update_bugs(idlist, self.build_update(flags=flags),
+                                timeout=timeout)
 
 
     def build_update(self,
@@ -1578,7 +1931,8 @@ class Bugzilla(object):
     # Methods for working with attachments #
     ########################################
 
-    def attachfile(self, idlist, attachfile, description, **kwargs):
+    def attachfile(self, idlist, attachfile, description, dedup=False,
+                   timeout=None, **kwargs):
         """
         Attach a file to the given bug IDs. Returns the ID of the attachment
         or raises XMLRPC Fault if something goes wrong.
@@ -1601,8 +1955,22 @@ class Bugzilla(object):
                           files will *not* be viewable in bugzilla unless you
                           remember to set this to text/plain. So remember that!
 
-        Returns the list of attachment ids that were added. If only one
-        attachment was added, we return the single int ID for back compat
+        idlist may be a single bug ID or a list of them. The file is read and
+        encoded once, and attached to all the bugs with a single request.
+
+        If dedup=True, bugs that already have a non-obsolete attachment
+        with identical content are skipped, and the ID of that existing
+        attachment is returned for them instead. Only the metadata of
+        existing attachments is fetched, and their content is only
+        downloaded and hashed when the size matches. The hashes are
+        remembered in the attachment_cache directory, or the default
+        cache location if it isn't set.
+
+        Returns the list of attachment ids that were added, in the same
+        order as idlist. If only one attachment was added, we return the
+        single int ID for back compat
+
+        :param timeout: Bound the total time of the call, see timeout()
         """
         if isinstance(attachfile, str):
             f = open(attachfile, "rb")
@@ -1623,9 +1991,13 @@ class Bugzilla(object):
 
         kwargs['summary'] = description
 
-        data = f.read()
-        if not isinstance(data, bytes):  # pragma: no cover
-            data = data.encode(locale.getpreferredencoding())
+        # On disk files are streamed from a memory map while uploading.
+        # Anything else is read into memory
+        data = _UploadSource.from_file(f)
+        if not data:
+            data = f.read()
+            if not isinstance(data, bytes):  # pragma: no cover
+                data = data.encode(locale.getpreferredencoding())
 
         if 'file_name' not in kwargs and hasattr(f, "name"):
             kwargs['file_name'] = os.path.basename(f.name)
@@ -1636,8 +2008,17 @@ class Bugzilla(object):
                     kwargs['file_name'], strict=False)[0]
             kwargs['content_type'] = ctype or 'application/octet-stream'
 
-        ret = self._backend.bug_attachment_create(
-            listify(idlist), data, kwargs)
+        idlist = listify(idlist)
+        existing = {}
+        ret = {"ids": []}
+        with self.timeout(timeout):
+            if dedup:
+                existing = self._find_duplicate_attachments(idlist, data)
+            upload_ids = [bugid for bugid in idlist
+                          if bugid not in existing]
+            if upload_ids:
+                ret = self._backend.bug_attachment_create(
+                    upload_ids, data, kwargs)
 
         if "attachments" in ret:
             # Up to BZ 4.2
@@ -1646,10 +2027,48 @@ class Bugzilla(object):
             # BZ 4.4+
             ret = ret["ids"]
 
+        if existing and isinstance(ret, list):
+            created = iter(ret)
+            ret = [existing[bugid] if bugid in existing
+                   else next(created, None) for bugid in idlist]
+
         if isinstance(ret, list) and len(ret) == 1:
             ret = ret[0]
         return ret
 
+    def _find_duplicate_attachments(self, idlist, data):
+        """
+        Return a dict of {bugid: attachment id} for the bugs in idlist
+        that already have an attachment with the same content as data,
+        which is bytes or an _UploadSource
+        """
+        if isinstance(data, _UploadSource):
+            size, digest = data.size, data.sha256()
+        else:
+            size, digest = len(data), hashlib.sha256(data).hexdigest()
+
+        cache = self._attachment_cache or _AttachmentCache(
+            _default_attachment_cache_path())
+        bugs = self.get_attachments(idlist, None,
+            exclude_fields=["data"])["bugs"]
+
+        ret = {}
+        for bugid in idlist:
+            for attdata in bugs.get(str(bugid), []):
+                if attdata.get("is_obsolete") or attdata.get("size") != size:
+                    continue
+
+                def _download(fileobj, attid=attdata["id"]):
+                    self.download_attachment(attid, fileobj)
+                remote = (cache.lookup_hash(self.url, attdata) or
+                          cache.store_hash(self.url, attdata, _download))
+                if remote == digest:
+                    log.debug("Bug %s already has identical attachment %s",
+                              bugid, attdata["id"])
+                    ret[bugid] = attdata["id"]
+                    break
+        return ret
+
     def openattachment_data(self, attachment_dict):
         """
         Helper for turning passed API attachment dictionary into a
@@ -1670,21 +2089,68 @@ class Bugzilla(object):
         ret.seek(0)
         return ret
 
-    def openattachment(self, attachid):
+    def openattachment(self, attachid, timeout=None):
         """
         Get the contents of the attachment with the given attachment ID.
         Returns a file-like object.
+
+        If the attachment_cache is enabled, the content is fetched into
+        the cache unless it is already there and up to date, and an
+        on disk file object is returned.
+
+        :param timeout: Bound the total time of the call, see timeout()
         """
-        attachments = self.get_attachments(None, attachid)
+        if self._attachment_cache:
+            with self.timeout(timeout):
+                return self._openattachment_cached(attachid)
+
+        attachments = self.get_attachments(None, attachid, timeout=timeout)
         data = attachments["attachments"][str(attachid)]
         return self.openattachment_data(data)
 
-    def updateattachmentflags(self, bugid, attachid, flagname, **kwargs):
+    def _openattachment_cached(self, attachid):
+        attachments = self.get_attachments(None, attachid,
+            exclude_fields=["data"])
+        attdata = attachments["attachments"][str(attachid)]
+        ret = self._attachment_cache.lookup(self.url, attdata)
+        if ret:
+            return ret
+
+        def _download(fileobj):
+            self.download_attachment(attachid, fileobj)
+        return self._attachment_cache.store(self.url, attdata, _download)
+
+    def download_attachment(self, attachid, fileobj, timeout=None):
+        """
+        Write the contents of the attachment with the given ID to
+        fileobj. Unlike openattachment(), the data is decoded as it is
+        received, so memory usage doesn't grow with the attachment size.
+
+        :param fileobj: A binary file-like object to write to, or a path
+            to create. A partially written path is removed on error.
+        :param timeout: Bound the total time of the call, see timeout()
+        :returns: The number of bytes written
+        """
+        if isinstance(fileobj, str):
+            try:
+                with open(fileobj, "wb") as f:
+                    return self.download_attachment(attachid, f, timeout)
+            except BaseException:
+                if os.path.exists(fileobj):
+                    os.unlink(fileobj)
+                raise
+
+        with self.timeout(timeout):
+            return self._backend.bug_attachment_download(attachid, fileobj)
+
+    def updateattachmentflags(self, bugid, attachid, flagname,
+                              timeout=None, **kwargs):
         """
         Updates a flag for the given attachment ID.
         Optional keyword args are:
             status:    new status for the flag ('-', '+', '?', 'X')
             requestee: new requestee for the flag
+            timeout:   bound the total time of the call, see timeout()
         """
         # Bug ID was used for the original custom redhat API, no longer
         # needed though
@@ -1695,15 +2161,18 @@ class Bugzilla(object):
         attachment_ids = [int(attachid)]
         update = {'flags': [flags]}
 
-        return self._backend.bug_attachment_update(attachment_ids, update)
+        with self.timeout(timeout):
+            return self._backend.bug_attachment_update(attachment_ids, update)
 
     def get_attachments(self, ids, attachment_ids,
-                        include_fields=None, exclude_fields=None):
+                        include_fields=None, exclude_fields=None,
+                        timeout=None):
         """
         Wrapper for Bug.attachments. One of ids or attachment_ids is required
 
         :param ids: Get attachments for this bug ID
         :param attachment_ids: Specific attachment ID to get
+        :param timeout: Bound the total time of the call, see timeout()
 
         https://bugzilla.readthedocs.io/en/latest/api/core/v1/attachment.html#get-attachment
         """
@@ -1713,9 +2182,80 @@ class Bugzilla(object):
         if exclude_fields:
             params["exclude_fields"] = listify(exclude_fields)
 
-        if attachment_ids:
-            return self._backend.bug_attachment_get(attachment_ids, params)
-        return self._backend.bug_attachment_get_all(ids, params)
+        with self.timeout(timeout):
+            if attachment_ids:
+                return self._backend.bug_attachment_get(
+                    attachment_ids, params)
+            return self._backend.bug_attachment_get_all(ids, params)
+
+    def find_attachments(self, ids=None, attachment_ids=None,
+                         obsolete=None, is_patch=None, content_type=None,
+                         file_name=None, max_size=None, timeout=None):
+        """
+        Return the metadata of the attachments of bug IDs ids and/or the
+        attachments attachment_ids, that match all the passed filters.
+        Attachment content isn't fetched, so filtering out large
+        attachments costs nothing. Use download_attachments() to fetch
+        the content of the selected ones.
+
+        :param obsolete: If True or False, only return attachments whose
+            is_obsolete flag matches
+        :param is_patch: If True or False, the same for is_patch
+        :param content_type: fnmatch pattern like 'text/*' to match
+            against the content type
+        :param file_name: fnmatch pattern to match against the file name
+        :param max_size: Skip attachments bigger than this many bytes
+        :param timeout: Bound the total time of the call, see timeout()
+        :returns: List of attachment dicts
+        """
+        found = {}
+        with self.timeout(timeout):
+            if ids:
+                ret = self.get_attachments(ids, None,
+                                           exclude_fields=["data"])
+                for attlist in ret["bugs"].values():
+                    for att in attlist:
+                        found[att["id"]] = att
+            if attachment_ids:
+                ret = self.get_attachments(None, attachment_ids,
+                                           exclude_fields=["data"])
+                for att in ret["attachments"].values():
+                    found[att["id"]] = att
+
+        def _match(att):
+            if (obsolete is not None and
+                bool(att.get("is_obsolete")) != bool(obsolete)):
+                return False
+            if (is_patch is not None and
+                bool(att.get("is_patch")) != bool(is_patch)):
+                return False
+            if (content_type is not None and not fnmatch.fnmatchcase(
+                    att.get("content_type") or "", content_type)):
+                return False
+            if (file_name is not None and not fnmatch.fnmatchcase(
+                    att.get("file_name") or "", file_name)):
+                return False
+            if max_size is not None and att.get("size", 0) > max_size:
+                return False
+            return True
+
+        return [att for att in found.values() if _match(att)]
+
+    def download_attachments(self, downloads, timeout=None):
+        """
+        Run download_attachment() for many attachments concurrently.
+        If one download fails, the outstanding ones are cancelled and
+        the error is raised.
+
+        :param downloads: List of (attachid, fileobj_or_path) pairs
+        :param timeout: Bound the total time of the call, see timeout()
+        :returns: List of byte counts, in downloads order
+        """
+        def _download(item):
+            return self.download_attachment(item[0], item[1])
+
+        with self.timeout(timeout):
+            return self._session.run_concurrently(_download, downloads)
 
 
     #####################
@@ -1820,43 +2360,113 @@ class Bugzilla(object):
 
         return data
 
-    def createbug(self, *args, **kwargs):
+    def createbug(self, *args, timeout=None, **kwargs):
         """
         Create a bug with the given info. Returns a new Bug object.
         Check bugzilla API documentation for valid values, at least
         product, component, summary, version, and description need to
         be passed.
+
+        :param timeout: Bound the total time of the call, see timeout()
         """
         data = self._validate_createbug(*args, **kwargs)
-        rawbug = self._backend.bug_create(data)
+        with self.timeout(timeout):
+            rawbug = self._backend.bug_create(data)
         return Bug(self, bug_id=rawbug["id"],
                    autorefresh=self.bug_autorefresh)
 
+    def createbugs(self, datalist, max_rate=None, refresh=False,
+                   timeout=None):
+        """
+        Create many bugs concurrently. Each item of datalist is a dict
+        like build_createbug() returns. Every item is validated before
+        any bug is created: if one is missing any of the
+        createbug_required fields, BugzillaError is raised and nothing
+        is submitted.
+
+        A failed create doesn't stop the others. Its error is reported
+        in the returned list instead.
+
+        :param max_rate: Optional limit of create calls per second
+        :param refresh: If True, fetch the full data of all the created
+            bugs with a single getbugs() call. Otherwise, or if a bug
+            can't be fetched, the returned Bug objects only have their
+            ID set, like createbug() returns.
+        :param timeout: Bound the total time of the call, see timeout()
+        :returns: List of dicts in datalist order, with a 'data' key
+            holding the submitted dict, and either 'bug' with the new
+            Bug object or 'error' with the raised exception
+        """
+        payloads = []
+        invalid = []
+        for idx, data in enumerate(datalist):
+            data = self._validate_createbug(dict(data))
+            missing = [key for key in self.createbug_required
+                       if not data.get(key)]
+            if missing:
+                invalid.append("item %d is missing %s" %
+                               (idx, ", ".join(missing)))
+            payloads.append(data)
+        if invalid:
+            raise BugzillaError("createbugs: %s" % "; ".join(invalid))
+
+        limiter = max_rate and _RateLimiter(max_rate) or None
+
+        def _create(data):
+            ret = {"data": data}
+            if limiter:
+                limiter.wait()
+            try:
+                rawbug = self._backend.bug_create(data)
+                ret["bug"] = Bug(self, bug_id=rawbug["id"],
+                                 autorefresh=self.bug_autorefresh)
+            except Exception as e:
+                log.debug("createbugs: failed to create %s", data,
+                          exc_info=True)
+                ret["error"] = e
+            return ret
+
+        with self.timeout(timeout):
+            results = self._session.run_concurrently(_create, payloads)
+
+            created = [r for r in results if "bug" in r]
+            if refresh and created:
+                # getbugs() leaves out bugs it can't fetch, so match
+                # them up by ID rather than position
+                bugmap = dict((bug.bug_id, bug) for bug in self.getbugs(
+                    [r["bug"].bug_id for r in created]))
+                for r in created:
+                    r["bug"] = bugmap.get(r["bug"].bug_id, r["bug"])
+        return results
+
 
     ##############################
     # Methods for handling Users #
     ##############################
 
-    def getuser(self, username):
+    def getuser(self, username, timeout=None):
         """
         Return a bugzilla User for the given username
 
         :arg username: The username used in bugzilla.
+        :kwarg timeout: Bound the total time of the call, see timeout()
         :raises XMLRPC Fault: Code 51 if the username does not exist
         :returns: User record for the username
         """
-        ret = self.getusers(username)
+        ret = self.getusers(username, timeout=timeout)
         return ret and ret[0]
 
-    def getusers(self, userlist):
+    def getusers(self, userlist, timeout=None):
         """
         Return a list of Users from .
 
         :userlist: List of usernames to lookup
+        :timeout: Bound the total time of the call, see timeout()
         :returns: List of User records
         """
         userlist = listify(userlist)
-        rawusers = self._backend.user_get({"names": userlist})
+        with self.timeout(timeout):
+            rawusers = self._backend.user_get({"names": userlist})
         userobjs = [User(self, **rawuser) for rawuser in
                     rawusers.get('users', [])]
 
@@ -1872,24 +2482,27 @@ class Bugzilla(object):
         return ret
 
 
-    def searchusers(self, pattern):
+    def searchusers(self, pattern, timeout=None):
         """
         Return a bugzilla User for the given list of patterns
 
         :arg pattern: List of patterns to match against.
+        :kwarg timeout: Bound the total time of the call, see timeout()
         :returns: List of User records
         """
-        rawusers = self._backend.user_get({"match": listify(pattern)})
+        with self.timeout(timeout):
+            rawusers = self._backend.user_get({"match": listify(pattern)})
         return [User(self, **rawuser) for rawuser in
                 rawusers.get('users', [])]
 
-    def createuser(self, email, name='', password=''):
+    def createuser(self, email, name='', password='', timeout=None):
         """
         Return a bugzilla User for the given username
 
         :arg email: The email address to use in bugzilla
         :kwarg name: Real name to associate with the account
         :kwarg password: Password to set for the bugzilla account
+        :kwarg timeout: Bound the total time of the call, see timeout()
         :raises XMLRPC Fault: Code 501 if the username already exists
             Code 500 if the email address isn't valid
             Code 502 if the password is too short
@@ -1901,10 +2514,11 @@ class Bugzilla(object):
             args["name"] = name
         if password:
             args["password"] = password
-        self._backend.user_create(args)
-        return self.getuser(email)
+        with self.timeout(timeout):
+            self._backend.user_create(args)
+            return self.getuser(email)
 
-    def updateperms(self, user, action, groups):
+    def updateperms(self, user, action, groups, timeout=None):
         """
         A method to update the permissions (group membership) of a bugzilla
         user.
@@ -1913,6 +2527,7 @@ class Bugzilla(object):
             also be a list of emails.
         :arg action: add, remove, or set
         :arg groups: list of groups to be added to (i.e. ['fedora_contrib'])
+        :kwarg timeout: Bound the total time of the call, see timeout()
         """
         groups = listify(groups)
         if action == "rem":
@@ -1927,7 +2542,8 @@ class Bugzilla(object):
             }
         }
 
-        return self._backend.user_update(update)
+        with self.timeout(timeout):
+            return self._backend.user_update(update)
 
 
     ###############################
@@ -1954,32 +2570,33 @@ class Bugzilla(object):
         params['names'] = listify(names)
         return self._backend.group_get(params)
 
-    def getgroup(self, name, membership=False):
+    def getgroup(self, name, membership=False, timeout=None):
         """
         Return a bugzilla Group for the given name
 
         :arg name: The group name used in bugzilla.
         :raises XMLRPC Fault: Code 51 if the name does not exist
+        :kwarg timeout: Bound the total time of the call, see timeout()
         :raises XMLRPC Fault: Code 805 if the user does not have enough
             permissions to view groups
         :returns: Group record for the name
         """
-        ret = self.getgroups(name, membership=membership)
+        ret = self.getgroups(name, membership=membership, timeout=timeout)
         return ret and ret[0]
 
-    def getgroups(self, grouplist, membership=False):
+    def getgroups(self, grouplist, membership=False, timeout=None):
         """
         Return a list of Groups from .
 
         :userlist: List of group names to lookup
+        :timeout: Bound the total time of the call, see timeout()
         :returns: List of Group records
         """
         grouplist = listify(grouplist)
-        groupobjs = [
-            Group(self, **rawgroup)
-            for rawgroup in self._getgroups(
+        with self.timeout(timeout):
+            rawgroups = self._getgroups(
                 names=grouplist, membership=membership).get('groups', [])
-        ]
+        groupobjs = [Group(self, **rawgroup) for rawgroup in rawgroups]
 
         # Return in same order they were passed in
         ret = []
@@ -2000,7 +2617,7 @@ class Bugzilla(object):
     def add_external_tracker(self, bug_ids, ext_bz_bug_id, ext_type_id=None,
                              ext_type_description=None, ext_type_url=None,
                              ext_status=None, ext_description=None,
-                             ext_priority=None):
+                             ext_priority=None, timeout=None):
         """
         Wrapper method to allow adding of external tracking bugs using the
         ExternalBugs::WebService::add_external_bug method.
@@ -2019,6 +2636,7 @@ class Bugzilla(object):
         ext_status: The status of the external bug.
         ext_description: The description of the external bug.
         ext_priority: The priority of the external bug.
+        timeout: Bound the total time of the call, see timeout()
         """
         param_dict = {'ext_bz_bug_id': ext_bz_bug_id}
         if ext_type_id is not None:
@@ -2037,13 +2655,14 @@ class Bugzilla(object):
             'bug_ids': listify(bug_ids),
             'external_bugs': [param_dict],
         }
-        return self._backend.externalbugs_add(params)
+        with self.timeout(timeout):
+            return self._backend.externalbugs_add(params)
 
     def update_external_tracker(self, ids=None, ext_type_id=None,
                                 ext_type_description=None, ext_type_url=None,
                                 ext_bz_bug_id=None, bug_ids=None,
                                 ext_status=None, ext_description=None,
-                                ext_priority=None):
+                                ext_priority=None, timeout=None):
         """
         Wrapper method to allow adding of external tracking bugs using the
         ExternalBugs::WebService::update_external_bug method.
@@ -2064,6 +2683,7 @@ class Bugzilla(object):
         ext_status: The status of the external bug.
         ext_description: The description of the external bug.
         ext_priority: The priority of the external bug.
+        timeout: Bound the total time of the call, see timeout()
         """
         params = {}
         if ids is not None:
@@ -2084,11 +2704,13 @@ class Bugzilla(object):
             params['ext_description'] = ext_description
         if ext_priority is not None:
             params['ext_priority'] = ext_priority
-        return self._backend.externalbugs_update(params)
+        with self.timeout(timeout):
+            return self._backend.externalbugs_update(params)
 
     def remove_external_tracker(self, ids=None, ext_type_id=None,
                                 ext_type_description=None, ext_type_url=None,
-                                ext_bz_bug_id=None, bug_ids=None):
+                                ext_bz_bug_id=None, bug_ids=None,
+                                timeout=None):
         """
         Wrapper method to allow removal of external tracking bugs using the
         ExternalBugs::WebService::remove_external_bug method.
@@ -2106,6 +2728,7 @@ class Bugzilla(object):
             (ie: the bug number in the external tracker).
         bug_ids: A single bug id or list of bug ids to have external tracker
             info updated.
+        timeout: Bound the total time of the call, see timeout()
         """
         params = {}
         if ids is not None:
@@ -2120,4 +2743,5 @@ class Bugzilla(object):
             params['ext_bz_bug_id'] = listify(ext_bz_bug_id)
         if bug_ids is not None:
             params['bug_ids'] = listify(bug_ids)
-        return self._backend.externalbugs_remove(params)
+        with self.timeout(timeout):
+            return self._backend.externalbugs_remove(params)
@@ -6,8 +6,11 @@
 
 import copy
 from logging import getLogger
+import time
 from urllib.parse import urlparse, urlunparse
 
+from . import _profile
+
 
 log = getLogger(__name__)
 
@@ -25,6 +28,8 @@ class Bug(object):
     def __init__(self, bugzilla, bug_id=None, dict=None, autorefresh=False):
         # pylint: disable=redefined-builtin
         # API had pre-existing issue that we can't change ('dict' usage)
+        profiler = _profile.active
+        start = profiler and time.perf_counter()
 
         self.bugzilla = bugzilla
         self._rawdata = {}
@@ -41,6 +46,9 @@ class Bug(object):
 
         self._update_dict(dict)
         self.weburl = self._generate_weburl()
+        if profiler:
+            # Too many calls to be worth a trace event each
+            profiler.add_time("construct", start)
 
     def _generate_weburl(self):
         """
@@ -1,6 +1,5 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
-from requests import HTTPError
 
 
 class BugzillaError(Exception):
@@ -39,5 +38,13 @@ class BugzillaError(Exception):
         Exception.__init__(self, message)
 
 
-class BugzillaHTTPError(HTTPError):
-    """Error raised in the Bugzilla session"""
+def __getattr__(name):
+    # BugzillaHTTPError subclasses requests.HTTPError, so it's defined in
+    # _session, which base.py only imports when connecting. Forward to
+    # it, so importing this module doesn't import 'requests'
+    if name != "BugzillaHTTPError":
+        raise AttributeError(
+            "module %r has no attribute %r" % (__name__, name))
+
+    from ._session import BugzillaHTTPError
+    return BugzillaHTTPError
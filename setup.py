@@ -30,7 +30,8 @@ class PylintCommand(setuptools.Command):
 
         files = (["bugzilla-cli", "bugzilla", "setup.py"] +
             glob.glob("examples/*.py") +
-            glob.glob("tests/*.py"))
+            glob.glob("tests/*.py") +
+            glob.glob("benchmarks/*.py"))
         output_format = sys.stdout.isatty() and "colorized" or "text"
 
         print("running pycodestyle")
@@ -0,0 +1,910 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+"""
+Pure python fake Bugzilla server speaking both the REST and XMLRPC APIs,
+for exercising the real HTTP code paths in tests and benchmarks without
+network access or the docker setup in tests/services.
+
+The server is backed by a synthetic, deterministic dataset. Latency,
+bandwidth caps, HTTP error faults, and search result limits can be
+injected. Usage:
+
+    with FakeBugzillaServer(num_bugs=1000, latency=0.01) as server:
+        bz = bugzilla.Bugzilla(server.rest_url)
+        ...
+        server.add_fault(429, count=2, match="/bug", retry_after=1)
+"""
+
+import base64
+import copy
+import datetime
+import http.server
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+import urllib.parse
+import xmlrpc.client
+
+# All the API implementations take a params dict, used or not
+# pylint: disable=unused-argument
+
+
+class FakeBugzillaError(Exception):
+    """
+    Bugzilla API error, reported as a REST error payload or XMLRPC Fault
+    """
+    def __init__(self, code, message, status=400):
+        Exception.__init__(self, message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+def _listify(val):
+    if val is None:
+        return []
+    if isinstance(val, (list, tuple)):
+        return list(val)
+    return [val]
+
+
+def _filter_fields(obj, include_fields, exclude_fields, always=("id",)):
+    include_fields = _listify(include_fields)
+    exclude_fields = _listify(exclude_fields)
+    if include_fields and "_all" not in include_fields:
+        obj = dict((k, v) for k, v in obj.items()
+                   if k in include_fields or k in always)
+    return dict((k, v) for k, v in obj.items() if k not in exclude_fields)
+
+
+def _timestamp(offset):
+    start = datetime.datetime(2020, 1, 1)
+    when = start + datetime.timedelta(minutes=offset)
+    return when.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+###################
+# Fake data store #
+###################
+
+class FakeBugzillaData(object):
+    """
+    Synthetic, deterministic Bugzilla dataset, and the implementation
+    of the API calls against it. Methods take and return data in the
+    REST API format; the server adapts it for XMLRPC.
+    """
+    VERSION = "5.0.6"
+    STATUSES = ["NEW", "ASSIGNED", "POST", "MODIFIED", "ON_QA", "CLOSED"]
+
+    def __init__(self, num_bugs=100, num_products=3,
+                 components_per_product=3, comments_per_bug=2,
+                 attachments_per_bug=1, attachment_size=1024, seed=0):
+        self.lock = threading.RLock()
+        rand = random.Random(seed)
+
+        self.users = {}
+        for idx in range(1, 11):
+            name = "user%d@example.com" % idx
+            self.users[name] = {"id": idx, "name": name, "email": name,
+                                "real_name": "User %d" % idx,
+                                "can_login": True, "groups": []}
+        usernames = sorted(self.users)
+
+        self.groups = [{"id": 1, "name": "admin",
+                        "description": "Administrators",
+                        "is_active": True, "membership": []}]
+
+        self.products = []
+        for pidx in range(1, num_products + 1):
+            components = []
+            for cidx in range(1, components_per_product + 1):
+                components.append({
+                    "id": pidx * 100 + cidx,
+                    "name": "component%d" % cidx,
+                    "description": "Component %d" % cidx,
+                    "default_assigned_to": usernames[cidx % len(usernames)],
+                    "default_qa_contact": "",
+                    "is_active": True,
+                })
+            self.products.append({
+                "id": pidx,
+                "name": "Product%d" % pidx,
+                "description": "Product %d" % pidx,
+                "is_active": True,
+                "components": components,
+                "versions": [{"id": 1, "name": "unspecified",
+                              "is_active": True}],
+            })
+
+        self.bugs = {}
+        self.comments = {}
+        self.history = {}
+        self.attachments = {}
+        self.attachment_data = {}
+        for bugid in range(1, num_bugs + 1):
+            product = self.products[(bugid - 1) % len(self.products)]
+            component = rand.choice(product["components"])
+            self.bugs[bugid] = {
+                "id": bugid,
+                "alias": ["fakebug%d" % bugid],
+                "summary": "Fake bug %d %s" % (bugid, rand.choice(
+                    ["crash", "hang", "typo", "leak", "slow"])),
+                "product": product["name"],
+                "component": component["name"],
+                "version": "unspecified",
+                "status": rand.choice(self.STATUSES),
+                "resolution": "",
+                "severity": rand.choice(["low", "medium", "high"]),
+                "priority": rand.choice(["low", "medium", "high"]),
+                "assigned_to": rand.choice(usernames),
+                "creator": rand.choice(usernames),
+                "qa_contact": "",
+                "cc": rand.sample(usernames, 2),
+                "keywords": [],
+                "blocks": [],
+                "depends_on": [],
+                "groups": [],
+                "flags": [],
+                "whiteboard": "",
+                "is_open": True,
+                "creation_time": _timestamp(bugid),
+                "last_change_time": _timestamp(bugid + 1),
+            }
+            self.comments[bugid] = []
+            for cidx in range(comments_per_bug):
+                self._add_comment(bugid, "Comment %d on bug %d" %
+                                  (cidx, bugid), rand.choice(usernames))
+            self.history[bugid] = []
+            for dummy in range(attachments_per_bug):
+                content = rand.getrandbits(
+                    8 * attachment_size or 8).to_bytes(
+                        attachment_size or 1, "little")[:attachment_size]
+                self._add_attachment(bugid, content, {
+                    "file_name": "bug%d.log" % bugid,
+                    "summary": "Log for bug %d" % bugid,
+                    "content_type": "text/plain",
+                }, rand.choice(usernames))
+
+        self._next_bug_id = num_bugs + 1
+
+    def _add_comment(self, bugid, text, creator, is_private=False):
+        comments = self.comments[bugid]
+        commentid = bugid * 1000 + len(comments)
+        comments.append({
+            "id": commentid, "bug_id": bugid, "count": len(comments),
+            "text": text, "creator": creator, "is_private": is_private,
+            "creation_time": _timestamp(bugid + len(comments)),
+            "tags": [],
+        })
+
+    def _add_attachment(self, bugid, content, params, creator):
+        attid = len(self.attachments) + 1
+        self.attachments[attid] = {
+            "id": attid,
+            "bug_id": bugid,
+            "file_name": params.get("file_name") or "attachment.bin",
+            "summary": params.get("summary") or "",
+            "content_type": (params.get("content_type") or
+                             "application/octet-stream"),
+            "is_patch": bool(params.get("is_patch")),
+            "is_private": bool(params.get("is_private")),
+            "is_obsolete": False,
+            "creator": creator,
+            "size": len(content),
+            "flags": [],
+            "creation_time": _timestamp(attid),
+            "last_change_time": _timestamp(attid),
+        }
+        self.attachment_data[attid] = content
+        return attid
+
+    def _lookup_bug(self, idval):
+        if str(idval).isdigit():
+            bug = self.bugs.get(int(idval))
+        else:
+            bug = ([b for b in self.bugs.values()
+                    if str(idval) in b["alias"]] or [None])[0]
+        if not bug:
+            raise FakeBugzillaError(101, "Bug #%s does not exist." % idval,
+                                    status=404)
+        return bug
+
+    def _lookup_attachment(self, attid):
+        if int(attid) not in self.attachments:
+            raise FakeBugzillaError(
+                100, "Attachment #%s does not exist." % attid, status=404)
+        return self.attachments[int(attid)]
+
+    ##############
+    # Bug fields #
+    ##############
+
+    def version(self, params):
+        return {"version": self.VERSION}
+
+    def bug_fields(self, params):
+        names = _listify(params.get("names"))
+        fields = []
+        for idx, name in enumerate(sorted(self.bugs[1] if self.bugs
+                                          else ["id"])):
+            if names and name not in names:
+                continue
+            fields.append({"id": idx + 1, "name": name,
+                           "display_name": name.replace("_", " "),
+                           "is_custom": False, "values": []})
+        for field in fields:
+            if field["name"] == "status":
+                field["values"] = [{"name": s} for s in self.STATUSES]
+        return {"fields": fields}
+
+    ########
+    # Bugs #
+    ########
+
+    def bug_get(self, params):
+        ids = _listify(params.get("ids")) + _listify(params.get("id"))
+        ids += _listify(params.get("alias"))
+        permissive = params.get("permissive")
+        ret = {"bugs": [], "faults": []}
+        for idval in ids:
+            try:
+                bug = self._lookup_bug(idval)
+            except FakeBugzillaError as e:
+                if not permissive:
+                    raise
+                ret["faults"].append({"id": idval, "faultString": e.message,
+                                      "faultCode": e.code})
+                continue
+            ret["bugs"].append(_filter_fields(
+                bug, params.get("include_fields"),
+                params.get("exclude_fields")))
+        return ret
+
+    def bug_search(self, params, max_results=None):
+        if params.get("id") or params.get("alias"):
+            params = params.copy()
+            params["permissive"] = 1
+            ret = self.bug_get(params)
+            ret.pop("faults")
+            return ret
+
+        def _matches(bug):
+            for key in ["product", "component", "status", "assigned_to",
+                        "creator", "severity", "priority", "version"]:
+                want = _listify(params.get(key))
+                if want and bug[key] not in want:
+                    return False
+            if params.get("summary"):
+                if str(params["summary"]) not in bug["summary"]:
+                    return False
+            return True
+
+        bugs = [b for dummy, b in sorted(self.bugs.items()) if _matches(b)]
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 0)
+        if max_results and (not limit or limit > max_results):
+            limit = max_results
+        bugs = bugs[offset:]
+        if limit:
+            bugs = bugs[:limit]
+
+        return {"bugs": [
+            _filter_fields(b, params.get("include_fields"),
+                           params.get("exclude_fields")) for b in bugs]}
+
+    def bug_create(self, params, user):
+        for key in ["product", "component", "summary", "version"]:
+            if not params.get(key):
+                raise FakeBugzillaError(
+                    51, "You must specify a %s." % key)
+        bugid = self._next_bug_id
+        self._next_bug_id += 1
+        bug = copy.deepcopy(self.bugs.get(1) or {})
+        bug.update({
+            "id": bugid, "alias": _listify(params.get("alias")),
+            "status": params.get("status") or "NEW",
+            "assigned_to": params.get("assigned_to") or user,
+            "creator": user, "cc": _listify(params.get("cc")),
+            "keywords": _listify(params.get("keywords")),
+            "creation_time": _timestamp(bugid),
+            "last_change_time": _timestamp(bugid),
+        })
+        for key in ["product", "component", "summary", "version",
+                    "severity", "priority", "whiteboard"]:
+            if key in params:
+                bug[key] = params[key]
+        self.bugs[bugid] = bug
+        self.comments[bugid] = []
+        self.history[bugid] = []
+        self._add_comment(bugid, params.get("description") or "", user)
+        return {"id": bugid}
+
+    def bug_update(self, params, user):
+        ret = {"bugs": []}
+        for idval in _listify(params.get("ids")):
+            bug = self._lookup_bug(idval)
+            changes = {}
+            for key, val in params.items():
+                if key in ["ids", "comment", "minor_update"]:
+                    continue
+                if key not in bug:
+                    continue
+                old = bug[key]
+                if isinstance(old, list) and isinstance(val, dict):
+                    new = [v for v in old
+                           if v not in _listify(val.get("remove"))]
+                    new += [v for v in _listify(val.get("add"))
+                            if v not in new]
+                    if "set" in val:
+                        new = _listify(val["set"])
+                else:
+                    new = val
+                if new == old:
+                    continue
+                bug[key] = new
+                changes[key] = {"removed": str(old), "added": str(new)}
+
+            if params.get("comment"):
+                comment = params["comment"]
+                text = comment.get("body", comment.get("comment", ""))
+                self._add_comment(bug["id"], text, user,
+                                  bool(comment.get("is_private")))
+            if changes:
+                self.history[bug["id"]].append({
+                    "who": user, "when": _timestamp(len(self.history)),
+                    "changes": [{"field_name": k, "removed": v["removed"],
+                                 "added": v["added"]}
+                                for k, v in changes.items()]})
+            ret["bugs"].append({"id": bug["id"], "alias": bug["alias"],
+                                "changes": changes,
+                                "last_change_time": bug["last_change_time"]})
+        return ret
+
+    def bug_update_tags(self, params):
+        tags = params.get("tags") or {}
+        ret = {"changes": {}}
+        for idval in _listify(params.get("ids")):
+            bug = self._lookup_bug(idval)
+            old = bug.setdefault("tags", [])
+            new = [t for t in old if t not in _listify(tags.get("remove"))]
+            new += [t for t in _listify(tags.get("add")) if t not in new]
+            bug["tags"] = new
+            ret["changes"][str(bug["id"])] = {"tags": {
+                "added": [t for t in new if t not in old],
+                "removed": [t for t in old if t not in new]}}
+        return ret
+
+    def bug_comments(self, params):
+        ret = {"bugs": {}, "comments": {}}
+        for idval in _listify(params.get("ids")):
+            bug = self._lookup_bug(idval)
+            ret["bugs"][str(bug["id"])] = {
+                "comments": copy.deepcopy(self.comments[bug["id"]])}
+        return ret
+
+    def bug_history(self, params):
+        ret = {"bugs": []}
+        for idval in _listify(params.get("ids")):
+            bug = self._lookup_bug(idval)
+            ret["bugs"].append({"id": bug["id"], "alias": bug["alias"],
+                                "history": copy.deepcopy(
+                                    self.history[bug["id"]])})
+        return ret
+
+    ###############
+    # Attachments #
+    ###############
+
+    def _attachment_dict(self, attid, params):
+        att = dict(self.attachments[attid])
+        att["data"] = self.attachment_data[attid]
+        return _filter_fields(att, params.get("include_fields"),
+                              params.get("exclude_fields"))
+
+    def attachment_get(self, params):
+        ret = {"attachments": {}, "bugs": {}}
+        for attid in _listify(params.get("attachment_ids")):
+            self._lookup_attachment(attid)
+            ret["attachments"][str(attid)] = self._attachment_dict(
+                int(attid), params)
+        for idval in _listify(params.get("ids")):
+            bug = self._lookup_bug(idval)
+            ret["bugs"][str(bug["id"])] = [
+                self._attachment_dict(attid, params)
+                for attid, att in sorted(self.attachments.items())
+                if att["bug_id"] == bug["id"]]
+        return ret
+
+    def attachment_create(self, params, user):
+        content = params.get("data")
+        if content is None:
+            raise FakeBugzillaError(
+                600, "You must attach a file to create an attachment.")
+        ret = []
+        for idval in _listify(params.get("ids")):
+            bug = self._lookup_bug(idval)
+            ret.append(self._add_attachment(bug["id"], content, params, user))
+            if params.get("comment"):
+                self._add_comment(bug["id"], params["comment"], user)
+        return {"ids": ret}
+
+    def attachment_update(self, params):
+        ret = []
+        for attid in _listify(params.get("ids")):
+            att = self._lookup_attachment(attid)
+            changes = {}
+            for key, val in params.items():
+                if key in att and key not in ["id", "bug_id", "size"]:
+                    changes[key] = {"removed": str(att[key]),
+                                    "added": str(val)}
+                    att[key] = val
+            ret.append({"id": att["id"], "changes": changes,
+                        "last_change_time": att["last_change_time"]})
+        return {"attachments": ret}
+
+    ############
+    # Products #
+    ############
+
+    def product_get(self, params):
+        ids = [int(i) for i in _listify(params.get("ids"))]
+        names = _listify(params.get("names"))
+        ret = []
+        for product in self.products:
+            if ids or names:
+                if product["id"] not in ids and product["name"] not in names:
+                    continue
+            ret.append(_filter_fields(
+                copy.deepcopy(product), params.get("include_fields"),
+                params.get("exclude_fields")))
+        return {"products": ret}
+
+    def product_ids(self, params):
+        return {"ids": [p["id"] for p in self.products]}
+
+    def component_create(self, params):
+        product = [p for p in self.products
+                   if p["name"] == params.get("product")]
+        if not product:
+            raise FakeBugzillaError(
+                106, "Product %s does not exist." % params.get("product"))
+        compid = product[0]["id"] * 100 + len(product[0]["components"]) + 1
+        product[0]["components"].append({
+            "id": compid, "name": params.get("name"),
+            "description": params.get("description", ""),
+            "default_assigned_to": params.get("default_assignee", ""),
+            "default_qa_contact": params.get("default_qa_contact", ""),
+            "is_active": True,
+        })
+        return {"id": compid}
+
+    def component_update(self, params):
+        ret = []
+        for names in _listify(params.get("names")):
+            for product in self.products:
+                if product["name"] != names["product"]:
+                    continue
+                for comp in product["components"]:
+                    if comp["name"] != names["component"]:
+                        continue
+                    for key, val in params.get("updates", {}).items():
+                        comp[key] = val
+                    ret.append({"id": comp["id"], "changes": {}})
+        return {"components": ret}
+
+    ##################
+    # Users / groups #
+    ##################
+
+    def group_get(self, params):
+        names = _listify(params.get("names"))
+        return {"groups": [copy.deepcopy(g) for g in self.groups
+                           if not names or g["name"] in names]}
+
+    def user_get(self, params):
+        names = _listify(params.get("names"))
+        ids = [int(i) for i in _listify(params.get("ids"))]
+        match = _listify(params.get("match"))
+        ret = []
+        for name, user in sorted(self.users.items()):
+            if (name in names or user["id"] in ids or
+                [m for m in match if m in name]):
+                ret.append(copy.deepcopy(user))
+        return {"users": ret}
+
+    def user_create(self, params):
+        name = params.get("email")
+        userid = len(self.users) + 1
+        self.users[name] = {"id": userid, "name": name, "email": name,
+                            "real_name": params.get("name", ""),
+                            "can_login": True, "groups": []}
+        return {"id": userid}
+
+    def user_update(self, params):
+        ret = []
+        for name in _listify(params.get("names")):
+            user = self.users.get(name)
+            if not user:
+                raise FakeBugzillaError(
+                    51, "There is no user named '%s'." % name)
+            ret.append({"id": user["id"], "changes": {}})
+        return {"users": ret}
+
+    def user_login(self, params):
+        user = self.users.get(params.get("login"))
+        if not user or params.get("password") != "password":
+            raise FakeBugzillaError(
+                300, "The username or password you entered is not valid.")
+        return {"id": user["id"], "token": "%s-faketoken" % user["id"]}
+
+    def user_logout(self, params):
+        return {}
+
+    def externalbugs(self, params):
+        return {}
+
+
+##########################
+# HTTP protocol handling #
+##########################
+
+def _to_xmlrpc(obj):
+    """
+    Convert REST style data into something xmlrpc.client can marshal
+    """
+    if isinstance(obj, bytes):
+        return xmlrpc.client.Binary(obj)
+    if isinstance(obj, dict):
+        return dict((str(k), _to_xmlrpc(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return [_to_xmlrpc(v) for v in obj]
+    return obj
+
+
+def _to_json(obj):
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode("ascii")
+    if isinstance(obj, dict):
+        return dict((k, _to_json(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return [_to_json(v) for v in obj]
+    return obj
+
+
+# REST routes: (method, path regex, data method, path group -> param name)
+_REST_ROUTES = [
+    ("GET", r"/version", "version", None),
+    ("GET", r"/field/bug", "bug_fields", None),
+    ("GET", r"/bug/attachment/(\d+)", "attachment_get", "attachment_ids"),
+    ("PUT", r"/bug/attachment/(\d+)", "attachment_update", "ids"),
+    ("GET", r"/bug/([^/]+)/attachment", "attachment_get", "ids"),
+    ("POST", r"/bug/([^/]+)/attachment", "attachment_create", "ids"),
+    ("GET", r"/bug/([^/]+)/comment", "bug_comments", "ids"),
+    ("GET", r"/bug/([^/]+)/history", "bug_history", "ids"),
+    ("GET", r"/bug/([^/]+)", "bug_get", "ids"),
+    ("PUT", r"/bug/([^/]+)", "bug_update", "ids"),
+    ("GET", r"/bug", "bug_search", None),
+    ("POST", r"/bug", "bug_create", None),
+    ("GET", r"/product/get", "product_get", None),
+    ("GET", r"/product", "product_get", None),
+    ("GET", r"/product_(?:accessible|enterable|selectable)",
+     "product_ids", None),
+    ("POST", r"/component", "component_create", None),
+    ("PUT", r"/component/.+", "component_update", None),
+    ("GET", r"/group", "group_get", None),
+    ("GET", r"/user", "user_get", None),
+    ("POST", r"/user", "user_create", None),
+    ("PUT", r"/user/([^/]+)", "user_update", "names"),
+    ("GET", r"/login", "user_login", None),
+    ("GET", r"/logout", "user_logout", None),
+]
+
+_XMLRPC_METHODS = {
+    "Bugzilla.version": "version",
+    "Bug.fields": "bug_fields",
+    "Bug.get": "bug_get",
+    "Bug.search": "bug_search",
+    "Bug.create": "bug_create",
+    "Bug.update": "bug_update",
+    "Bug.update_tags": "bug_update_tags",
+    "Bug.comments": "bug_comments",
+    "Bug.history": "bug_history",
+    "Bug.attachments": "attachment_get",
+    "Bug.add_attachment": "attachment_create",
+    "Bug.update_attachment": "attachment_update",
+    "Product.get": "product_get",
+    "Product.get_accessible_products": "product_ids",
+    "Product.get_enterable_products": "product_ids",
+    "Product.get_selectable_products": "product_ids",
+    "Component.create": "component_create",
+    "Component.update": "component_update",
+    "ExternalBugs.add_external_bug": "externalbugs",
+    "ExternalBugs.update_external_bug": "externalbugs",
+    "ExternalBugs.remove_external_bug": "externalbugs",
+    "Group.get": "group_get",
+    "User.get": "user_get",
+    "User.create": "user_create",
+    "User.update": "user_update",
+    "User.login": "user_login",
+    "User.logout": "user_logout",
+}
+
+# Data methods that need to know who is calling
+_USER_METHODS = ["bug_create", "bug_update", "attachment_create"]
+
+
+def _parse_query(query):
+    params = {}
+    for key, val in urllib.parse.parse_qsl(query, keep_blank_values=True):
+        params.setdefault(key, []).append(val)
+    # Single values are passed as scalars, except for list type params
+    listkeys = ["id", "ids", "alias", "include_fields", "exclude_fields",
+                "names", "match", "product", "component", "status"]
+    return dict((k, v if k in listkeys or len(v) > 1 else v[0])
+                for k, v in params.items())
+
+
+class _FakeBugzillaHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeBugzilla/1.0"
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self._handle()
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self._handle()
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        self._handle()
+
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        self._send(200, b"", "text/plain")
+
+    def _send(self, status, body, content_type, headers=None):
+        fake = self.server.fakebz
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, val in (headers or {}).items():
+            self.send_header(key, val)
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+
+        if not fake.bandwidth:
+            self.wfile.write(body)
+            return
+        chunksize = 16 * 1024
+        for offset in range(0, len(body), chunksize):
+            chunk = body[offset:offset + chunksize]
+            self.wfile.write(chunk)
+            self.wfile.flush()
+            time.sleep(len(chunk) / float(fake.bandwidth))
+
+    def _handle(self):
+        fake = self.server.fakebz
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Encoding") == "gzip":
+            import gzip
+            body = gzip.decompress(body)
+
+        parsed = urllib.parse.urlparse(self.path)
+        is_xmlrpc = parsed.path.endswith("xmlrpc.cgi")
+        call = None
+        params = {}
+        if is_xmlrpc:
+            args, call = xmlrpc.client.loads(body, use_builtin_types=True)
+            params = args and args[0] or {}
+        fake.record_request(self.command, parsed.path, call)
+
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        fault = fake.pop_fault(call or parsed.path)
+        if fault:
+            status, retry_after = fault
+            headers = {}
+            if retry_after is not None:
+                headers["Retry-After"] = str(retry_after)
+            message = "Injected fault %s" % status
+            if is_xmlrpc:
+                payload = xmlrpc.client.dumps(
+                    xmlrpc.client.Fault(status, message), methodresponse=True)
+                content_type = "text/xml"
+            else:
+                payload = json.dumps({"error": True, "code": status,
+                                      "message": message})
+                content_type = "application/json"
+            self._send(status, payload.encode("utf-8"), content_type, headers)
+            return
+
+        if is_xmlrpc:
+            self._handle_xmlrpc(call, params)
+        else:
+            self._handle_rest(parsed, body)
+
+    def _call_data(self, method, params, token):
+        fake = self.server.fakebz
+        func = getattr(fake.data, method)
+        with fake.data.lock:
+            if method in _USER_METHODS:
+                return func(params, fake.get_user(token))
+            if method == "bug_search":
+                return func(params, max_results=fake.max_results)
+            return func(params)
+
+    def _handle_xmlrpc(self, call, params):
+        try:
+            method = _XMLRPC_METHODS.get(call)
+            if not method:
+                raise FakeBugzillaError(
+                    32000, "The requested method '%s' was not found." % call)
+            if call == "Bug.add_attachment" and "data" in params:
+                params["data"] = bytes(params["data"])
+            ret = self._call_data(method, params, params.get("Bugzilla_token"))
+            if method == "bug_create":
+                ret = {"id": ret["id"]}
+            body = xmlrpc.client.dumps((_to_xmlrpc(ret),),
+                                       methodresponse=True, allow_none=True)
+        except FakeBugzillaError as e:
+            body = xmlrpc.client.dumps(xmlrpc.client.Fault(e.code, e.message),
+                                       methodresponse=True)
+        self._send(200, body.encode("utf-8"), "text/xml")
+
+    def _handle_rest(self, parsed, body):
+        path = parsed.path
+        if "/rest" in path:
+            path = path[path.index("/rest") + len("/rest"):]
+        path = path.rstrip("/") or "/"
+
+        params = _parse_query(parsed.query)
+        if body:
+            params.update(json.loads(body.decode("utf-8")))
+
+        for method, pattern, funcname, pathparam in _REST_ROUTES:
+            if method != self.command:
+                continue
+            match = re.fullmatch(pattern, path)
+            if not match:
+                continue
+            if pathparam:
+                params.setdefault(pathparam, [urllib.parse.unquote(
+                    match.group(1))])
+            if funcname == "attachment_create":
+                params["data"] = base64.b64decode(params.get("data") or "")
+            break
+        else:
+            self._send_rest(404, {"error": True, "code": 32614,
+                                  "message": "Unknown REST path %s" % path})
+            return
+
+        token = (params.get("Bugzilla_token") or
+                 self.headers.get("X-BUGZILLA-TOKEN"))
+        try:
+            ret = self._call_data(funcname, params, token)
+        except FakeBugzillaError as e:
+            self._send_rest(e.status, {"error": True, "code": e.code,
+                                       "message": e.message})
+            return
+        self._send_rest(200, ret)
+
+    def _send_rest(self, status, ret):
+        body = json.dumps(_to_json(ret)).encode("utf-8")
+        self._send(status, body, "application/json")
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           http.server.HTTPServer):
+    # Clients may hold keepalive connections open, don't wait for them
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, fakebz):
+        self.fakebz = fakebz
+        http.server.HTTPServer.__init__(self, ("127.0.0.1", 0),
+                                        _FakeBugzillaHandler)
+
+
+class FakeBugzillaServer(object):
+    """
+    Fake Bugzilla instance listening on a random localhost port, serving
+    REST at .rest_url and XMLRPC at .xmlrpc_url
+
+    :param data: FakeBugzillaData instance. If not passed, one is
+        created from the remaining keyword arguments
+    :param latency: Seconds to wait before handling every request
+    :param bandwidth: Cap on response bytes per second
+    :param max_results: Maximum number of bugs returned by a search,
+        like bugzilla's max_search_results setting
+    """
+    def __init__(self, data=None, latency=0, bandwidth=None,
+                 max_results=None, **kwargs):
+        self.data = data or FakeBugzillaData(**kwargs)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.max_results = max_results
+        self.requests = []
+
+        self._faults = []
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def url(self):
+        return "http://%s:%s" % self._httpd.server_address[:2]
+
+    @property
+    def rest_url(self):
+        return self.url + "/rest/"
+
+    @property
+    def xmlrpc_url(self):
+        return self.url + "/xmlrpc.cgi"
+
+    def start(self):
+        self._httpd = _ThreadingHTTPServer(self)
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if not self._httpd:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+        self._httpd = None
+
+    def add_fault(self, status, count=1, match=None, retry_after=None):
+        """
+        Fail the next count requests whose REST path or XMLRPC method
+        name contains match with HTTP status, like 429 or 503. The body
+        is an error in the protocol of the request, a REST JSON error or
+        an XMLRPC <fault>, with the status as the error code. Status 200
+        injects only that API level error.
+
+        :param retry_after: Value for a Retry-After response header
+        """
+        with self._lock:
+            self._faults.append({"status": status, "count": count,
+                                 "match": match, "retry_after": retry_after})
+
+    def pop_fault(self, call):
+        with self._lock:
+            for fault in self._faults:
+                if fault["match"] and fault["match"] not in call:
+                    continue
+                fault["count"] -= 1
+                if fault["count"] <= 0:
+                    self._faults.remove(fault)
+                return fault["status"], fault["retry_after"]
+        return None
+
+    def record_request(self, method, path, call):
+        with self._lock:
+            self.requests.append({"method": method, "path": path,
+                                  "call": call})
+
+    def get_user(self, token):
+        if token and "-" in str(token):
+            userid = int(str(token).split("-", 1)[0])
+            for user in self.data.users.values():
+                if user["id"] == userid:
+                    return user["name"]
+        return "nobody@example.com"
@@ -1,10 +1,12 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import base64
 import inspect
 
 import bugzilla
 from bugzilla._backendbase import _BackendBase
+from bugzilla._stream import _UploadSource
 
 import tests.utils
 
@@ -12,6 +14,14 @@ import tests.utils
 # pylint: disable=abstract-method,arguments-differ
 
 
+def _load_return(func_return):
+    if isinstance(func_return, dict):
+        return func_return
+
+    returnstr = open(tests.utils.tests_path(func_return)).read()
+    return eval(returnstr)  # pylint: disable=eval-used
+
+
 class BackendMock(_BackendBase):
     _version = None
 
@@ -47,18 +57,34 @@ class BackendMock(_BackendBase):
         if filename or expect_out:
             tests.utils.diff_compare(args, filename, expect_out)
 
-        if isinstance(func_return, dict):
-            return func_return
+        return _load_return(func_return)
 
-        returnstr = open(tests.utils.tests_path(func_return)).read()
-        return eval(returnstr)  # pylint: disable=eval-used
-
-    def bug_attachment_create(self, *args):
-        return self.__helper(args)
+    def bug_attachment_create(self, bug_ids, data, paramdict):
+        if isinstance(data, _UploadSource):
+            # Compare the same args as an in memory upload
+            data = data.read()
+        return self.__helper((bug_ids, data, paramdict))
     def bug_attachment_get(self, *args):
         return self.__helper(args)
     def bug_attachment_get_all(self, *args):
         return self.__helper(args)
+    def bug_attachment_download(self, attachment_id, fileobj):
+        # Serve the content out of the bug_attachment_get* return data
+        for name in ["_bug_attachment_get_return",
+                     "_bug_attachment_get_all_return"]:
+            func_return = getattr(self, name, None)
+            if not func_return:
+                continue
+            ret = _load_return(func_return)
+            attlist = list(ret.get("attachments", {}).values())
+            for bugattlist in ret.get("bugs", {}).values():
+                attlist += bugattlist
+            for att in attlist:
+                if str(att["id"]) == str(attachment_id):
+                    data = base64.b64decode(att["data"])
+                    fileobj.write(data)
+                    return len(data)
+        raise RuntimeError("No mock data for attachment %s" % attachment_id)
     def bug_attachment_update(self, *args):
         return self.__helper(args)
 
@@ -2,9 +2,17 @@
 # See the COPYING file in the top-level directory.
 #
 
+import base64
+import io
+import json
 import os
+import xmlrpc.client
 
 import pytest
+import responses
+
+import bugzilla
+from bugzilla._stream import _stream_json_base64, _stream_xmlrpc_base64
 
 import tests
 import tests.mockbackend
@@ -51,3 +59,262 @@ def test_api_attachments():
             isprivate=True)
     ret.sort()
     assert ret == [123456, 456789]
+
+
+def test_openattachment_cache(tmp_path):
+    cachedir = str(tmp_path / "cache")
+
+    def _make_bz(content, last_change_time="2021-01-01T00:00:00Z",
+                 attid=502352, cache_size=None):
+        attdata = {"id": attid, "file_name": "foo.log",
+                   "size": len(content), "last_change_time": last_change_time,
+                   "data": base64.b64encode(content).decode("ascii")}
+        return tests.mockbackend.make_bz(
+            bz_kwargs={"attachment_cache": cachedir,
+                       "attachment_cache_size": cache_size},
+            bug_attachment_get_args=None,
+            bug_attachment_get_return={
+                "attachments": {str(attid): attdata}})
+
+    def _no_download(*args):
+        raise AssertionError("Attachment unexpectedly downloaded")
+
+    fakebz = _make_bz(b"first content")
+    fobj = fakebz.openattachment(502352)
+    assert fobj.name == "foo.log"
+    assert fobj.read() == b"first content"
+    assert fobj.path.startswith(cachedir)
+    assert os.path.exists(cachedir + "/index/TESTSUITEMOCK/502352.json")
+    fobj.close()
+
+    # Second open is served from disk
+    # pylint: disable=protected-access
+    fakebz._backend.bug_attachment_download = _no_download
+    fobj = fakebz.openattachment(502352)
+    assert fobj.read() == b"first content"
+    fobj.close()
+
+    # Changed metadata invalidates the entry
+    fakebz = _make_bz(b"second content!",
+                      last_change_time="2021-02-01T00:00:00Z")
+    with fakebz.openattachment(502352) as fobj:
+        assert fobj.read() == b"second content!"
+
+    # Identical content is stored once
+    fakebz = _make_bz(b"second content!", attid=502353)
+    with fakebz.openattachment(502353) as fobj:
+        assert fobj.read() == b"second content!"
+    blobs = [f for dummy, dummy, files in os.walk(cachedir + "/blobs")
+             for f in files]
+    assert len(blobs) == 2
+
+    # Least recently used content is evicted to fit the size cap
+    os.utime(fobj.path, (0, 0))
+    fakebz = _make_bz(b"x" * 20, attid=502354, cache_size=40)
+    with fakebz.openattachment(502354) as fobj:
+        assert fobj.read() == b"x" * 20
+    blobs = [f for dummy, dummy, files in os.walk(cachedir + "/blobs")
+             for f in files]
+    assert len(blobs) == 2
+    fakebz = _make_bz(b"second content!", attid=502353)
+    with fakebz.openattachment(502353) as fobj:
+        assert fobj.read() == b"second content!"
+
+
+def test_attachfile_dedup(tmp_path):
+    content = b"some log output\n" * 100
+    path = tmp_path / "build.log"
+    path.write_bytes(content)
+
+    def _att(attid, data, **kwargs):
+        ret = {"id": attid, "size": len(data), "is_obsolete": 0,
+               "last_change_time": "2021-01-01T00:00:00Z",
+               "data": base64.b64encode(data).decode("ascii")}
+        ret.update(kwargs)
+        return ret
+
+    getall_return = {"bugs": {
+        # Same size but different content, then a real duplicate
+        "1": [_att(10, b"x" * len(content)), _att(11, content)],
+        # Obsolete duplicate doesn't count
+        "2": [_att(20, content, is_obsolete=1)],
+        "3": [],
+    }}
+    fakebz = tests.mockbackend.make_bz(
+        bz_kwargs={"attachment_cache": str(tmp_path / "cache")},
+        bug_attachment_get_all_args=None,
+        bug_attachment_get_all_return=getall_return,
+        bug_attachment_create_args=None,
+        bug_attachment_create_return={"ids": [21, 31]})
+
+    downloads = []
+    # pylint: disable=protected-access
+    origdownload = fakebz._backend.bug_attachment_download
+
+    def _download(attid, fileobj):
+        downloads.append(attid)
+        return origdownload(attid, fileobj)
+    fakebz._backend.bug_attachment_download = _download
+
+    with open(str(path), "rb") as fobj:
+        ret = fakebz.attachfile([1, 2, 3], fobj, "log", dedup=True)
+    assert ret == [11, 21, 31]
+    assert sorted(downloads) == [10, 11]
+
+    # Remote hashes are cached, and nothing is uploaded if every bug
+    # already has the content
+    downloads[:] = []
+
+    def _no_create(*args):
+        raise AssertionError("Unexpected upload")
+    fakebz._backend.bug_attachment_create = _no_create
+    assert fakebz.attachfile(1, io.BytesIO(content), "log",
+                             file_name="build.log", dedup=True) == 11
+    assert downloads == []
+
+
+def _chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_stream_decoders():
+    content = os.urandom(5000)
+    b64 = base64.b64encode(content).decode("ascii")
+
+    # JSON escapes and key ordering, fed in awkward chunk sizes
+    doc = json.dumps({"bugs": {}, "attachments": {"123": {
+        "file_name": 'a "data": "x"', "data": b64[:100] + "\n" + b64[100:],
+        "size": 5000}}}).replace("/", "\\/").encode("utf-8")
+    for size in [1, 3, 7, 4096]:
+        out = io.BytesIO()
+        ret = _stream_json_base64(_chunked(doc, size), out)
+        assert ret == (5000, None)
+        assert out.getvalue() == content
+
+    out = io.BytesIO()
+    ret = _stream_json_base64([b'{"error": true}'], out)
+    assert ret == (None, b'{"error": true}')
+
+    doc = xmlrpc.client.dumps(({"attachments": {"123": {
+        "data": xmlrpc.client.Binary(content)}}},),
+        methodresponse=True).encode("utf-8")
+    for size in [1, 5, 4096]:
+        out = io.BytesIO()
+        assert _stream_xmlrpc_base64(_chunked(doc, size), out) == (5000, None)
+        assert out.getvalue() == content
+
+
+def test_download_attachment(tmp_path):
+    content = os.urandom(200000)
+    b64 = base64.b64encode(content).decode("ascii")
+    rest_url = "https://example.com/rest/"
+    xmlrpc_url = "https://example.com/xmlrpc.cgi"
+
+    with responses.RequestsMock() as mock:
+        mock.add(responses.GET, rest_url + "version",
+                 json={"version": "5.0.6"})
+        bz = bugzilla.Bugzilla(rest_url, use_creds=False)
+        mock.add(responses.GET, rest_url + "bug/attachment/123",
+                 json={"attachments": {"123": {"data": b64}}, "bugs": {}})
+        out = io.BytesIO()
+        assert bz.download_attachment(123, out) == len(content)
+        assert out.getvalue() == content
+        assert "include_fields=data" in mock.calls[-1].request.url
+
+        path = str(tmp_path / "out.bin")
+        assert bz.download_attachment(123, path) == len(content)
+        assert open(path, "rb").read() == content
+
+        # Errors are raised, and partial output files removed
+        mock.add(responses.GET, rest_url + "bug/attachment/124", status=404,
+                 json={"error": True, "code": 304, "message": "No access"})
+        with pytest.raises(bugzilla.BugzillaError) as e:
+            bz.download_attachment(124, path)
+        assert "No access" in str(e.value)
+        assert not os.path.exists(path)
+
+    replies = {
+        "Bugzilla.version": {"version": "5.0.6"},
+        "Bug.attachments": {"attachments": {"123": {
+            "data": xmlrpc.client.Binary(content)}}},
+    }
+
+    def _xmlrpc_cb(request):
+        params, methodname = xmlrpc.client.loads(request.body)
+        if params[0].get("attachment_ids") == [124]:
+            body = xmlrpc.client.dumps(xmlrpc.client.Fault(304, "No access"),
+                                       methodresponse=True)
+            return 200, {}, body
+        return 200, {}, xmlrpc.client.dumps((replies[methodname],),
+                                            methodresponse=True)
+
+    with responses.RequestsMock() as mock:
+        mock.add_callback(responses.POST, xmlrpc_url, callback=_xmlrpc_cb)
+        bz = bugzilla.Bugzilla(xmlrpc_url, use_creds=False)
+        out = io.BytesIO()
+        assert bz.download_attachment(123, out) == len(content)
+        assert out.getvalue() == content
+
+        with pytest.raises(xmlrpc.client.Fault):
+            bz.download_attachment(124, io.BytesIO())
+
+
+def test_upload_attachment_streaming(tmp_path):
+    # Odd size, so the base64 output needs padding
+    content = os.urandom(200002) + b"\r\n"
+    path = tmp_path / "upload.bin"
+    path.write_bytes(content)
+    rest_url = "https://example.com/rest/"
+    xmlrpc_url = "https://example.com/xmlrpc.cgi"
+
+    def _read_body(request):
+        body = request.body
+        if hasattr(body, "read"):
+            body = body.read()
+        assert int(request.headers["Content-Length"]) == len(body)
+        return body
+
+    sent = {}
+
+    def _rest_cb(request):
+        sent.update(json.loads(_read_body(request)))
+        return 200, {}, json.dumps({"ids": [555]})
+
+    with responses.RequestsMock() as mock:
+        mock.add(responses.GET, rest_url + "version",
+                 json={"version": "5.0.6"})
+        mock.add_callback(responses.POST, rest_url + "bug/123/attachment",
+                          callback=_rest_cb)
+        bz = bugzilla.Bugzilla(rest_url, use_creds=False)
+        with open(str(path), "rb") as fobj:
+            assert bz.attachfile(123, fobj, "some desc",
+                                 file_name="foo.bin") == 555
+        assert base64.b64decode(sent.pop("data")) == content
+        assert sent == {"ids": [123], "summary": "some desc",
+                        "file_name": "foo.bin",
+                        "content_type": "application/octet-stream"}
+
+    replies = {
+        "Bugzilla.version": {"version": "5.0.6"},
+        "Bug.add_attachment": {"ids": [556]},
+    }
+
+    def _xmlrpc_cb(request):
+        params, methodname = xmlrpc.client.loads(_read_body(request))
+        if methodname == "Bug.add_attachment":
+            sent.update(params[0])
+        return 200, {}, xmlrpc.client.dumps((replies[methodname],),
+                                            methodresponse=True)
+
+    with responses.RequestsMock() as mock:
+        mock.add_callback(responses.POST, xmlrpc_url, callback=_xmlrpc_cb)
+        bz = bugzilla.Bugzilla(xmlrpc_url, use_creds=False)
+        with open(str(path), "rb") as fobj:
+            fobj.read(2)
+            # Uploads start at the current file offset
+            assert bz.attachfile(123, fobj, "some desc",
+                                 contenttype="text/plain") == 556
+        assert sent.pop("data").data == content[2:]
+        assert sent == {"ids": [123], "summary": "some desc",
+                        "file_name": "upload.bin",
+                        "content_type": "text/plain"}
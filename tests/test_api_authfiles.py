@@ -102,6 +102,32 @@ cert=/newpath
     _check(None, None, None, None)
 
 
+def test_readconfig_connection():
+    # Connection tuning values in bugzillarc
+    bzapi = tests.mockbackend.make_bz()
+    bzapi.url = "example.com"
+    temp = tempfile.NamedTemporaryFile(mode="w")
+    temp.write("""
+[example.com]
+pool_connections=4
+pool_maxsize=64
+keepalive=no
+connect_timeout=2.5
+""")
+    temp.flush()
+
+    # pylint: disable=protected-access
+    bzapi._pool_maxsize = 8
+    bzapi.readconfig(temp.name, overwrite=False)
+    assert bzapi._pool_connections == 4
+    assert bzapi._pool_maxsize == 8
+    assert bzapi._keepalive is False
+    assert bzapi._connect_timeout == 2.5
+
+    bzapi.readconfig(temp.name)
+    assert bzapi._pool_maxsize == 64
+
+
 def test_authfiles_saving(monkeypatch):
     tmpdir = tempfile.mkdtemp()
     try:
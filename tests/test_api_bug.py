@@ -221,3 +221,114 @@ def test_bug_weburl():
     bug_id = 1165434
     bug = fakebz.getbug(bug_id)
     assert bug.weburl == f"https:///show_bug.cgi?id={bug_id}"
+
+
+def test_update_bugs_bulk(tmp_path):
+    fakebz = tests.mockbackend.make_bz()
+    calls = []
+    failids = []
+
+    def _bug_update(ids, update):
+        if set(ids) & set(failids):
+            raise RuntimeError("fake failure")
+        calls.append((sorted(ids), update))
+        return {"bugs": [{"id": i} for i in ids]}
+    # pylint: disable=protected-access
+    fakebz._backend.bug_update = _bug_update
+
+    post = fakebz.build_update(status="POST")
+    assigned = fakebz.build_update(assigned_to="foo@example.com")
+    updates = [
+        ([1, 2], post),
+        (3, dict(post)),
+        (4, assigned),
+        ([2, 5], fakebz.build_update(status="POST")),
+    ]
+
+    # Identical payloads are merged into one call
+    journal = str(tmp_path / "journal")
+    failids.append(4)
+    ret = fakebz.update_bugs_bulk(updates, journal=journal, max_rate=1000)
+    assert [r["ids"] for r in ret] == [[1, 2, 3, 5], [4]]
+    assert ret[0]["result"]["bugs"][0]["id"] == 1
+    assert "fake failure" in str(ret[1]["error"])
+    assert calls == [([1, 2, 3, 5], post)]
+
+    # Rerun with the journal only retries what failed. A partially
+    # written journal line is ignored
+    with open(journal, "a") as fobj:
+        fobj.write('{"key": "trunc')
+    del calls[:]
+    del failids[:]
+    updates.append((6, post))
+    ret = fakebz.update_bugs_bulk(updates, journal=journal)
+    assert calls == [([6], post), ([4], assigned)]
+
+    ret = fakebz.update_bugs_bulk(updates, journal=journal)
+    assert ret == []
+
+    # Different updates of the same bug are applied in input order,
+    # and later ones are skipped if an earlier one failed
+    del calls[:]
+    closed = fakebz.build_update(status="CLOSED")
+    failids.append(7)
+    ret = fakebz.update_bugs_bulk([
+        (1, post), (1, post), (7, assigned), ([1, 7], closed), (2, closed)])
+    assert calls == [([1], post), ([2], closed), ([1], closed)]
+    assert [r["ids"] for r in ret] == [[1], [7], [2], [7], [1]]
+    assert "fake failure" in str(ret[1]["error"])
+    assert "earlier update of these bugs failed" in str(ret[3]["error"])
+
+
+def test_update_bugs_skip_noop():
+    bugs = {"bugs": [
+        {"id": 1, "alias": ["foo"], "status": "POST",
+         "keywords": ["Triaged"], "version": ["rawhide"],
+         "assigned_to": "a@example.com"},
+        {"id": 2, "alias": [], "status": "NEW",
+         "keywords": [], "version": ["rawhide"],
+         "assigned_to": "a@example.com"},
+    ]}
+    fakebz = tests.mockbackend.make_bz(
+        bug_get_args=None, bug_get_return=bugs)
+    calls = []
+
+    def _bug_update(ids, update):
+        calls.append((ids, update))
+        return {"bugs": [{"id": i} for i in ids]}
+    # pylint: disable=protected-access
+    fakebz._backend.bug_update = _bug_update
+
+    # Bug 1 is already in the target state, bug 2 only needs status
+    update = fakebz.build_update(status="POST", keywords_add="Triaged",
+        keywords_remove="Blocker", version="rawhide",
+        assigned_to="a@example.com", minor_update=True)
+    ret = fakebz.update_bugs(["foo", 2], update, skip_noop=True)
+    assert calls == [([2], {
+        "status": "POST",
+        "keywords": {"add": ["Triaged"], "remove": ["Blocker"]},
+        "minor_update": True})]
+    assert ret["bugs"] == [{"id": 2}]
+    assert ret["skipped"] == {
+        "foo": ["assigned_to", "status", "version", "keywords"],
+        2: ["assigned_to", "version"]}
+
+    # Comments are always sent. Passed in Bug objects are used rather
+    # than fetching bug data, which makes bug 2 a no-op here
+    del calls[:]
+    bug2 = Bug(fakebz, dict=dict(bugs["bugs"][1], status="POST",
+                                 keywords=["Triaged"]))
+    update = fakebz.build_update(status="POST", comment="hello")
+    ret = fakebz.update_bugs([1, 2], update, skip_noop=True)
+    assert calls == [
+        ([1], {"comment": {"comment": "hello"}}),
+        ([2], {"status": "POST", "comment": {"comment": "hello"}})]
+    del calls[:]
+    ret = fakebz.update_bugs([2], fakebz.build_update(status="POST",
+        keywords_set=["Triaged"]), skip_noop=True, known_bugs=[bug2])
+    assert calls == []
+    assert ret == {"bugs": [], "skipped": {2: ["status", "keywords"]}}
+
+    # Bugs whose data couldn't be fetched get the full update
+    ret = fakebz.update_bugs([3], update, skip_noop=True)
+    assert calls == [([3], update)]
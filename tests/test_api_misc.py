@@ -133,6 +133,58 @@ def testCreatebugFieldConversion():
         'summary': 'bar', 'version': '12'}
 
 
+def test_createbugs():
+    fakebz = tests.mockbackend.make_bz(
+        bug_get_args=None,
+        bug_get_return={"bugs": [{"id": 100, "summary": "bug0"},
+                                 {"id": 102, "summary": "bug2"}]})
+    calls = []
+
+    def _bug_create(data):
+        calls.append(data)
+        if data["summary"] == "bug1":
+            raise bugzilla.BugzillaError("fake failure")
+        return {"id": 100 + int(data["summary"][-1])}
+    # pylint: disable=protected-access
+    fakebz._backend.bug_create = _bug_create
+
+    def _build(idx):
+        return fakebz.build_createbug(product="foo", component="bar",
+            version="1", summary="bug%d" % idx, description="desc")
+
+    # Nothing is submitted if any item is invalid
+    datalist = [_build(0), _build(1), {"product": "foo", "version": "1"}]
+    with pytest.raises(bugzilla.BugzillaError) as e:
+        fakebz.createbugs(datalist)
+    assert ("item 2 is missing component, summary, description" in
+            str(e.value))
+    assert not calls
+
+    datalist[2] = _build(2)
+    ret = fakebz.createbugs(datalist, max_rate=1000)
+    assert sorted(c["summary"] for c in calls) == ["bug0", "bug1", "bug2"]
+    assert [r["data"]["summary"] for r in ret] == ["bug0", "bug1", "bug2"]
+    assert ret[0]["bug"].bug_id == 100
+    assert "fake failure" in str(ret[1]["error"])
+    assert ret[2]["bug"].bug_id == 102
+    assert "summary" not in ret[2]["bug"]._rawdata
+
+    # refresh=True fetches all the new bugs at once
+    ret = fakebz.createbugs(datalist, refresh=True)
+    assert ret[0]["bug"].summary == "bug0"
+    assert ret[2]["bug"].summary == "bug2"
+
+    # A bug missing from the refresh keeps its ID-only Bug, and doesn't
+    # shift the other results
+    fakebz._backend._bug_get_return = {
+        "bugs": [{"id": 102, "summary": "bug2"}]}
+    ret = fakebz.createbugs(datalist, refresh=True)
+    assert ret[0]["bug"].bug_id == 100
+    assert "summary" not in ret[0]["bug"]._rawdata
+    assert ret[2]["bug"].bug_id == 102
+    assert ret[2]["bug"].summary == "bug2"
+
+
 def testURLSavedSearch():
     bz4 = tests.mockbackend.make_bz(version="4.0.0")
     url = ("https://bugzilla.redhat.com/buglist.cgi?"
@@ -315,3 +367,40 @@ def test_query_return_extra():
     dummy, extra = bz.query_return_extra({})
     assert extra['limit'] == 0
     assert extra['FOOFAKEVALUE'] == "hello"
+
+
+def test_query_debug_logging(caplog):
+    # Search results are only formatted for debug logging when it's
+    # enabled, and then truncated
+    class _Payload(object):
+        formatted = 0
+
+        def __repr__(self):
+            _Payload.formatted += 1
+            return "x" * 100000
+
+    payload = _Payload()
+    bugs = [{"id": i, "summary": "bug %s" % i} for i in range(1, 1001)]
+    bz = tests.mockbackend.make_bz(version="5.1.0",
+            bug_search_args=None,
+            bug_search_return={"bugs": bugs, "payload": payload})
+
+    caplog.set_level("WARNING", logger="bugzilla")
+    assert len(bz.query({})) == 1000
+    assert _Payload.formatted == 0
+
+    bz = tests.mockbackend.make_bz(version="5.1.0",
+            bug_search_args=None,
+            bug_search_return={"bugs": bugs, "payload": payload})
+    caplog.set_level("DEBUG", logger="bugzilla")
+    bz.query({})
+    assert _Payload.formatted >= 1
+    message = [r.getMessage() for r in caplog.records
+               if r.getMessage().startswith("bug_search returned")][0]
+    assert len(message) < 2100
+    assert "'id': 10, " in message
+    assert "'id': 11, " not in message
+
+    # pylint: disable=protected-access
+    text = str(bugzilla._util.log_truncate(b"x" * 5000))
+    assert text.endswith("x... (3000 more characters)")
@@ -0,0 +1,161 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import json
+import xmlrpc.client
+
+import pytest
+import responses
+
+import bugzilla
+from bugzilla._backendhybrid import (_rest_url_from_xmlrpc_url,
+                                     _xmlrpc_url_from_rest_url)
+
+
+XMLRPC_URL = "https://example.com/xmlrpc.cgi"
+REST_URL = "https://example.com/rest/"
+
+
+def _xmlrpc_reply(value):
+    return xmlrpc.client.dumps((value,), methodresponse=True)
+
+
+def _add_calibration_calls(mock):
+    replies = {
+        "Bugzilla.version": {"version": "5.0.6"},
+        "Bug.fields": {"fields": []},
+        "Bug.get": {"bugs": [{"id": 1}]},
+    }
+
+    def _xmlrpc_cb(request):
+        dummy, methodname = xmlrpc.client.loads(request.body)
+        return 200, {}, _xmlrpc_reply(replies[methodname])
+
+    mock.add(responses.GET, REST_URL + "version",
+             json={"version": "5.0.6"})
+    mock.add(responses.GET, REST_URL + "field/bug",
+             json={"fields": []})
+    mock.add(responses.GET, REST_URL + "bug/1",
+             json={"bugs": [{"id": 1}]})
+    mock.add_callback(responses.POST, XMLRPC_URL, callback=_xmlrpc_cb)
+
+
+def _open_bz(**kwargs):
+    return bugzilla.Bugzilla("example.com", use_creds=False,
+                             force_hybrid=True, **kwargs)
+
+
+def test_rest_url_from_xmlrpc_url():
+    assert _rest_url_from_xmlrpc_url(XMLRPC_URL) == REST_URL
+    assert (_rest_url_from_xmlrpc_url("https://example.com/bz/xmlrpc.cgi") ==
+            "https://example.com/bz/rest/")
+    assert _rest_url_from_xmlrpc_url(REST_URL) == REST_URL
+
+
+def test_xmlrpc_url_from_rest_url():
+    assert _xmlrpc_url_from_rest_url(REST_URL) == XMLRPC_URL
+    assert _xmlrpc_url_from_rest_url(REST_URL[:-1]) == XMLRPC_URL
+    assert (_xmlrpc_url_from_rest_url("https://example.com/bz/rest/") ==
+            "https://example.com/bz/xmlrpc.cgi")
+    assert _xmlrpc_url_from_rest_url(XMLRPC_URL) == XMLRPC_URL
+
+
+def test_hybrid_rest_url():
+    # Passing the REST URL still routes XMLRPC calls to xmlrpc.cgi
+    with responses.RequestsMock() as mock:
+        mock.add(responses.GET, REST_URL + "version",
+                 json={"version": "5.0.6"})
+        bz = bugzilla.Bugzilla(REST_URL, use_creds=False, force_hybrid=True)
+        assert bz.url == XMLRPC_URL
+
+        mock.add(responses.POST, XMLRPC_URL, body=_xmlrpc_reply({}))
+        bz.update_tags([1], tags_add="foo")
+        assert mock.calls[-1].request.url == XMLRPC_URL
+
+
+def test_hybrid_routing():
+    with responses.RequestsMock() as mock:
+        mock.add(responses.GET, REST_URL + "version",
+                 json={"version": "5.0.6"})
+        bz = _open_bz()
+        assert bz.is_hybrid() is True
+        assert bz.is_rest() is False
+        assert bz.is_xmlrpc() is False
+        assert bz.url == XMLRPC_URL
+
+        # Single bug fetch uses REST
+        mock.add(responses.GET, REST_URL + "bug/1",
+                 json={"bugs": [{"id": 1, "summary": "foo"}]})
+        assert bz.getbug(1).summary == "foo"
+
+        # Multi ID comments go to XMLRPC as a single request,
+        # rather than looping over REST
+        mock.add(responses.POST, XMLRPC_URL, body=_xmlrpc_reply(
+            {"bugs": {"1": {"comments": []}, "2": {"comments": []}}}))
+        ret = bz.get_comments([1, 2])
+        assert sorted(ret["bugs"].keys()) == ["1", "2"]
+        body = mock.calls[-1].request.body
+        assert b"Bug.comments" in body
+        assert mock.calls[-1].request.headers["Content-Type"] == "text/xml"
+
+        # update_tags has no REST API
+        mock.add(responses.POST, XMLRPC_URL, body=_xmlrpc_reply({}))
+        bz.update_tags([1], tags_add="foo")
+        assert b"Bug.update_tags" in mock.calls[-1].request.body
+
+        # REST calls keep sending JSON even though the XMLRPC
+        # backend shares the session
+        mock.add(responses.GET, REST_URL + "bug",
+                 json={"bugs": [{"id": 5}]})
+        bz.query({"product": "foo"})
+        assert (mock.calls[-1].request.headers["Content-Type"] ==
+                "application/json")
+
+
+def test_hybrid_calibrate():
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as mock:
+        _add_calibration_calls(mock)
+
+        bz = _open_bz()
+        # pylint: disable=protected-access,no-member
+        ret = bz._backend.calibrate(samples=1, bug_ids=[1])
+        assert sorted(ret.keys()) == ["bug", "metadata"]
+        assert bz._backend.get_calibration() == ret
+        assert b"Bug.get" in mock.calls[-1].request.body
+
+        # Each operation class is routed by its own timings
+        for opclass, timings in ret.items():
+            assert sorted(timings) == ["rest", "xmlrpc"]
+            route = bz._backend._route(opclass)
+            if timings["xmlrpc"] < timings["rest"]:
+                assert route.is_xmlrpc()
+            else:
+                assert route.is_rest()
+
+        # Force distinct routes, and check calls follow them
+        bz._backend._routes["metadata"] = bz._backend._xmlrpc
+        bz._backend._routes["bug"] = bz._backend._rest
+        bz._backend.bug_fields({})
+        assert b"Bug.fields" in mock.calls[-1].request.body
+        bz._backend.bug_get([1], None, {})
+        assert mock.calls[-1].request.url.startswith(REST_URL + "bug/1")
+
+        # Without bug IDs, the bug class is routed like metadata
+        ret = bz._backend.calibrate(samples=1)
+        assert ret["bug"] == ret["metadata"]
+
+
+def test_hybrid_force_conflict():
+    with pytest.raises(bugzilla.BugzillaError):
+        bugzilla.Bugzilla("example.com", use_creds=False,
+                          force_hybrid=True, force_rest=True)
+
+
+def test_hybrid_connect_calibrate():
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as mock:
+        _add_calibration_calls(mock)
+        bz = bugzilla.Bugzilla("example.com", use_creds=False,
+                               force_hybrid="calibrate")
+        # pylint: disable=protected-access,no-member
+        assert sorted(bz._backend.get_calibration()) == ["bug", "metadata"]
+        assert json.dumps(bz._backend.get_calibration())
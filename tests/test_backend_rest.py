@@ -1,5 +1,11 @@
+import json
 from types import MethodType
+import urllib.parse
 
+import pytest
+import responses
+
+import bugzilla
 from bugzilla._backendrest import _BackendREST
 from bugzilla._session import _BugzillaSession
 
@@ -65,3 +71,44 @@ class TestGetBug:
             backend.bug_get(_ids, aliases, {"permissive": True})
 
             assert backend.assertion_called is True
+
+
+def test_getbugs_split_long_url():
+    def _bug_cb(request):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(request.url).query)
+        assert len(request.url) <= 300
+        bugs = [{"id": int(i)} for i in query.get("id", [])]
+        bugs += [{"id": 0, "alias": [a]} for a in query.get("alias", [])]
+        return 200, {}, json.dumps({"bugs": bugs, "faults": []})
+
+    with responses.RequestsMock() as mock:
+        mock.add(responses.GET, "https://example.com/rest/version",
+                 json={"version": "5.0.6"})
+        mock.add_callback(responses.GET, "https://example.com/rest/bug",
+                          callback=_bug_cb)
+
+        bz = bugzilla.Bugzilla("https://example.com/rest",
+                               use_creds=False, max_url_length=300)
+        ids = list(range(100000, 100200)) + ["CVE-1234-5678"]
+        bugs = bz.getbugs(ids, include_fields=["id", "alias"])
+        assert [b.id for b in bugs[:-1]] == ids[:-1]
+        assert bugs[-1].alias == ["CVE-1234-5678"]
+        # version call + multiple bug requests
+        assert len(mock.calls) > 3
+
+        # A short list is still a single request
+        ncalls = len(mock.calls)
+        bz.getbugs([1, 2])
+        assert len(mock.calls) == ncalls + 1
+
+        # Parameters that can't be split raise an error, rather than
+        # being sent in oversized requests
+        ncalls = len(mock.calls)
+        fields = ["field_number_%d" % i for i in range(30)]
+        with pytest.raises(bugzilla.BugzillaError) as e:
+            bz.getbugs(ids, include_fields=fields)
+        assert "other than id/alias are too long" in str(e.value)
+        with pytest.raises(bugzilla.BugzillaError) as e:
+            bz.getbugs([1, 2, "CVE-" + "9" * 300])
+        assert "alias value CVE-999" in str(e.value)
+        assert len(mock.calls) == ncalls
@@ -0,0 +1,58 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import json
+
+import benchmarks.bench
+
+# pylint: disable=protected-access
+
+
+def test_benchmarks(tmp_path):
+    # Quick offline run of a cheap subset
+    outpath = str(tmp_path / "out.json")
+    args = ["--sizes", "20", "--repeat", "1", "--filter", "decode",
+            "--output", outpath]
+    assert benchmarks.bench.main(args) == 0
+    with open(outpath) as fobj:
+        results = json.load(fobj)
+    assert sorted(results["results"]) == ["decode.rest.20",
+                                          "decode.xmlrpc.20"]
+    assert results["results"]["decode.rest.20"]["peak_bytes"] > 0
+    # Timings are also recorded relative to the calibration workload
+    calibration = results["metadata"]["calibration_seconds"]
+    assert calibration > 0
+    rest = results["results"]["decode.rest.20"]
+    assert abs(rest["relative"] - rest["seconds"] / calibration) < .01
+
+    # Comparing against itself is clean
+    assert benchmarks.bench.main(args + ["--baseline", outpath]) == 0
+
+    args = ["--sizes", "20", "--repeat", "1", "--filter", "logging",
+            "--output", outpath]
+    assert benchmarks.bench.main(args) == 0
+    with open(outpath) as fobj:
+        results = json.load(fobj)
+    assert sorted(results["results"]) == ["logging.query.debug.20",
+                                          "logging.query.nolog.20",
+                                          "logging.query.off.20"]
+
+    # Timings are compared relative to the calibration workload, so a
+    # baseline from a machine twice as fast doesn't flag everything
+    baseline = {
+        "slower": {"seconds": 1.0, "relative": 10.0, "peak_bytes": 1000},
+        "noise": {"seconds": 0.001, "relative": 0.01},
+        "same": {"seconds": 0.5, "relative": 10.0, "peak_bytes": 1000},
+    }
+    results = {
+        "slower": {"seconds": 4.0, "relative": 20.0, "peak_bytes": 5000},
+        "noise": {"seconds": 0.006, "relative": 0.03},
+        "same": {"seconds": 2.0, "relative": 11.0, "peak_bytes": 1100},
+        "new": {"seconds": 1.0, "relative": 5.0},
+    }
+    regressions = benchmarks.bench._compare(results, baseline,
+                                            0.25, 0.005, 0.2)
+    assert len(regressions) == 2
+    assert regressions[0].startswith(
+        "slower relative: 10.0 -> 20.0 (+100%)")
+    assert regressions[1].startswith("slower peak_bytes")
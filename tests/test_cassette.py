@@ -0,0 +1,72 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import gzip
+import io
+import time
+
+import pytest
+import requests
+
+import bugzilla
+
+from tests.fakebugzilla import FakeBugzillaServer
+
+
+def _workload(bz):
+    ret = [bz.getbug(3).summary]
+    ret.append([b.id for b in bz.query(bz.build_query(product="Product1"))])
+    bz.update_bugs([3], bz.build_update(status="CLOSED"))
+    ret.append(bz.getbug(3).status)
+    out = io.BytesIO()
+    bz.download_attachment(1, out)
+    ret.append(out.getvalue())
+    with pytest.raises(Exception) as e:
+        bz.getbug(999)
+    ret.append(str(e.value))
+    return ret
+
+
+@pytest.mark.parametrize("api,suffix", [("rest", ""), ("xmlrpc", ".gz")])
+def test_cassette_record_replay(api, suffix, tmp_path):
+    cassette = str(tmp_path / ("traffic.jsonl" + suffix))
+    apikey = "SECRET-API-KEY-1234"
+
+    with FakeBugzillaServer(num_bugs=10) as server:
+        url = server.rest_url if api == "rest" else server.xmlrpc_url
+        bz = bugzilla.Bugzilla(url, use_creds=False, api_key=apikey,
+                               record_cassette=cassette)
+        recorded = _workload(bz)
+        assert recorded[2] == "CLOSED"
+
+    opener = suffix and gzip.open or open
+    with opener(cassette, "rb") as fobj:
+        content = fobj.read()
+    assert apikey.encode() not in content
+    if api == "rest":
+        assert b"api_key=SCRUBBED" in content
+
+    # The server is gone, everything comes from the cassette
+    bz = bugzilla.Bugzilla(url, use_creds=False, api_key="other-key",
+                           replay_cassette=cassette)
+    assert _workload(bz) == recorded
+
+    # Unrecorded requests fail like a network error
+    with pytest.raises(requests.exceptions.ConnectionError):
+        bz.getbug(4)
+
+    # Optionally with the original timing
+    with FakeBugzillaServer(num_bugs=10, latency=0.2) as server:
+        url = server.rest_url
+        bz = bugzilla.Bugzilla(url, use_creds=False,
+                               record_cassette=cassette)
+        bz.getbug(1)
+    bz = bugzilla.Bugzilla(url, use_creds=False, replay_cassette=cassette,
+                           replay_timing=True)
+    start = time.monotonic()
+    bz.getbug(1)
+    assert time.monotonic() - start >= 0.2
+
+    with pytest.raises(TypeError):
+        bugzilla.Bugzilla(None, record_cassette=cassette,
+                          replay_cassette=cassette)
@@ -61,6 +61,22 @@ def test_attach(run_cli):
     out = run_cli(cmd, fakebz)
     assert "Created attachment 1557949 on bug 123456" in out
 
+    # Multiple bugs are handled with a single upload
+    cmd = "bugzilla attach 123456 123457 --file=%s " % attachfile
+    fakebz = tests.mockbackend.make_bz(
+        bug_attachment_create_args="data/mockargs/test_attach4.txt",
+        bug_attachment_create_return={'ids': [1557949, 1557950]})
+    out = run_cli(cmd, fakebz)
+    assert "Created attachment 1557949 on bug 123456" in out
+    assert "Created attachment 1557950 on bug 123457" in out
+
+    # Old bugzilla doesn't map attachments to bugs
+    fakebz = tests.mockbackend.make_bz(
+        bug_attachment_create_args="data/mockargs/test_attach4.txt",
+        bug_attachment_create_return={'attachments': {"1557949": {}}})
+    out = run_cli(cmd, fakebz)
+    assert "Created attachments 1557949 on bugs 123456, 123457" in out
+
 
 def _test_attach_get(run_cli):
     # Hit error when using ids with --get*
@@ -88,7 +104,23 @@ def _test_attach_get(run_cli):
     os.system("ls %s" % os.getcwd())
     filename += ".1"
     assert filename in out
-    assert "bugzilla-filename" in out
+    assert "bugzilla-filename-2.patch" in out
+    assert "bugzilla-filename.patch" not in out
+    assert open("bugzilla-filename-2.patch").read().startswith("--- ")
+
+    # Metadata filters
+    cmd = "bugzilla attach --getall 663674 --content-type 'text/*' "
+    cmd += "--max-size 100"
+    fakebz = tests.mockbackend.make_bz(
+        bug_attachment_get_all_args="data/mockargs/test_attach_get2.txt",
+        bug_attachment_get_all_return="data/mockreturn/test_attach_get2.txt")
+    out = run_cli(cmd, fakebz)
+    assert out.splitlines() == ["Wrote %s" % filename[:-2] + ".2"]
+
+    cmd = "bugzilla attach --getall 663674 --patches-only "
+    cmd += "--file-name '*.patch'"
+    out = run_cli(cmd, fakebz)
+    assert out.splitlines() == ["Wrote bugzilla-filename-2.patch.1"]
 
 
 def test_attach_get(run_cli):
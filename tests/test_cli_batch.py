@@ -0,0 +1,160 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import contextlib
+import io
+import json
+import os
+import shlex
+import socket
+import sys
+import threading
+
+import pytest
+
+import bugzilla
+
+import tests
+import tests.mockbackend
+import tests.utils
+
+# pylint: disable=protected-access
+
+
+def _make_query_bz():
+    return tests.mockbackend.make_bz(
+        bug_search_args=None,
+        bug_search_return="data/mockreturn/test_query1.txt")
+
+
+#################################
+# 'bugzilla batch' mock testing #
+#################################
+
+def test_batch(run_cli, tmp_path):
+    single = run_cli("bugzilla query --bug_id 1234 --ids", _make_query_bz())
+
+    cmds = """
+# comment lines and blank lines are skipped
+
+query --bug_id 1234 --ids
+bugzilla query --bug_id 1234 --ids
+"""
+    fakebz = _make_query_bz()
+    out = run_cli("bugzilla batch", fakebz, stdin=cmds)
+    assert out == single * 2
+
+    # Same thing in parallel, from a file. Output stays in input order
+    cmdfile = tmp_path / "cmds.txt"
+    cmdfile.write_text(cmds + "info --products\n" * 3)
+    fakebz = tests.mockbackend.make_bz(
+        bug_search_args=None,
+        bug_search_return="data/mockreturn/test_query1.txt",
+        product_get_args=None,
+        product_get_return={"products": [{"id": 1, "name": "foo"}]},
+        product_get_accessible_args=None,
+        product_get_accessible_return={"ids": [1]})
+    out = run_cli("bugzilla batch --parallel 4 --file %s" % cmdfile, fakebz)
+    assert out == single * 2 + "foo\n" * 3
+
+    # Failing commands are reported, but don't stop the batch
+    cmds = "query --bug_id 1234 --ids\nlogin\nquery --xbadarg\n"
+    out = run_cli("bugzilla batch", _make_query_bz(),
+                  stdin=cmds, expectfail=True)
+    assert out.startswith(single)
+    assert "Command 2 failed with status 2: login" in out
+    assert "unrecognized arguments: --xbadarg" in out
+
+
+#################################
+# 'bugzilla serve' mock testing #
+#################################
+
+@contextlib.contextmanager
+def _serve(bz, sockpath):
+    server = bugzilla._cli._make_cli_server(bz, sockpath)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def test_serve(run_cli, tmp_path):
+    single = run_cli("bugzilla query --bug_id 1234 --ids", _make_query_bz())
+
+    sockpath = str(tmp_path / "bz.sock")
+    # Stale files that aren't sockets are left alone
+    open(sockpath, "w").close()
+    with pytest.raises(RuntimeError):
+        bugzilla._cli._make_cli_server(None, sockpath)
+    os.unlink(sockpath)
+
+    with _serve(_make_query_bz(), sockpath):
+        assert (os.stat(sockpath).st_mode & 0o777) == 0o600
+
+        # The client doesn't need a working bugzilla instance at all
+        cmd = "bugzilla --socket %s query --bug_id 1234 --ids" % sockpath
+        out = run_cli(cmd, _make_query_bz())
+        assert out == single
+
+        cmd = "bugzilla --socket %s query --xbadarg" % sockpath
+        out = run_cli(cmd, _make_query_bz(), expectfail=True)
+        assert "unrecognized arguments: --xbadarg" in out
+
+    assert not os.path.exists(sockpath)
+
+
+def _send(sockpath, request):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+        sock.connect(sockpath)
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as fobj:
+            return json.loads(fobj.readline().decode("utf-8"))
+
+
+def test_serve_client_context(run_cli, tmp_path, monkeypatch):
+    # Commands run in the client's working directory, with the
+    # client's stdin, never the server's
+    sockpath = str(tmp_path / "bz.sock")
+    attachfile = tests.utils.tests_path("data/bz-attach-get1.txt")
+    attachcontent = open(attachfile).read()
+    datadir = os.path.dirname(attachfile)
+    monkeypatch.setattr(sys, "stdin", io.StringIO("server stdin"))
+    assert os.getcwd() != datadir
+
+    fakebz = tests.mockbackend.make_bz(
+        bug_attachment_create_args="data/mockargs/test_attach1.txt",
+        bug_attachment_create_return={'ids': [1557949]})
+    with _serve(fakebz, sockpath):
+        argv = ["attach", "123456", "--file=bz-attach-get1.txt",
+                "--type", "text/x-patch", "--private",
+                "--comment", "some comment to go with it"]
+        reply = _send(sockpath, {"argv": argv, "cwd": datadir})
+        assert reply["status"] == 0
+        assert "Created attachment 1557949 on bug 123456" in reply["stdout"]
+        assert os.getcwd() != datadir
+
+        reply = _send(sockpath, {"argv": ["attach", "123456"],
+                                 "cwd": datadir})
+        assert reply["status"] != 0
+        assert "--file must be specified" in reply["stderr"]
+
+    fakebz = tests.mockbackend.make_bz(
+        bug_attachment_create_args="data/mockargs/test_attach2.txt",
+        bug_attachment_create_return={'ids': [1557949]})
+    with _serve(fakebz, sockpath):
+        argv = ["attach", "123456", "--file=fake-file-name.txt",
+                "--description", "Some attachment description"]
+        reply = _send(sockpath, {"argv": argv, "stdin": attachcontent})
+        assert reply["status"] == 0
+
+        # The client forwards piped input for attach
+        cmd = "bugzilla --socket %s " % sockpath
+        cmd += " ".join(shlex.quote(a) for a in argv)
+        out = run_cli(cmd, None, stdin=attachcontent)
+        assert "Created attachment 1557949 on bug 123456" in out
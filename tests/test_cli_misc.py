@@ -10,6 +10,7 @@ Test miscellaneous CLI bits to get build out our code coverage
 """
 
 import base64
+import copy
 import datetime
 import json
 import xmlrpc.client
@@ -124,9 +125,7 @@ def test_json_xmlrpc(run_cli):
 
     fakebz = tests.mockbackend.make_bz(
         bug_search_args=None,
-        bug_search_return={"bugs": [{"id": bugid}]},
-        bug_get_args=None,
-        bug_get_return=data)
+        bug_search_return=copy.deepcopy(data))
     out = run_cli(cmd, fakebz)
     tests.utils.diff_compare(tests.utils.sanitize_json(out),
         "data/clioutput/test_json_xmlrpc.txt")
@@ -141,8 +140,57 @@ def test_json_xmlrpc(run_cli):
     data["bugs"][0]["foo"] = Exception("foo")
     fakebz = tests.mockbackend.make_bz(
         bug_search_args=None,
-        bug_search_return={"bugs": [{"id": bugid}]},
-        bug_get_args=None,
-        bug_get_return=data)
+        bug_search_return=copy.deepcopy(data))
     with pytest.raises(RuntimeError):
         run_cli(cmd, fakebz, expectfail=True)
+
+
+def test_cli_importtime():
+    # 'bugzilla --help' and 'import bugzilla' shouldn't import the
+    # slow network modules or any backend. Use -X importtime output to
+    # see which modules were actually imported
+    import subprocess
+    import sys
+
+    code = ("import bugzilla; bugzilla.Bugzilla; "
+            "from bugzilla import _cli; _cli.setup_parser()")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, check=True,
+        cwd=tests.utils.tests_path(".."))
+
+    imported = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        imported.append(line.rsplit("|", 1)[1].strip())
+    assert "bugzilla._cli" in imported
+
+    for modname in ["requests", "urllib3", "xmlrpc.client",
+                    "bugzilla._backendrest", "bugzilla._backendxmlrpc",
+                    "bugzilla._backendhybrid", "bugzilla._session"]:
+        assert modname not in imported
+
+
+def test_profile(run_cli, tmp_path):
+    # pylint: disable=protected-access
+    import pstats
+    from bugzilla import _profile
+
+    prefix = str(tmp_path / "prof")
+    fakebz = tests.mockbackend.make_bz(
+        bug_search_args=None,
+        bug_search_return={"bugs": [{"id": 1}, {"id": 2}]})
+    try:
+        out = run_cli("bugzilla --profile-output %s query --ids --bug_id 1,2" %
+                      prefix, fakebz)
+    finally:
+        summary = _profile.disable()
+    assert out.splitlines()[:2] == ["1", "2"]
+    assert summary["phases"]["construct"]["calls"] == 2
+    assert summary["phases"]["render"]["calls"] == 1
+
+    pstats.Stats(prefix + ".pstats")
+    with open(prefix + ".json") as fobj:
+        trace = json.load(fobj)
+    assert [e["name"] for e in trace["traceEvents"]] == ["render"]
+    assert trace["summary"]["requests"] == 0
@@ -92,3 +92,69 @@ def test_modify(run_cli):
         bug_update_return={})
     out = run_cli(cmd, fakebz)
     assert not out
+
+
+def test_modify_from_file(run_cli, tmp_path):
+    fakebz = tests.mockbackend.make_bz(
+        bug_update_args=None,
+        bug_update_return={})
+    calls = []
+    # pylint: disable=protected-access
+    origupdate = fakebz._backend.bug_update
+
+    def _bug_update(ids, update):
+        calls.append((sorted(ids), update))
+        if 666 in ids:
+            raise RuntimeError("fake failure")
+        return origupdate(ids, update)
+    fakebz._backend.bug_update = _bug_update
+
+    updatefile = tmp_path / "updates.jsonl"
+    updatefile.write_text(
+        '{"ids": [1, 2], "status": "POST"}\n'
+        '\n'
+        '{"ids": 3, "status": "POST"}\n'
+        '{"ids": [4], "keywords_add": ["Foo"], "comment": "hello"}\n')
+    journal = tmp_path / "journal"
+    cmd = "bugzilla modify --from-file %s --journal %s" % (updatefile,
+                                                          journal)
+    out = run_cli(cmd, fakebz)
+    assert not out
+    assert sorted(calls) == [
+        ([1, 2, 3], {"status": "POST"}),
+        ([4], {"keywords": {"add": ["Foo"]},
+               "comment": {"comment": "hello"}})]
+
+    # Completed updates are skipped, failures are reported
+    del calls[:]
+    with open(updatefile, "a") as fobj:
+        fobj.write('{"ids": [666], "status": "POST"}\n')
+    out = run_cli(cmd, fakebz, expectfail=True)
+    assert calls == [([666], {"status": "POST"})]
+    assert "Failed to update bugs 666: fake failure" in out
+
+    # Error cases
+    out = run_cli("bugzilla modify", fakebz, expectfail=True)
+    assert "requires bug IDs or --from-file" in out
+    out = run_cli(cmd + " 123", fakebz, expectfail=True)
+    assert "can't be combined" in out
+    out = run_cli("bugzilla modify 123 --status POST --journal %s" %
+                  journal, fakebz, expectfail=True)
+    assert "require --from-file" in out
+    out = run_cli("bugzilla modify 123 --status POST --max-rate 5",
+                  fakebz, expectfail=True)
+    assert "require --from-file" in out
+    updatefile.write_text('{"ids": [1], "badkey": 1}\n')
+    out = run_cli(cmd, fakebz, expectfail=True)
+    assert "Invalid --from-file line 1" in out
+
+
+def test_modify_skip_noop(run_cli):
+    fakebz = tests.mockbackend.make_bz(
+        bug_get_args=None,
+        bug_get_return={"bugs": [{"id": 123456, "status": "POST"}]},
+        bug_update_args=None,
+        bug_update_return={})
+    cmd = "bugzilla modify 123456 --status POST --skip-noop"
+    out = run_cli(cmd, fakebz)
+    assert out == "Bug 123456: skipped unchanged status\n"
@@ -70,9 +70,7 @@ def test_query(run_cli):
     cmd = "bugzilla query --raw --bug_id 1165434"
     fakebz = tests.mockbackend.make_bz(
         bug_search_args="data/mockargs/test_query2.txt",
-        bug_search_return={"bugs": [{"id": 1165434}]},
-        bug_get_args=None,
-        bug_get_return="data/mockreturn/test_getbug_rhel.txt")
+        bug_search_return="data/mockreturn/test_getbug_rhel.txt")
     out = run_cli(cmd, fakebz)
     # Dictionary ordering is random, so scrub it from our output
     out = re.sub(r"\{.*\}", r"'DICT SCRUBBED'", out, re.MULTILINE)
@@ -132,9 +130,7 @@ def test_query(run_cli):
     cmd = "bugzilla query --json --id 1165434"
     fakebz = tests.mockbackend.make_bz(
         bug_search_args="data/mockargs/test_query8.txt",
-        bug_search_return={"bugs": [{"id": 1165434}]},
-        bug_get_args=None,
-        bug_get_return="data/mockreturn/test_getbug_rhel.txt")
+        bug_search_return="data/mockreturn/test_getbug_rhel.txt")
     out = run_cli(cmd, fakebz)
     tests.utils.diff_compare(tests.utils.sanitize_json(out),
         "data/clioutput/test_query8.txt")
@@ -147,14 +143,45 @@ def test_query(run_cli):
            "--extrafield extrame1 --extrafield extrame2 ")
     fakebz = tests.mockbackend.make_bz(rhbz=True,
         bug_search_args="data/mockargs/test_query9.txt",
-        bug_search_return={"bugs": [{"id": 1165434}]},
-        bug_get_args="data/mockargs/test_getbug_query9.txt",
-        bug_get_return="data/mockreturn/test_getbug_rhel.txt")
+        bug_search_return="data/mockreturn/test_getbug_rhel.txt")
     out = run_cli(cmd, fakebz)
     tests.utils.diff_compare(tests.utils.sanitize_json(out),
         "data/clioutput/test_query9.txt")
     assert json.loads(out)
 
+    # Test --ndjson output, one bug per line
+    cmd = "bugzilla query --ndjson --id 1165434"
+    fakebz = tests.mockbackend.make_bz(
+        bug_search_args="data/mockargs/test_query8.txt",
+        bug_search_return="data/mockreturn/test_getbug_rhel.txt")
+    out = run_cli(cmd, fakebz)
+    lines = out.splitlines()
+    assert len(lines) == 1
+    jsonout = json.loads(run_cli("bugzilla query --json --id 1165434",
+        tests.mockbackend.make_bz(
+            bug_search_args="data/mockargs/test_query8.txt",
+            bug_search_return="data/mockreturn/test_getbug_rhel.txt")))
+    assert [json.loads(line) for line in lines] == jsonout["bugs"]
+
+    # Streamed --json output of an empty result matches json.dumps
+    fakebz = tests.mockbackend.make_bz(
+        bug_search_args="data/mockargs/test_query8.txt",
+        bug_search_return={"bugs": []})
+    out = run_cli("bugzilla query --json --id 1165434", fakebz)
+    assert out == json.dumps({"bugs": []}, indent=2) + "\n"
+
+    # Bugzilla before 4.0 can't return fields from searches, so the
+    # CLI searches for IDs and then fetches the bugs
+    cmd = "bugzilla query --json --id 1165434 --includefield foo"
+    fakebz = tests.mockbackend.make_bz(version="3.6.0",
+        bug_search_args="data/mockargs/test_query-bz3.txt",
+        bug_search_return={"bugs": [{"id": 1165434}]},
+        bug_get_args="data/mockargs/test_getbug_query-bz3.txt",
+        bug_get_return="data/mockreturn/test_getbug_rhel.txt")
+    out = run_cli(cmd, fakebz)
+    tests.utils.diff_compare(tests.utils.sanitize_json(out),
+        "data/clioutput/test_query8.txt")
+
 
     # Test every remaining option
     cmd = "bugzilla query "
@@ -178,3 +205,29 @@ def test_query(run_cli):
         rhbz=True)
     out = run_cli(cmd, fakebz)
     tests.utils.diff_compare(out, "data/clioutput/test_query10.txt")
+
+
+def test_query_cve_batch(run_cli):
+    # %{cve} fetches the aliases of all blockers in one batched call,
+    # even when many bugs share the same blockers
+    bugs = [
+        {"id": 1, "keywords": ["Security"], "blocks": [100, 101]},
+        {"id": 2, "keywords": ["Security"], "blocks": [101]},
+        {"id": 3, "keywords": [], "blocks": [102]},
+    ]
+    cmd = "bugzilla query --product foo --outputformat '%{id} %{cve}'"
+    fakebz = tests.mockbackend.make_bz(
+        bug_search_args=None,
+        bug_search_return={"bugs": bugs},
+        bug_get_args=([100, 101], [],
+            {"include_fields": ["alias", "id"], "permissive": 1}),
+        bug_get_return={"bugs": [
+            {"id": 100, "alias": ["CVE-2020-0001"]},
+            {"id": 101, "alias": ["CVE-2020-0002", "foo"]},
+        ]})
+    out = run_cli(cmd, fakebz)
+    assert out.splitlines() == [
+        "1 CVE-2020-0001,CVE-2020-0002",
+        "2 CVE-2020-0002",
+        "3 ",
+    ]
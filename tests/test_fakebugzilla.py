@@ -0,0 +1,131 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import io
+import os
+import time
+import xmlrpc.client
+
+import pytest
+import requests
+
+import bugzilla
+
+from tests.fakebugzilla import FakeBugzillaServer
+
+
+def _make_bz(server, api):
+    kwargs = {"use_creds": False}
+    url = server.rest_url
+    if api == "xmlrpc":
+        url = server.xmlrpc_url
+    if api == "hybrid":
+        url = server.xmlrpc_url
+        kwargs["force_hybrid"] = True
+    if api == "hybrid-rest":
+        kwargs["force_hybrid"] = True
+    return bugzilla.Bugzilla(url, **kwargs)
+
+
+@pytest.mark.parametrize("api", ["rest", "xmlrpc", "hybrid", "hybrid-rest"])
+def test_fakebugzilla_api(api, tmp_path):
+    with FakeBugzillaServer(num_bugs=30, max_results=5) as server:
+        bz = _make_bz(server, api)
+        assert bz.bz_ver_major == 5
+
+        bug = bz.getbug("fakebug3")
+        assert bug.id == 3
+        assert bug.summary.startswith("Fake bug 3 ")
+        bugs = bz.getbugs([1, 2, 999], include_fields=["id", "status"])
+        assert [b.id for b in bugs] == [1, 2]
+        with pytest.raises(Exception) as e:
+            bz.getbug(999)
+        assert "does not exist" in str(e.value)
+
+        # Search results are capped by max_results, like a real server
+        query = bz.build_query(product="Product1")
+        assert len(bz.query(query)) == 5
+        query["limit"] = 2
+        query["offset"] = 1
+        assert [b.id for b in bz.query(query)] == [4, 7]
+
+        bz.update_bugs([1, 2], bz.build_update(status="CLOSED",
+                                               comment="closing"))
+        bug = bz.getbug(2)
+        assert bug.status == "CLOSED"
+        assert bug.getcomments()[-1]["text"] == "closing"
+        assert bz.bugs_history_raw([2])["bugs"][0]["history"]
+        comments = bz.get_comments([1, 2])["bugs"]
+        assert sorted(comments) == ["1", "2"]
+
+        if api != "rest":
+            # No REST equivalent, hybrid uses XMLRPC
+            ret = bz.update_tags([1, 2], tags_add=["foo", "bar"])
+            assert ret["changes"]["2"]["tags"] == {
+                "added": ["foo", "bar"], "removed": []}
+            ret = bz.update_tags([1], tags_add="baz", tags_remove="foo")
+            assert ret["changes"] == {"1": {"tags": {
+                "added": ["baz"], "removed": ["foo"]}}}
+            assert bz.getbug(1).tags == ["bar", "baz"]
+
+        newbug = bz.createbug(bz.build_createbug(
+            product="Product2", component="component1",
+            summary="new bug", version="unspecified"))
+        assert newbug.id == 31
+        assert [p["name"] for p in bz.getproducts()] == [
+            "Product1", "Product2", "Product3"]
+
+        # Attachments go through the streaming upload and download paths
+        content = os.urandom(100000)
+        path = tmp_path / "upload.bin"
+        path.write_bytes(content)
+        attids = bz.attachfile([3, 4], str(path), "some file")
+        out = io.BytesIO()
+        assert bz.download_attachment(attids[1], out) == len(content)
+        assert out.getvalue() == content
+        assert bz.get_attachments([4], None)["bugs"]["4"][-1]["size"] == (
+            len(content))
+
+
+def test_fakebugzilla_faults():
+    with FakeBugzillaServer(num_bugs=5, attachment_size=50000) as server:
+        bz = _make_bz(server, "rest")
+
+        server.add_fault(429, count=2, match="/bug", retry_after=3)
+        for dummy in range(2):
+            with pytest.raises(requests.exceptions.HTTPError) as e:
+                bz.getbug(1)
+            assert e.value.response.status_code == 429
+            assert e.value.response.headers["Retry-After"] == "3"
+        assert bz.getbug(1).id == 1
+
+        bz = _make_bz(server, "xmlrpc")
+        server.add_fault(503, match="Bug.get")
+        with pytest.raises(requests.exceptions.HTTPError) as e:
+            bz.getbug(1)
+        fault = e.value.response.text
+        assert "<fault>" in fault and "Injected fault 503" in fault
+        assert bz.getbug(1).id == 1
+        assert [r["call"] for r in server.requests[-2:]] == [
+            "Bug.get", "Bug.get"]
+
+        # API level faults reach the caller as each protocol's error
+        server.add_fault(200, match="Bug.get")
+        with pytest.raises(xmlrpc.client.Fault) as e:
+            bz.getbug(1)
+        assert e.value.faultCode == 200
+        assert e.value.faultString == "Injected fault 200"
+        server.add_fault(200, match="/bug")
+        with pytest.raises(bugzilla.BugzillaError) as e:
+            _make_bz(server, "rest").getbug(1)
+        assert e.value.code == 200
+
+        # Latency and bandwidth caps
+        server.latency = 0.5
+        with pytest.raises(requests.exceptions.Timeout):
+            bz.getbug(1, timeout=0.1)
+        server.latency = 0
+        server.bandwidth = 200000
+        start = time.time()
+        bz.download_attachment(1, io.BytesIO())
+        assert time.time() - start >= 0.3
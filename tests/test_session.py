@@ -0,0 +1,186 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import concurrent.futures
+import gzip
+import io
+import json
+import time
+
+import pytest
+import requests
+import responses
+
+import bugzilla
+
+
+REST_URL = "https://example.com/rest/"
+
+
+def _open_bz(mock, **kwargs):
+    mock.add(responses.GET, REST_URL + "version",
+             json={"version": "5.0.6"})
+    return bugzilla.Bugzilla(REST_URL, use_creds=False, **kwargs)
+
+
+def test_response_compression():
+    bugs = {"bugs": [{"id": i, "summary": "some summary text"}
+                     for i in range(1, 500)]}
+    payload = json.dumps(bugs).encode("utf-8")
+    compressed = gzip.compress(payload)
+
+    with responses.RequestsMock() as mock:
+        bz = _open_bz(mock)
+        mock.add(responses.GET, REST_URL + "bug", body=compressed,
+                 headers={"Content-Encoding": "gzip"},
+                 content_type="application/json")
+        ret = bz.getbugs(list(range(1, 500)))
+        assert len(ret) == 499
+
+        # We send the requests default, which lists every decoder
+        # that is available
+        encoding = mock.calls[-1].request.headers["Accept-Encoding"]
+        assert "gzip" in encoding
+        assert encoding == requests.utils.default_headers()["Accept-Encoding"]
+        stats = bz.get_transfer_stats()
+        rec = stats["records"][-1]
+        assert rec["content_encoding"] == "gzip"
+        assert rec["received_bytes"] == len(payload)
+        assert rec["received_wire_bytes"] == len(compressed)
+        assert stats["requests"] == 2
+        assert "?" not in rec["url"]
+
+
+def test_request_compression():
+    data = b"some highly compressible log line\n" * 10000
+
+    with responses.RequestsMock() as mock:
+        bz = _open_bz(mock, compress_requests=True)
+        mock.add(responses.POST, REST_URL + "bug/123/attachment",
+                 json={"ids": [555]})
+        ret = bz.attachfile(123, io.BytesIO(data), "desc", file_name="f.log")
+        assert ret == 555
+
+        request = mock.calls[-1].request
+        assert request.headers["Content-Encoding"] == "gzip"
+        body = json.loads(gzip.decompress(request.body))
+        assert body["ids"] == [123]
+        rec = bz.get_transfer_stats()["records"][-1]
+        assert rec["sent_wire_bytes"] < rec["sent_bytes"]
+
+        # Server refuses compressed bodies, we retry uncompressed and
+        # don't try again
+        mock.replace(responses.POST, REST_URL + "bug/123/attachment",
+                     status=415)
+        mock.add(responses.POST, REST_URL + "bug/123/attachment",
+                 json={"ids": [556]})
+        ret = bz.attachfile(123, io.BytesIO(data), "desc", file_name="f.log")
+        assert ret == 556
+        assert "Content-Encoding" not in mock.calls[-1].request.headers
+
+        ret = bz.attachfile(123, io.BytesIO(data), "desc", file_name="f.log")
+        assert "Content-Encoding" not in mock.calls[-1].request.headers
+
+
+def test_connection_pool_threads():
+    with responses.RequestsMock() as mock:
+        bz = _open_bz(mock, pool_maxsize=16, connect_timeout=3)
+        adapter = bz.get_requests_session().get_adapter(REST_URL)
+        assert adapter.poolmanager.connection_pool_kw["maxsize"] == 16
+        assert adapter.poolmanager.connection_pool_kw["block"] is True
+
+        mock.add(responses.GET, REST_URL + "product/get",
+                 json={"products": [{"id": 1, "name": "foo",
+                                     "components": [{"name": "bar"}]}]})
+        mock.add(responses.GET, REST_URL + "field/bug",
+                 json={"fields": [{"name": "bug_status"}]})
+
+        # One shared instance across many threads
+        def _work(_idx):
+            bz.getcomponents("foo")
+            return bz.getbugfields()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=64) as ex:
+            results = list(ex.map(_work, range(64)))
+        assert all(r == ["bug_status"] for r in results)
+        # Only one thread should have filled each cache
+        urls = [c.request.url.split("?")[0] for c in mock.calls]
+        assert urls.count(REST_URL + "product/get") == 1
+        assert urls.count(REST_URL + "field/bug") == 1
+
+
+def test_keepalive_disabled():
+    with responses.RequestsMock() as mock:
+        bz = _open_bz(mock, keepalive=False)
+        assert mock.calls[-1].request.headers["Connection"] == "close"
+        assert bz.get_requests_session().headers["Connection"] == "close"
+
+
+def test_deadline():
+    with responses.RequestsMock() as mock:
+        bz = _open_bz(mock, timeout=60, max_url_length=100)
+        assert mock.calls[-1].request.req_kwargs["timeout"] == 60
+
+        def _slow_bug_cb(request):
+            time.sleep(.2)
+            return 200, {}, json.dumps({"bugs": []})
+        mock.add_callback(responses.GET, REST_URL + "bug",
+                          callback=_slow_bug_cb)
+
+        # Per request timeout is shortened to the remaining deadline
+        with bz.timeout(5):
+            bz.query({"product": "foo"})
+            assert mock.calls[-1].request.req_kwargs["timeout"] <= 5
+
+        # getbugs is split into many concurrent requests here. The
+        # deadline applies to all of them together
+        start = time.monotonic()
+        with pytest.raises(requests.exceptions.Timeout):
+            bz.getbugs(list(range(1000, 2000)), timeout=.3)
+        assert time.monotonic() - start < 2
+        ncalls = len(mock.calls)
+
+        # Nested scopes can't extend the deadline
+        with bz.timeout(.1):
+            time.sleep(.15)
+            with bz.timeout(100):
+                with pytest.raises(requests.exceptions.Timeout):
+                    bz.query({"product": "foo"})
+        assert len(mock.calls) == ncalls
+
+        # Outside the scope, no deadline applies
+        bz.query({"product": "foo"})
+
+        # Every method that contacts the server takes timeout=
+        mock.add(responses.PUT, REST_URL + "component/foo/bar",
+                 json={"components": []})
+        bz.editcomponent({"product": "foo", "component": "bar",
+                          "description": "baz"}, timeout=5)
+        assert mock.calls[-1].request.req_kwargs["timeout"] <= 5
+        ncalls = len(mock.calls)
+        with pytest.raises(requests.exceptions.Timeout):
+            bz.getcomponents("foo", timeout=0)
+        assert len(mock.calls) == ncalls
+
+
+def test_profile_env(monkeypatch, capsys):
+    # pylint: disable=protected-access
+    from bugzilla import _profile
+    from tests.fakebugzilla import FakeBugzillaServer
+
+    monkeypatch.setenv("PYTHONBUGZILLA_PROFILE", "1")
+    with FakeBugzillaServer(num_bugs=20) as server:
+        try:
+            bz = bugzilla.Bugzilla(server.xmlrpc_url, use_creds=False)
+            assert len(bz.query(bz.build_query(product="Product1"))) == 7
+        finally:
+            summary = _profile.disable()
+
+    assert _profile.active is None
+    assert _profile.disable() is None
+    phases = summary["phases"]
+    assert list(phases) == ["request", "decode", "connect", "construct"]
+    assert phases["construct"]["calls"] == 7
+    assert phases["request"]["calls"] == summary["requests"] == 2
+    assert summary["received_bytes"] > 0
+    assert "7 " in capsys.readouterr().err.splitlines()[5]